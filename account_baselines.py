@@ -0,0 +1,399 @@
+import os
+import json
+import math
+import threading
+import numpy as np
+
+from video_metrics import RATIO_DEFINITIONS, compute_metrics, view_column
+from utils import file_lock, write_json_atomic
+
+# File holding the per-account sketches between runs
+DEFAULT_BASELINES_PATH = os.getenv("ACCOUNT_BASELINES_PATH", "account_baselines.json")
+
+# Relative error of the quantile sketches and their bucket budget per metric
+SKETCH_RELATIVE_ACCURACY = float(os.getenv("BASELINE_SKETCH_ACCURACY", "0.01"))
+SKETCH_MAX_BUCKETS = int(os.getenv("BASELINE_SKETCH_MAX_BUCKETS", "2048"))
+
+# Accounts with fewer videos than this get no percentile ranks; small samples mislead
+BASELINE_MIN_VIDEOS = int(os.getenv("BASELINE_MIN_VIDEOS", "10"))
+
+# Metrics tracked per account; 'Views' stands for the view count column
+BASELINE_METRICS = ['Views'] + list(RATIO_DEFINITIONS)
+
+# Column (and video data key) holding the account percentile rank of each metric
+PERCENTILE_COLUMNS = {metric: f"{metric} (Account Percentile)" for metric in BASELINE_METRICS}
+
+# Bumped when the stored structure changes so old files are rebuilt
+BASELINES_VERSION = 1
+
+
+class QuantileSketch:
+    """
+    Streaming quantile sketch with log-spaced buckets (DDSketch-style)
+
+    Quantiles are accurate to within relative_accuracy of the true value, and
+    memory is bounded by max_buckets whatever the number of values added; past
+    the budget the lowest buckets are merged. Values at or below 0 are counted
+    separately.
+    """
+
+    def __init__(self, relative_accuracy=SKETCH_RELATIVE_ACCURACY, max_buckets=SKETCH_MAX_BUCKETS):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, values):
+        """Add an array of values; NaN and infinite values are skipped"""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[np.isfinite(values)]
+        if not values.size:
+            return
+        self.count += int(values.size)
+        self.sum += float(values.sum())
+        self.min = float(values.min()) if self.min is None else min(self.min, float(values.min()))
+        self.max = float(values.max()) if self.max is None else max(self.max, float(values.max()))
+
+        positive = values[values > 0]
+        self.zero_count += int(values.size - positive.size)
+        indices, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+        for index, count in zip(indices.tolist(), counts.tolist()):
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self._collapse()
+
+    def _collapse(self):
+        """Merge the lowest buckets until the bucket budget is met"""
+        if len(self.buckets) <= self.max_buckets:
+            return
+        keys = sorted(self.buckets)
+        excess = len(keys) - self.max_buckets
+        target = keys[excess]
+        self.buckets[target] += sum(self.buckets.pop(key) for key in keys[:excess])
+
+    def _bucket_value(self, index):
+        """Representative value of a bucket, within the relative accuracy of all its members"""
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def quantile(self, q):
+        """Estimate the q-quantile (0 <= q <= 1), or None if the sketch is empty"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return min(0.0, self.max)
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return min(self._bucket_value(index), self.max)
+        return self.max
+
+    def percentile_rank(self, values):
+        """
+        Percentage of the sketched values below each value, counting ties as half
+
+        Args:
+            values (array-like): Values to rank
+
+        Returns:
+            numpy.ndarray: Ranks from 0 to 100 (NaN for NaN input or an empty sketch)
+        """
+        values = np.asarray(values, dtype=float)
+        if not self.count:
+            return np.full(values.shape, np.nan)
+
+        keys = np.array(sorted(self.buckets), dtype=np.int64)
+        counts = np.array([self.buckets[key] for key in keys.tolist()], dtype=float)
+        cumulative = np.concatenate(([0.0], np.cumsum(counts)))
+
+        positive = values > 0
+        indices = np.zeros(values.shape, dtype=np.int64)
+        indices[positive] = np.ceil(np.log(values[positive]) / self._log_gamma).astype(np.int64)
+        position = np.searchsorted(keys, indices, side='left')
+        below = self.zero_count + cumulative[position]
+        matched = position < len(keys)
+        matched[matched] = keys[position[matched]] == indices[matched]
+        same = np.where(matched, counts[np.minimum(position, len(keys) - 1)] if len(keys) else 0.0, 0.0)
+
+        # Values at or below 0 tie with the zero bucket and have nothing below them
+        below = np.where(positive, below, 0.0)
+        same = np.where(positive, same, self.zero_count)
+        ranks = (below + same / 2.0) / self.count * 100.0
+        return np.where(np.isnan(values), np.nan, np.clip(ranks, 0.0, 100.0))
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_buckets': self.max_buckets,
+            'buckets': {str(index): count for index, count in self.buckets.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relative_accuracy'], data['max_buckets'])
+        sketch.buckets = {int(index): count for index, count in data['buckets'].items()}
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        sketch.sum = data['sum']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        return sketch
+
+
+class AccountBaselines:
+    """
+    Per-account running distributions of views and engagement ratios
+
+    Each worksheet (source) is assumed to grow by appending rows, so an update
+    only adds the rows past the last counted one. If a source shrinks, its
+    account is rebuilt from the rows given. Edits to rows that were already
+    counted are not reflected until rebuild().
+
+    The file may be shared by several processes: it is reloaded whenever
+    another process has rewritten it, and updates re-read, apply and write it
+    under a file lock so concurrent updates are merged instead of overwritten.
+    """
+
+    def __init__(self, path=None, min_videos=BASELINE_MIN_VIDEOS):
+        """
+        Args:
+            path (str, optional): JSON file for the sketches; defaults to ACCOUNT_BASELINES_PATH
+            min_videos (int): Videos an account needs before its percentile ranks are used
+        """
+        self.path = path or DEFAULT_BASELINES_PATH
+        self.min_videos = min_videos
+        self.accounts = {}
+        self.sources = {}
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._loaded_mtime = None
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _ensure_loaded(self):
+        """Load the sketches, again whenever the file changed since the last load or save"""
+        mtime = self._file_mtime()
+        if self._loaded and mtime == self._loaded_mtime:
+            return
+        self._loaded = True
+        self._loaded_mtime = mtime
+        self.accounts, self.sources = {}, {}
+        if mtime is None:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') != BASELINES_VERSION:
+                return
+            self.accounts = {
+                account: {metric: QuantileSketch.from_dict(sketch) for metric, sketch in metrics.items()}
+                for account, metrics in data.get('accounts', {}).items()
+            }
+            self.sources = data.get('sources', {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading account baselines, starting empty: {str(e)}")
+            self.accounts, self.sources = {}, {}
+
+    def save(self):
+        """Persist the sketches atomically"""
+        with self._lock, file_lock(self.path):
+            self._write()
+
+    def _write(self):
+        """Write the sketches; the caller holds the file lock"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        write_json_atomic(self.path, {
+            'version': BASELINES_VERSION,
+            'accounts': {
+                account: {metric: sketch.to_dict() for metric, sketch in metrics.items()}
+                for account, metrics in self.accounts.items()
+            },
+            'sources': self.sources
+        })
+        self._loaded_mtime = self._file_mtime()
+
+    def _add_rows(self, account, df):
+        """Add the metrics of already-typed rows to an account's sketches"""
+        metrics = compute_metrics(df)
+        sketches = self.accounts.setdefault(account, {metric: QuantileSketch() for metric in BASELINE_METRICS})
+        views = view_column(metrics.columns)
+        for metric in BASELINE_METRICS:
+            column = views if metric == 'Views' else metric
+            if column in metrics.columns:
+                sketches[metric].add(metrics[column].to_numpy(dtype=float))
+
+    def _groups(self, df, account=None, source=None):
+        """Split df into (account, source key, rows, row numbers) groups"""
+        if 'Account' in df.columns:
+            keys = ['Account'] + [c for c in ('Source Sheet', 'Source Worksheet') if c in df.columns]
+            for key, rows in df.groupby(keys, sort=False):
+                key = key if isinstance(key, tuple) else (key,)
+                row_numbers = rows['Source Row'].to_numpy() if 'Source Row' in rows.columns else np.arange(len(rows))
+                yield key[0], "\n".join(str(part) for part in key), rows, row_numbers
+        else:
+            if account is None:
+                raise ValueError("An account is required for frames without an 'Account' column")
+            source_key = source or account
+            yield account, f"{account}\n{source_key}", df, df.index.to_numpy()
+
+    def update(self, df, account=None, source=None, save=True):
+        """
+        Add the rows of a sheet frame that have not been counted yet
+
+        Args:
+            df (pandas.DataFrame): Full worksheet frame indexed by data row, or a
+                SheetsAPI.load_worksheets() frame with Account and source columns
+            account (str, optional): Account of a single-worksheet frame
+            source (str, optional): Identifies the worksheet, e.g. its sheet URL and name;
+                defaults to the account
+            save (bool): Persist the sketches when anything changed
+
+        Returns:
+            int: Number of rows added
+        """
+        with self._lock, file_lock(self.path):
+            # Start from what other processes have saved so their rows are neither lost nor recounted
+            self._ensure_loaded()
+            return self._update(df, account, source, save)
+
+    def _update(self, df, account, source, save):
+        """update() body; the caller holds both locks"""
+        added = 0
+        for group_account, source_key, rows, row_numbers in self._groups(df, account, source):
+            seen = self.sources.get(source_key, {}).get('rows', 0)
+            total = int(row_numbers.max()) + 1 if len(row_numbers) else 0
+            if total < seen:
+                # Rows were deleted; counts can't be subtracted from a sketch
+                self._reset_account(group_account)
+                seen = 0
+            new_rows = rows[row_numbers >= seen]
+            if not new_rows.empty:
+                self._add_rows(group_account, new_rows)
+                added += len(new_rows)
+            self.sources[source_key] = {'account': group_account, 'rows': max(seen, total)}
+        if added and save:
+            self._write()
+        return added
+
+    def _reset_account(self, account):
+        self.accounts.pop(account, None)
+        for source in self.sources.values():
+            if source['account'] == account:
+                source['rows'] = 0
+
+    def rebuild(self, df, account=None, source=None):
+        """Recount the accounts in df from scratch, e.g. after rows were edited"""
+        with self._lock, file_lock(self.path):
+            self._ensure_loaded()
+            for group_account, _, _, _ in list(self._groups(df, account, source)):
+                self._reset_account(group_account)
+            return self._update(df, account, source, save=True)
+
+    def _sketches(self, account):
+        sketches = self.accounts.get(account)
+        if not sketches or sketches['Views'].count < self.min_videos:
+            return None
+        return sketches
+
+    def rank_frame(self, df, account=None):
+        """
+        Add the account percentile rank of every baseline metric to a computed-metrics frame
+
+        Args:
+            df (pandas.DataFrame): Rows from video_metrics.compute_metrics
+            account (str, optional): Account of all rows; otherwise the 'Account' column is used
+
+        Returns:
+            pandas.DataFrame: Shallow copy of df with PERCENTILE_COLUMNS (whole-number ranks);
+                rows of accounts without enough history are left without ranks
+        """
+        with self._lock:
+            self._ensure_loaded()
+            result = df.copy(deep=False)
+            accounts = df['Account'].to_numpy() if account is None and 'Account' in df.columns \
+                else np.full(len(df), account, dtype=object)
+            views = view_column(df.columns)
+            ranks = {metric: np.full(len(df), np.nan) for metric in BASELINE_METRICS}
+            for name in dict.fromkeys(accounts.tolist()):
+                sketches = self._sketches(name)
+                if sketches is None:
+                    continue
+                mask = accounts == name
+                for metric in BASELINE_METRICS:
+                    column = views if metric == 'Views' else metric
+                    if column in df.columns:
+                        ranks[metric][mask] = np.round(
+                            sketches[metric].percentile_rank(df[column].to_numpy(dtype=float)[mask])
+                        )
+            for metric, values in ranks.items():
+                if not np.isnan(values).all():
+                    result[PERCENTILE_COLUMNS[metric]] = values
+            return result
+
+    def rank_video(self, video_data, account):
+        """
+        rank_frame() for a single video dict from video_metrics.compute_video_metrics
+
+        Returns:
+            dict: A copy of video_data with PERCENTILE_COLUMNS keys when the account has enough history
+        """
+        with self._lock:
+            self._ensure_loaded()
+            result = dict(video_data)
+            sketches = self._sketches(account)
+            if sketches is None:
+                return result
+            views = view_column(video_data)
+            for metric in BASELINE_METRICS:
+                value = video_data.get(views if metric == 'Views' else metric)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    result[PERCENTILE_COLUMNS[metric]] = int(round(float(sketches[metric].percentile_rank([value])[0])))
+            return result
+
+    def summary(self, account):
+        """
+        Baseline statistics of an account, for display
+
+        Returns:
+            dict: Metric to {'videos', 'mean', 'p25', 'median', 'p75', 'p90'}; empty for unknown accounts
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                metric: {
+                    'videos': sketch.count,
+                    'mean': sketch.mean,
+                    'p25': sketch.quantile(0.25),
+                    'median': sketch.quantile(0.5),
+                    'p75': sketch.quantile(0.75),
+                    'p90': sketch.quantile(0.9)
+                }
+                for metric, sketch in self.accounts.get(account, {}).items()
+            }
+
+
+# Process-wide baselines shared by every analyzer and Streamlit session
+account_baselines = AccountBaselines()
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from utils import write_json_atomic
+
+# Default cache location and limits (overridable through environment variables)
+DEFAULT_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR", "analysis_cache")
+DEFAULT_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
+DEFAULT_MAX_AGE_SECONDS = int(os.getenv("ANALYSIS_CACHE_MAX_AGE_SECONDS", str(30 * 24 * 3600)))
+
+
+def make_cache_key(request):
+    """
+    Build a content-addressed key for an LLM request
+
+    Args:
+        request (dict): Request parameters (model, messages, sampling parameters)
+
+    Returns:
+        str: Hex SHA-256 digest of the canonical request
+    """
+    canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Disk-backed cache of generated analysis reports
+
+    The directory is the source of truth: several processes (the app and the
+    background workers) can share it, so entries written by another process
+    are served, and max_entries is enforced on the directory as a whole.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_age_seconds=DEFAULT_MAX_AGE_SECONDS, enabled=True):
+        """
+        Initialize the cache
+
+        Args:
+            cache_dir (str): Directory holding one JSON file per cached report
+            max_entries (int): Maximum number of reports kept on disk
+            max_age_seconds (int): Reports older than this are treated as misses
+            enabled (bool): Set to False to bypass the cache entirely
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.enabled = enabled and os.getenv("ANALYSIS_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = None
+
+    def _path(self, key):
+        """Get the file path for a cache key"""
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _entry_files(self):
+        """Names of the entry files currently on disk"""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [filename for filename in os.listdir(self.cache_dir) if filename.endswith(".json")]
+
+    def _load_index(self, refresh=False):
+        """Build the in-memory index of cached keys and their last access times"""
+        if self._index is not None and not refresh:
+            return
+        self._index = {}
+        for filename in self._entry_files():
+            try:
+                self._index[filename[:-5]] = os.path.getmtime(os.path.join(self.cache_dir, filename))
+            except OSError:
+                # Removed by another process in the meantime
+                pass
+
+    def get(self, key):
+        """
+        Look up a cached report
+
+        Args:
+            key (str): Cache key from make_cache_key
+
+        Returns:
+            str: The cached report, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._load_index()
+            # Go to disk even for keys missing from the index: another process may have written them
+            try:
+                with open(self._path(key), 'r') as f:
+                    entry = json.load(f)
+            except FileNotFoundError:
+                self._index.pop(key, None)
+                self.misses += 1
+                return None
+            except Exception as e:
+                print(f"Error reading analysis cache entry: {str(e)}")
+                self._index.pop(key, None)
+                self.misses += 1
+                return None
+
+            if self.max_age_seconds and time.time() - entry.get('created_at', 0) > self.max_age_seconds:
+                self._remove(key)
+                self.evictions += 1
+                self.misses += 1
+                return None
+
+            # Touch the file so least-recently-used eviction sees the access
+            now = time.time()
+            self._index[key] = now
+            try:
+                os.utime(self._path(key), (now, now))
+            except OSError:
+                pass
+            self.hits += 1
+            return entry.get('report')
+
+    def set(self, key, report, metadata=None):
+        """
+        Store a report in the cache
+
+        Args:
+            key (str): Cache key from make_cache_key
+            report (str): Generated report text
+            metadata (dict, optional): Extra information stored alongside the report
+        """
+        if not self.enabled or not report:
+            return
+        with self._lock:
+            self._load_index()
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                entry = {
+                    'key': key,
+                    'created_at': time.time(),
+                    'report': report,
+                    'metadata': metadata or {}
+                }
+                # Write atomically so a crash never leaves a truncated entry
+                write_json_atomic(self._path(key), entry)
+                self._index[key] = entry['created_at']
+                self._evict()
+            except Exception as e:
+                print(f"Error writing analysis cache entry: {str(e)}")
+
+    def _remove(self, key):
+        """Delete a cache entry from disk and the index"""
+        self._index.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Drop the least recently used entries beyond max_entries, counting every process's entries"""
+        if not self.max_entries or len(self._entry_files()) <= self.max_entries:
+            return
+        self._load_index(refresh=True)
+        overflow = len(self._index) - self.max_entries
+        for key, _ in sorted(self._index.items(), key=lambda item: item[1])[:overflow]:
+            self._remove(key)
+            self.evictions += 1
+
+    def clear(self):
+        """Remove every cached report"""
+        with self._lock:
+            self._load_index(refresh=True)
+            for key in list(self._index):
+                self._remove(key)
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            self._load_index(refresh=True)
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._index),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -1,20 +1,42 @@
-import pandas as pd
-from sheets_api import SheetsAPI
-from openai_api import OpenAIAPI
+import os
+import uuid
+from openai_api import DEFAULT_VIDEOS_PER_REQUEST, StreamFailure
+from batch_runner import BatchRunner, format_batch_stats
+from batch_jobs import BatchJob
+from triage import triage_dataframe, select_rows_for_llm
+from llm_metrics import call_context
+from sheet_sync import SheetSync
+from sheet_schema import SHEET_SCHEMA
+from video_metrics import compute_metrics, compute_video_metrics
+from account_baselines import account_baselines, PERCENTILE_COLUMNS
+from run_journal import RunJournal, SheetCheckpointWriter, video_fingerprint
+
+# Default number of concurrent OpenAI requests for batch analysis
+DEFAULT_MAX_WORKERS = int(os.getenv("ANALYSIS_MAX_WORKERS", "4"))
 
 class TikTokAnalyzer:
-    def __init__(self, sheets_api, openai_api):
+    def __init__(self, sheets_api, openai_api, baselines=None):
         """
         Initialize the TikTok video analyzer
         
         Args:
             sheets_api (SheetsAPI): Google Sheets API instance
             openai_api (OpenAIAPI): OpenAI API instance
+            baselines (AccountBaselines, optional): Per-account metric distributions used to
+                rank videos; defaults to the process-wide baselines
         """
         self.sheets_api = sheets_api
         self.openai_api = openai_api
+        self.baselines = baselines if baselines is not None else account_baselines
+        self.last_batch_stats = None
+        self.last_triage = None
+        self.last_sync = None
+        self.last_run_id = None
         
-    def analyze_videos(self, sheet_url, worksheet_name="Account A Data", analysis_col_index=None, selected_indices=None):
+    def analyze_videos(self, sheet_url, worksheet_name="Account A Data", analysis_col_index=None, selected_indices=None,
+                       max_workers=None, max_in_flight=None, progress_callback=None, use_cache=True,
+                       videos_per_request=None, triage_policy=None, previous_scores=None, sync=False,
+                       run_id=None, checkpoint=True, write_every=None):
         """
         Analyze videos in a Google Sheet
         
@@ -23,115 +45,376 @@ class TikTokAnalyzer:
             worksheet_name (str): Name of the worksheet to analyze
             analysis_col_index (int, optional): Index of the column to store analysis reports
             selected_indices (list, optional): List of row indices to analyze (0-based, excluding header)
+            max_workers (int, optional): Number of concurrent analysis requests (1 runs serially)
+            max_in_flight (int, optional): Maximum number of queued or running requests
+            progress_callback (callable, optional): Called as (completed, total) after each row
+            use_cache (bool): Reuse cached reports for rows whose prompt has not changed
+            videos_per_request (int, optional): Number of videos packed into one API request
+            triage_policy (str, optional): Rule-based pre-triage policy deciding which rows are
+                sent to the LLM ('all', 'flagged', 'changed' or 'changed_or_flagged')
+            previous_scores (dict, optional): Triage scores by row index from an earlier run,
+                used by the 'changed' policies; defaults to the scores stored by the last run
+            sync (bool): Only analyze rows that are new or changed since the last synced run
+            run_id (str, optional): Resume this journaled run; rows it completed whose data is
+                unchanged are not analyzed again
+            checkpoint (bool): Journal every finished row so the run can be resumed; the run id
+                is kept in last_run_id
+            write_every (int, optional): Write reports back to the sheet every this many rows;
+                defaults to CHECKPOINT_WRITE_EVERY
             
         Returns:
-            tuple: (success (bool), message (str), reports (list))
+            tuple: (success (bool), message (str), reports (list)); reports cover the analyzed rows only
         """
         try:
-            # Open the Google Sheet
-            sheet = self.sheets_api.open_sheet_by_url(sheet_url)
-            if not sheet:
-                return False, "Failed to open Google Sheet", []
-                
-            # Get the worksheet by name
-            worksheet = self.sheets_api.get_worksheet_by_name(sheet, worksheet_name)
-            if not worksheet:
-                return False, "Failed to open worksheet", []
-                
-            # Get the video data as a DataFrame
-            df = self.sheets_api.get_data_as_dataframe(worksheet)
-            if df.empty:
-                return False, "No data found in worksheet", []
-                
-            # Check if required columns exist (using your sheet's column names)
-            required_columns = ['Title/Hook', 'Caption', 'Views (24h)', 'Likes', 'Comments', 'Saves']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                return False, f"Missing required columns: {', '.join(missing_columns)}", []
-                
-            # Process data (convert data types, handle null values, etc.)
-            processed_df = self._preprocess_data(df)
+            journal = None
+            if run_id:
+                journal = RunJournal.load(run_id)
+                if journal is None:
+                    return False, f"Run {run_id} not found", []
+                if (journal.run['sheet_url'], journal.run['worksheet_name']) != (sheet_url, worksheet_name):
+                    return False, f"Run {run_id} belongs to another worksheet", []
             
-            # Calculate ratios if they don't exist
-            processed_df = self._calculate_missing_ratios(processed_df)
-                
-            # Generate analysis reports for selected videos or all videos
-            reports = []
-            
-            # Filter rows if specific indices are provided
-            if selected_indices is not None and len(selected_indices) > 0:
-                # Ensure indices are within range
-                valid_indices = [i for i in selected_indices if 0 <= i < len(processed_df)]
-                if not valid_indices:
-                    return False, "No valid row indices provided", []
-                
-                rows_to_analyze = processed_df.iloc[valid_indices]
-            else:
-                rows_to_analyze = processed_df
-                
-            for _, row in rows_to_analyze.iterrows():
-                # Prepare data for analysis
-                video_data = self._prepare_video_data(row)
-                
-                # Generate analysis for this video
-                report = self.openai_api.generate_analysis(video_data)
-                reports.append(report)
-                
-            # Update the analysis column in the worksheet if specified
+            # Load and prepare the rows to analyze; the sync state also holds the triage
+            # scores of the last analysis, which the 'changed' policies compare against
+            sheet_state = SheetSync(sheet_url, worksheet_name)
+            sheet_sync = sheet_state if sync else None
+            if previous_scores is None:
+                previous_scores = sheet_state.triage_scores()
+            worksheet, videos, error = self._load_videos(
+                sheet_url, worksheet_name, selected_indices,
+                triage_policy=triage_policy, previous_scores=previous_scores, sheet_sync=sheet_sync
+            )
+            if error:
+                return False, error, []
+            if not videos:
+                if sheet_sync is not None and not self.last_sync['changed']:
+                    return True, "No new or changed rows since the last sync", []
+                return True, "No videos needed analysis after triage", []
+            
+            if journal is None and checkpoint:
+                journal = RunJournal.create(sheet_url, worksheet_name, analysis_col_index)
+            self.last_run_id = journal.run_id if journal is not None else None
+            
+            # Reuse the reports a resumed run already completed for unchanged rows
+            fingerprints = {row_index: video_fingerprint(video_data) for row_index, video_data in videos}
+            done = {}
+            if run_id:
+                for row_index, _ in videos:
+                    report = journal.completed_report(row_index, fingerprints[row_index])
+                    if report is not None:
+                        done[row_index] = report
+                print(f"Resuming run {run_id}: {len(done)} of {len(videos)} rows already analyzed")
+            remaining = [(row_index, video_data) for row_index, video_data in videos if row_index not in done]
+            
+            # Write reports back in small batches as they finish, starting with any a resumed run
+            # completed but never wrote
+            writer = None
             if analysis_col_index is not None:
-                if selected_indices is not None:
-                    # Only update specific rows
-                    for i, idx in enumerate(selected_indices):
-                        if i < len(reports):
-                            # +2 because: +1 for 1-indexed spreadsheet, +1 for header row
-                            self.sheets_api.update_cell(
-                                worksheet, 
-                                idx + 2, 
-                                analysis_col_index + 1,  # +1 because spreadsheet columns are 1-indexed
-                                reports[i]
-                            )
-                else:
-                    # Update all rows
-                    success = self.sheets_api.update_analysis_column(
-                        worksheet, reports, analysis_col_index
-                    )
-                    if not success:
-                        return True, "Analysis complete but failed to update sheet", reports
+                writer = SheetCheckpointWriter(self.sheets_api, worksheet, analysis_col_index, journal, write_every)
+                unwritten = journal.unwritten_reports() if run_id else {}
+                for row_index in done:
+                    if row_index in unwritten:
+                        writer.add(row_index, unwritten[row_index])
+            
+            def _checkpoint(row_index, report):
+                failed = report.startswith("Error generating analysis")
+                if journal is not None:
+                    journal.record(row_index, fingerprints[row_index], None if failed else report,
+                                   error=report if failed else None)
+                if writer is not None:
+                    writer.add(row_index, report)
+            
+            # Label every LLM call in this run with its sheet and batch for the metrics
+            batch_id = uuid.uuid4().hex[:8]
+            with call_context(sheet=worksheet_name, batch=batch_id):
+                new_reports = self._generate_reports(
+                    remaining,
+                    max_workers=max_workers,
+                    max_in_flight=max_in_flight,
+                    progress_callback=progress_callback,
+                    use_cache=use_cache,
+                    videos_per_request=videos_per_request,
+                    result_callback=_checkpoint
+                )
+            self.last_batch_stats['batch_id'] = batch_id
+            self.last_batch_stats['run_id'] = self.last_run_id
+            self.last_batch_stats['resumed_rows'] = len(done)
+            done.update((row_index, report) for (row_index, _), report in zip(remaining, new_reports))
+            reports = [done[row_index] for row_index, _ in videos]
+                
+            # Write whatever is still buffered
+            if writer is not None and not writer.flush():
+                return True, "Analysis complete but failed to update sheet", reports
+            
+            # Remember the rows that now have a report, and their scores, so the next
+            # sync and the 'changed' triage policies skip them
+            analyzed = [row_index for (row_index, _), report in zip(videos, reports)
+                        if not report.startswith("Error generating analysis")]
+            self._remember_triage_scores(sheet_state, analyzed)
+            if sheet_sync is not None:
+                sheet_sync.mark_synced(analyzed, total_rows=self.last_sync['sheet_rows'])
                     
+            if self.last_batch_stats['failed_rows']:
+                return True, f"Analyzed {len(reports)} videos ({self.last_batch_stats['failed_rows']} failed)", reports
             return True, f"Successfully analyzed {len(reports)} videos", reports
         except Exception as e:
             return False, f"Error analyzing videos: {str(e)}", []
     
-    def _preprocess_data(self, df):
-        """Preprocess the data from the sheet"""
-        # Make a copy to avoid modifying the original
-        processed_df = df.copy()
+    def create_batch_job(self, sheet_url, worksheet_name="Account A Data", analysis_col_index=None,
+                         selected_indices=None, backend=None, triage_policy=None, previous_scores=None):
+        """
+        Create an offline batch job for the rows of a worksheet
+        
+        Args:
+            sheet_url (str): URL of the Google Sheet
+            worksheet_name (str): Name of the worksheet to analyze
+            analysis_col_index (int, optional): Index of the column to store analysis reports
+            selected_indices (list, optional): List of row indices to analyze (0-based, excluding header)
+            backend (BatchBackend, optional): Backend to submit the job to right away
+            triage_policy (str, optional): Pre-triage policy deciding which rows go into the job
+            previous_scores (dict, optional): Triage scores from an earlier run; defaults to
+                the scores stored by the last run
+            
+        Returns:
+            tuple: (success (bool), message (str), job (BatchJob or None))
+        """
+        try:
+            sheet_state = SheetSync(sheet_url, worksheet_name)
+            if previous_scores is None:
+                previous_scores = sheet_state.triage_scores()
+            worksheet, videos, error = self._load_videos(
+                sheet_url, worksheet_name, selected_indices,
+                triage_policy=triage_policy, previous_scores=previous_scores
+            )
+            if error:
+                return False, error, None
+            if not videos:
+                return False, "No videos needed analysis after triage", None
+            
+            # Scores are kept with the job and only recorded once a row's report is merged
+            scores = self.last_triage['Triage Score']
+            job = BatchJob.create(
+                self.openai_api,
+                videos,
+                sheet_url=sheet_url,
+                worksheet_name=worksheet_name,
+                analysis_col_index=analysis_col_index,
+                triage_scores={row_index: scores[row_index] for row_index, _ in videos if row_index in scores.index}
+            )
+            if backend is not None:
+                job.submit(backend)
+                return True, f"Submitted batch job {job.job_id} with {len(videos)} videos", job
+            return True, f"Created batch job {job.job_id} with {len(videos)} videos", job
+        except Exception as e:
+            return False, f"Error creating batch job: {str(e)}", None
+    
+    def collect_batch_job(self, job, backend, report_store=None):
+        """
+        Poll a batch job and merge any finished reports into the sheet and report store
         
-        # Ensure metric columns are numeric
-        numeric_columns = ['Views (24h)', 'Likes', 'Comments', 'Saves']
+        Args:
+            job (BatchJob): The job to check
+            backend (BatchBackend): Backend the job was submitted to
+            report_store (callable, optional): Report store passed to BatchJob.merge
+            
+        Returns:
+            tuple: (success (bool), message (str) with the request counts, summary (dict) of
+                request counts by status from the poll)
+        """
+        try:
+            summary = job.poll(backend, cache=self.openai_api.cache)
+            unmerged = [item for item in job.state['items'].values()
+                        if item['status'] == 'completed' and not item.get('merged')]
+            success, message = job.merge(self.sheets_api, report_store=report_store)
+            # Only rows whose reports were merged now count as analyzed for the next triage
+            self._remember_batch_scores(job, [item for item in unmerged if item.get('merged')])
+            # Merging leaves the request counts alone but can move the job to merged
+            summary['status'] = job.state.get('status')
+            message = (f"{message} ({summary['completed']} of {summary['total']} requests completed, "
+                       f"{summary['failed']} failed, {summary['outstanding']} outstanding)")
+            return success, message, summary
+        except Exception as e:
+            return False, f"Error collecting batch job: {str(e)}", job.summary()
+    
+    def _remember_triage_scores(self, sheet_state, row_indices):
+        """Store the triage scores of the given rows from the last triage for the next run"""
+        if self.last_triage is None or not row_indices:
+            return
+        try:
+            scores = self.last_triage['Triage Score']
+            sheet_state.record_scores(scores.loc[scores.index.intersection(row_indices)])
+        except Exception as e:
+            print(f"Error saving triage scores: {str(e)}")
+    
+    def _remember_batch_scores(self, job, items):
+        """Store the triage scores a batch job recorded for the given items"""
+        scores = {item['row_index']: item['triage_score'] for item in items if item.get('triage_score') is not None}
+        if not scores or not job.state.get('sheet_url'):
+            return
+        try:
+            SheetSync(job.state['sheet_url'], job.state['worksheet_name']).record_scores(scores)
+        except Exception as e:
+            print(f"Error saving triage scores: {str(e)}")
+    
+    def _load_videos(self, sheet_url, worksheet_name, selected_indices=None, triage_policy=None, previous_scores=None,
+                     sheet_sync=None):
+        """
+        Load a worksheet and prepare its rows for analysis
         
-        for col in numeric_columns:
-            if col in processed_df.columns:
-                processed_df[col] = pd.to_numeric(processed_df[col], errors='coerce')
-                
-        # Fill NaN values with 0 for numeric columns
-        for col in numeric_columns:
-            if col in processed_df.columns:
-                processed_df[col] = processed_df[col].fillna(0)
-        
-        # Fill NaN values with empty strings for text columns
-        for col in ['Title/Hook', 'Caption', 'Hashtags', 'Notes (Topic/Emotion)']:
-            if col in processed_df.columns:
-                processed_df[col] = processed_df[col].fillna('')
-                
-        return processed_df
+        Args:
+            sheet_url (str): URL of the Google Sheet
+            worksheet_name (str): Name of the worksheet to analyze
+            selected_indices (list, optional): List of row indices to analyze (0-based, excluding header)
+            triage_policy (str, optional): Pre-triage policy passed to select_rows_for_llm
+            previous_scores (dict, optional): Triage scores from an earlier run
+            sheet_sync (SheetSync, optional): Keep only rows that are new or changed since the last sync
+            
+        Returns:
+            tuple: (worksheet, videos (list of (row_index, video_data)), error message or None)
+        """
+        # Open the Google Sheet
+        sheet = self.sheets_api.open_sheet_by_url(sheet_url)
+        if not sheet:
+            return None, [], "Failed to open Google Sheet"
+            
+        # Get the worksheet by name
+        worksheet = self.sheets_api.get_worksheet_by_name(sheet, worksheet_name)
+        if not worksheet:
+            return None, [], "Failed to open worksheet"
+            
+        # Get the video data as a typed DataFrame, reading only the columns the analysis uses
+        df = self.sheets_api.get_typed_dataframe(worksheet, SHEET_SCHEMA)
+        if df.empty:
+            return worksheet, [], "No data found in worksheet"
+            
+        # Check if required columns exist (using your sheet's column names)
+        required_columns = ['Title/Hook', 'Caption', 'Views (24h)', 'Likes', 'Comments', 'Saves']
+        missing_columns = [col for col in required_columns if col not in df.columns]
+        if missing_columns:
+            return worksheet, [], f"Missing required columns: {', '.join(missing_columns)}"
+        
+        # Count rows appended since the last load into the account's baseline
+        self.update_baselines(df, worksheet_name, sheet_url)
+            
+        # Filter rows if specific indices are provided
+        if selected_indices is not None and len(selected_indices) > 0:
+            # Ensure indices are within range
+            valid_indices = [i for i in selected_indices if 0 <= i < len(df)]
+            if not valid_indices:
+                return worksheet, [], "No valid row indices provided"
+            
+            rows_to_analyze = df.iloc[valid_indices]
+        else:
+            rows_to_analyze = df
+        
+        # Skip rows whose fingerprint matches the last sync before doing any per-row work
+        if sheet_sync is not None:
+            changed = sheet_sync.changed_rows(rows_to_analyze)
+            self.last_sync = {'sheet_rows': len(df), 'checked': len(rows_to_analyze), 'changed': len(changed)}
+            print(f"Sync found {len(changed)} new or changed rows out of {len(rows_to_analyze)}")
+            rows_to_analyze = rows_to_analyze.loc[changed]
+            if rows_to_analyze.empty:
+                return worksheet, [], None
+        
+        # Type the columns and compute all ratios in one vectorized pass
+        rows_to_analyze = compute_metrics(rows_to_analyze)
+        
+        # Rank every row against its account's history
+        rows_to_analyze = self.baselines.rank_frame(rows_to_analyze, account=worksheet_name)
+        
+        # Evaluate the deterministic rules up front and drop rows the LLM doesn't need to see
+        self.last_triage = triage_dataframe(rows_to_analyze)
+        if triage_policy and triage_policy != 'all':
+            selected = select_rows_for_llm(self.last_triage, triage_policy, previous_scores)
+            print(f"Triage policy '{triage_policy}' kept {len(selected)} of {len(rows_to_analyze)} rows")
+            rows_to_analyze = rows_to_analyze.loc[selected]
+            
+        # Prepare data for analysis from plain row records (native Python values, no per-row Series)
+        records = rows_to_analyze.to_dict('records')
+        videos = [(index, self._prepare_video_data(record)) for index, record in zip(rows_to_analyze.index, records)]
+        
+        return worksheet, videos, None
+
+    def _generate_reports(self, videos, max_workers=None, max_in_flight=None, progress_callback=None,
+                          use_cache=True, videos_per_request=None, result_callback=None):
+        """
+        Generate analysis reports for prepared videos
+        
+        Args:
+            videos (list): (row_id, video_data) pairs
+            max_workers (int, optional): Number of concurrent analysis requests
+            max_in_flight (int, optional): Maximum number of queued or running requests
+            progress_callback (callable, optional): Called as (completed, total) rows
+            use_cache (bool): Reuse cached reports for rows whose prompt has not changed
+            videos_per_request (int, optional): Number of videos packed into one API request
+            result_callback (callable, optional): Called as (row_id, report) as soon as each
+                row's report (or error message) is ready
+            
+        Returns:
+            list: One report per video, in input order; failed rows hold an error message
+        """
+        videos_per_request = max(1, videos_per_request or DEFAULT_VIDEOS_PER_REQUEST)
+        runner = BatchRunner(
+            max_workers=max_workers or DEFAULT_MAX_WORKERS,
+            max_in_flight=max_in_flight
+        )
+        
+        if videos_per_request == 1:
+            # One request per row; results come back in row order
+            def _report(result):
+                if result['error'] is not None:
+                    return f"Error generating analysis: {result['error']}"
+                return result['value']
+            
+            def _on_result(result):
+                result_callback(videos[result['index']][0], _report(result))
+            
+            results = runner.run(
+                [video_data for _, video_data in videos],
+                lambda video_data: self.openai_api.generate_analysis(video_data, raise_errors=True, use_cache=use_cache),
+                progress_callback=progress_callback,
+                result_callback=_on_result if result_callback else None
+            )
+            reports = [_report(result) for result in results]
+        else:
+            # Pack several rows into each request and split the answers back out
+            groups = [videos[i:i + videos_per_request] for i in range(0, len(videos), videos_per_request)]
+            
+            def _group_progress(completed, total):
+                if progress_callback:
+                    progress_callback(min(completed * videos_per_request, len(videos)), len(videos))
+            
+            def _group_reports(group, result):
+                if result['error'] is not None:
+                    return [f"Error generating analysis: {result['error']}"] * len(group)
+                return [result['value'][str(row_id)] for row_id, _ in group]
+            
+            def _on_group(result):
+                group = groups[result['index']]
+                for (row_id, _), report in zip(group, _group_reports(group, result)):
+                    result_callback(row_id, report)
+            
+            results = runner.run(
+                groups,
+                lambda group: self.openai_api.generate_batch_analysis(group, use_cache=use_cache),
+                progress_callback=_group_progress,
+                result_callback=_on_group if result_callback else None
+            )
+            reports = [report for group, result in zip(groups, results) for report in _group_reports(group, result)]
+        
+        # Keep failures per row instead of aborting the batch
+        self.last_batch_stats = runner.last_stats
+        self.last_batch_stats['rows'] = len(reports)
+        self.last_batch_stats['failed_rows'] = sum(1 for report in reports if report.startswith("Error generating analysis"))
+        print(f"Batch analysis finished: {format_batch_stats(self.last_batch_stats)}")
+        return reports
     
     def _prepare_video_data(self, row):
         """
         Prepare data for analysis by mapping sheet columns to expected format
         
         Args:
-            row (pandas.Series): Row from the processed DataFrame
+            row (dict): Record of one row of the processed DataFrame
             
         Returns:
             dict: Formatted video data for analysis
@@ -165,59 +448,80 @@ class TikTokAnalyzer:
             if col in row:
                 video_data[col] = row[col]
         
+        # Account percentile ranks, for accounts with enough history
+        for col in PERCENTILE_COLUMNS.values():
+            rank = row.get(col)
+            if rank is not None and rank == rank:
+                video_data[col] = int(rank)
+        
         return video_data
+    
+    def update_baselines(self, df, worksheet_name, sheet_url=None):
+        """
+        Add new worksheet rows to the account baselines
+        
+        Args:
+            df (pandas.DataFrame): Full worksheet frame indexed by data row
+            worksheet_name (str): Worksheet name, used as the account
+            sheet_url (str, optional): URL of the Google Sheet, identifying the worksheet
+            
+        Returns:
+            int: Number of rows added
+        """
+        try:
+            source = f"{sheet_url}\n{worksheet_name}" if sheet_url else None
+            return self.baselines.update(df, account=worksheet_name, source=source)
+        except Exception as e:
+            print(f"Error updating account baselines: {str(e)}")
+            return 0
             
-    def analyze_single_video(self, video_data):
+    def analyze_single_video(self, video_data, use_cache=True, account=None):
         """
         Analyze a single video based on the provided data
         
         Args:
             video_data (dict): Dictionary containing video metrics and details
+            use_cache (bool): Reuse a cached report if the prompt has not changed
+            account (str, optional): Account whose baseline the video is ranked against
             
         Returns:
             str: The generated analysis report
         """
         try:
-            # Convert to DataFrame to calculate missing ratios if needed
-            df = pd.DataFrame([video_data])
-            
-            # Ensure all ratios are calculated
-            df = self._calculate_missing_ratios(df)
-            
-            # Convert back to dictionary
-            updated_video_data = df.iloc[0].to_dict()
+            # Coerce the counts and calculate the ratios on the dict itself
+            updated_video_data = compute_video_metrics(video_data)
+            if account:
+                updated_video_data = self.baselines.rank_video(updated_video_data, account)
             
             # Generate analysis
-            report = self.openai_api.generate_analysis(updated_video_data)
+            report = self.openai_api.generate_analysis(updated_video_data, use_cache=use_cache)
             
             return report
         except Exception as e:
             print(f"Error analyzing video: {str(e)}")
             return "Error analyzing video. Please try again."
             
-    def _calculate_missing_ratios(self, df):
-        """Calculate missing ratio columns in the DataFrame"""
+    def analyze_single_video_stream(self, video_data, use_cache=True, account=None):
+        """
+        Analyze a single video, yielding the report as it is generated
+        
+        Args:
+            video_data (dict): Dictionary containing video metrics and details
+            use_cache (bool): Reuse a cached report if the prompt has not changed
+            account (str, optional): Account whose baseline the video is ranked against
+            
+        Yields:
+            str: Successive chunks of the analysis report; a StreamFailure chunk means the
+                analysis failed and replaces anything yielded before it
+        """
         try:
-            # Map column names between the sheet and our expected format
-            view_col = 'Views (24h)' if 'Views (24h)' in df.columns else 'Views'
-            
-            # Ensure we have the necessary columns to calculate ratios
-            if view_col not in df.columns or 'Likes' not in df.columns or 'Comments' not in df.columns or 'Saves' not in df.columns:
-                return df
-            
-            # Make sure all metrics are numeric
-            for col in [view_col, 'Likes', 'Comments', 'Saves']:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-            
-            # Calculate all ratios (using the sheet's column names)
-            df['Views to Like Ratio (%)'] = (df['Likes'] / df[view_col] * 100).round(2)
-            df['Views to Comment Ratio (%)'] = (df['Comments'] / df[view_col] * 100).round(2)
-            df['Views to Save Ratio (%)'] = (df['Saves'] / df[view_col] * 100).round(2)
-            df['Like to Comment Ratio (%)'] = (df['Comments'] / df['Likes'] * 100).round(2).replace([float('inf'), float('nan')], 0)
-            df['Like to Save Ratio (%)'] = (df['Saves'] / df['Likes'] * 100).round(2).replace([float('inf'), float('nan')], 0)
-            
-            return df
+            # Ensure all ratios are calculated
+            updated_video_data = compute_video_metrics(video_data)
+            if account:
+                updated_video_data = self.baselines.rank_video(updated_video_data, account)
         except Exception as e:
-            print(f"Error calculating ratios: {str(e)}")
-            return df 
\ No newline at end of file
+            print(f"Error analyzing video: {str(e)}")
+            yield StreamFailure("Error analyzing video. Please try again.")
+            return
+            
+        yield from self.openai_api.generate_analysis_stream(updated_video_data, use_cache=use_cache)
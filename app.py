@@ -2,12 +2,17 @@ import streamlit as st
 import pandas as pd
 import os
 from sheets_api import SheetsAPI
-from openai_api import OpenAIAPI
+from openai_api import OpenAIAPI, StreamFailure
 from analyzer import TikTokAnalyzer
+from sheet_schema import SHEET_SCHEMA
 from firebase_auth import FirebaseAuth
 # Import Firestore helper instead of Firebase API
 from firestore_helper import firestore_db
-import utils
+from llm_metrics import metrics
+from report_model import parse_report, report_from_record, video_from_record
+from sheet_sync import SheetSync
+from job_queue import JobQueue, ACTIVE_STATES, JOB_QUEUED
+from triage import TRIAGE_POLICIES
 from dotenv import load_dotenv
 import json
 from datetime import datetime
@@ -54,24 +59,77 @@ if 'saved_reports' not in st.session_state:
 if 'active_tab' not in st.session_state:
     st.session_state.active_tab = "Google Sheets Analysis"
 
+# Seconds before a client that failed to connect is rebuilt on a later rerun
+RECONNECT_INTERVAL_SECONDS = 60
+
+# API clients are built once per process and shared by every session and rerun,
+# so clicks don't pay for credential loading, auth and new TLS connections
+@st.cache_resource(show_spinner=False)
+def get_sheets_api():
+    """Shared Google Sheets client"""
+    sheets_api = SheetsAPI()
+    sheets_api.created_at = time.time()
+    return sheets_api
+
+@st.cache_resource(show_spinner=False)
+def get_openai_api():
+    """Shared OpenAI client"""
+    openai_api = OpenAIAPI()
+    openai_api.created_at = time.time()
+    return openai_api
+
+@st.cache_resource(show_spinner=False)
+def get_job_queue():
+    """Shared handle on the background job queue"""
+    return JobQueue()
+
+@st.cache_resource(show_spinner=False)
+def get_firebase_auth():
+    """Shared Firebase Authentication client"""
+    firebase_auth = FirebaseAuth()
+    firebase_auth.created_at = time.time()
+    return firebase_auth
+
+def _reconnect(factory):
+    """Reconnect a shared client in place, closing its old connections, or rebuild it if it can't refresh"""
+    client = factory()
+    if not hasattr(client, 'refresh'):
+        factory.clear()
+        return factory()
+    client.refresh()
+    client.created_at = time.time()
+    return client
+
+def _get_healthy(factory, is_healthy):
+    """Get a shared client, reconnecting it if it is unhealthy and old enough to retry"""
+    client = factory()
+    if not is_healthy(client) and time.time() - client.created_at >= RECONNECT_INTERVAL_SECONDS:
+        client = _reconnect(factory)
+    return client
+
+def reconnect_apis():
+    """Reconnect the shared clients, e.g. after credentials changed"""
+    for factory in (get_sheets_api, get_openai_api, get_firebase_auth):
+        _reconnect(factory)
+
 def initialize_apis():
     """Initialize API connections and return status"""
     # Initialize Google Sheets API
-    sheets_api = SheetsAPI()
+    sheets_api = _get_healthy(get_sheets_api, lambda api: api.check_health())
     sheets_connected = sheets_api.is_connected()
     
     # Initialize OpenAI API
-    openai_api = OpenAIAPI()
+    openai_api = _get_healthy(get_openai_api, lambda api: api.check_health())
     openai_connected = openai_api.is_connected()
     
     # Initialize Firebase Authentication
-    firebase_auth = FirebaseAuth()
+    firebase_auth = _get_healthy(get_firebase_auth, lambda auth: auth.is_initialized())
     auth_initialized = firebase_auth.is_initialized()
     
     # Check Firestore connection status
     firestore_connected = firestore_db.connected
     
-    # Create analyzer if both APIs are connected
+    # Create analyzer if both APIs are connected; it is cheap and keeps per-run state
     analyzer = None
     if sheets_connected and openai_connected:
         analyzer = TikTokAnalyzer(sheets_api, openai_api)
@@ -125,6 +183,11 @@ def render_sidebar():
     # Credentials status
     st.sidebar.subheader("API Status")
     
+    # Rebuild the shared clients, e.g. after rotating credentials
+    if st.sidebar.button("Reconnect APIs"):
+        reconnect_apis()
+        st.rerun()
+    
     if sheets_connected:
         st.sidebar.success("✅ Google Sheets API Connected")
     else:
@@ -162,6 +225,48 @@ def render_sidebar():
         1. Firebase config is correct in .env file
         """)
     
+    # Worksheet data cache status
+    if sheets_connected:
+        frame_stats = sheets_api.frame_cache.stats()
+        st.sidebar.caption(
+            f"Sheet data cache: {frame_stats['entries']} sheets ({frame_stats['bytes'] / 1e6:.1f} MB), "
+            f"{frame_stats['hits']} hits / {frame_stats['misses']} misses"
+        )
+    
+    # Analysis cache status
+    if openai_connected:
+        cache_stats = openai_api.cache.stats()
+        st.sidebar.caption(
+            f"Analysis cache: {cache_stats['entries']} reports, "
+            f"{cache_stats['hits']} hits / {cache_stats['misses']} misses"
+        )
+        usage = openai_api.usage_totals
+        if usage["requests"]:
+            st.sidebar.caption(
+                f"Tokens since server start: {usage['prompt_tokens']} prompt "
+                f"({usage['cached_prompt_tokens']} cached), {usage['completion_tokens']} completion "
+                f"over {usage['requests']} requests"
+            )
+    
+    # LLM call metrics for this process
+    call_summary = metrics.summary()
+    if call_summary['calls']:
+        with st.sidebar.expander("LLM Call Metrics"):
+            st.write(
+                f"Calls: {call_summary['calls']} ({call_summary['errors']} errors, "
+                f"{call_summary['cache_hits']} cache hits, {call_summary['coalesced']} shared in-flight)"
+            )
+            st.write(
+                f"Latency p50 {call_summary['latency_p50']:.1f}s, p95 {call_summary['latency_p95']:.1f}s, "
+                f"mean {call_summary['latency_mean']:.1f}s"
+            )
+            st.write(f"Tokens: {call_summary['tokens']}, est. cost ${call_summary['cost_usd']:.2f}")
+            slowest = metrics.slowest(5)
+            if slowest:
+                st.dataframe(pd.DataFrame(slowest)[['wall_time', 'queue_time', 'retries', 'outcome', 'kind']])
+            st.download_button("Download Prometheus metrics", metrics.to_prometheus(), file_name="llm_metrics.prom")
+            st.download_button("Download JSON metrics", metrics.to_json(), file_name="llm_metrics.json")
+    
     st.sidebar.markdown("---")
     
     # Saved Reports section
@@ -181,6 +286,39 @@ def render_sidebar():
     Note: Row 0 is the first data row (after the header)
     """)
 
+def render_report_stream(chunks):
+    """
+    Render a streamed report incrementally and return it parsed
+    
+    Args:
+        chunks (iterable): Report text chunks as they arrive
+        
+    Returns:
+        AnalysisReport: The assembled report, parsed once for display and saving,
+            or None if the analysis failed
+    """
+    placeholder = st.empty()
+    placeholder.info("Waiting for the analysis to start...")
+    
+    parts = []
+    last_render = 0.0
+    for chunk in chunks:
+        # A failed stream ends with its error; what came before is not a usable report
+        if isinstance(chunk, StreamFailure):
+            placeholder.error(chunk)
+            return None
+        parts.append(chunk)
+        # Limit redraws so long reports don't flood the browser with updates
+        if time.time() - last_render >= 0.1:
+            placeholder.markdown("".join(parts) + " ▌")
+            last_render = time.time()
+    
+    report = parse_report("".join(parts))
+    placeholder.markdown(report.markdown)
+    if report.viral_score is not None:
+        st.metric("Viral Potential Score", f"{report.viral_score:g}/10")
+    return report
+
 def render_manual_input_form():
     """Render manual input form for analyzing a single video"""
     st.subheader("📝 Analyze Single Video")
@@ -201,6 +339,8 @@ def render_manual_input_form():
             comments = st.number_input("Comments", min_value=0, step=1)
             saves = st.number_input("Saves", min_value=0, step=1)
             
+        regenerate = st.checkbox("Regenerate report (skip cache)", key="manual_regenerate")
+            
         # Submit button
         submitted = st.form_submit_button("Analyze Video")
         
@@ -223,14 +363,14 @@ def render_manual_input_form():
             "Notes": notes
         }
         
-        # Analyze video
-        with st.spinner("Analyzing video..."):
-            report = analyzer.analyze_single_video(video_data)
-            
-        # Display formatted report
+        # Analyze video, rendering the report as it streams in
         st.subheader("📊 Analysis Report")
-        formatted_report = utils.format_report_for_display(report)
-        st.markdown(formatted_report)
+        analysis = render_report_stream(
+            analyzer.analyze_single_video_stream(video_data, use_cache=not regenerate)
+        )
+        if analysis is None:
+            return
+        report = analysis.raw
         
         # Create a simple save and download section
         st.subheader("Save or Download Report")
@@ -238,7 +378,7 @@ def render_manual_input_form():
         
         # Download button
         with col1:
-            report_csv = pd.DataFrame([{**video_data, "Analysis Report": report}])
+            report_csv = pd.DataFrame([{**video_data, "Analysis Report": report, "Viral Potential Score": analysis.viral_score}])
             st.download_button(
                 label="Download Report as CSV",
                 data=report_csv.to_csv(index=False),
@@ -263,7 +403,8 @@ def render_manual_input_form():
                             title=title,
                             description=description,
                             report_content=report,
-                            report_data=video_data
+                            report_data=video_data,
+                            structured_report=analysis
                         )
                         
                         if report_id:
@@ -280,6 +421,77 @@ def render_manual_input_form():
                         logger.error(f"Error in direct save button handler: {str(e)}", exc_info=True)
                         st.error(f"Error saving report: {str(e)}")
 
+def render_background_jobs(sheet_url, worksheet_name):
+    """Enqueue sheet analyses and show the status of queued jobs"""
+    job_queue = get_job_queue()
+    st.caption("Jobs run in separate worker processes, so they keep going when this page is closed. "
+               "Start workers with `python worker.py --workers 2`.")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        analysis_col = st.number_input("Analysis column (0-based)", min_value=0, value=13, key="job_analysis_col")
+    with col2:
+        triage_policy = st.selectbox(
+            "Rows to analyze", TRIAGE_POLICIES, key="job_triage_policy",
+            help="'changed' policies compare each row's triage score with the score stored when it was last analyzed"
+        )
+    with col3:
+        max_workers = st.number_input("Concurrent requests", min_value=1, value=4, key="job_max_workers")
+    sync = st.checkbox("Only new or changed rows since the last sync", value=True, key="job_sync")
+
+    if st.button("Queue Analysis"):
+        job_id = job_queue.enqueue("analyze_sheet", {
+            'sheet_url': sheet_url,
+            'worksheet_name': worksheet_name,
+            'analysis_col_index': int(analysis_col),
+            'triage_policy': triage_policy,
+            'max_workers': int(max_workers),
+            'sync': sync
+        })
+        st.success(f"Queued job {job_id}")
+
+    # Status is read from the queue on every rerun; Refresh just triggers one
+    st.button("Refresh Status", key="job_refresh")
+    jobs = job_queue.list_jobs(limit=20)
+    if not jobs:
+        st.info("No background jobs yet.")
+        return
+
+    rows = []
+    for job in jobs:
+        total = job['progress_total']
+        rows.append({
+            'Job': job['id'],
+            'Worksheet': job['params'].get('worksheet_name', ''),
+            'Status': job['status'],
+            'Progress': f"{job['progress_done']}/{total}" if total else "",
+            'Message': job['message'] or "",
+            'Worker': job['worker'] or "",
+            'Run': job['run_id'] or "",
+            'Created': datetime.fromtimestamp(job['created_at']).strftime('%Y-%m-%d %H:%M:%S')
+        })
+    st.dataframe(pd.DataFrame(rows).set_index('Job'))
+
+    active = [job for job in jobs if job['status'] in ACTIVE_STATES]
+    for job in active:
+        if job['status'] == JOB_QUEUED:
+            continue
+        if job['progress_total']:
+            st.progress(min(job['progress_done'] / job['progress_total'], 1.0),
+                        text=f"{job['id']}: {job['progress_done']}/{job['progress_total']} rows")
+
+    queued = [job['id'] for job in active if job['status'] == JOB_QUEUED]
+    if queued:
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            to_cancel = st.selectbox("Queued job", queued, key="job_cancel_id")
+        with col2:
+            if st.button("Cancel Job"):
+                if job_queue.cancel(to_cancel):
+                    st.success(f"Cancelled job {to_cancel}")
+                else:
+                    st.warning(f"Job {to_cancel} was already picked up by a worker")
+
 def render_sheets_analysis_form():
     """Render Google Sheets analysis form"""
     st.subheader("📊 Analyze Videos from Google Sheets")
@@ -318,7 +530,7 @@ def render_sheets_analysis_form():
                     
                     if worksheet:
                         print(f"Successfully opened worksheet, getting data as DataFrame")
-                        sheet_data = sheets_api.get_data_as_dataframe(worksheet)
+                        sheet_data = sheets_api.get_typed_dataframe(worksheet, SHEET_SCHEMA)
                         
                         if sheet_data.empty:
                             st.error("No data found in the worksheet.")
@@ -328,6 +540,14 @@ def render_sheets_analysis_form():
                             
                             st.session_state.sheet_data = sheet_data
                             st.success(f"Loaded {len(sheet_data)} videos from the sheet.")
+                            
+                            # Add rows appended since the last load to the account baseline
+                            if analyzer:
+                                analyzer.update_baselines(sheet_data, worksheet_name, sheet_url)
+                            
+                            # Compare against the fingerprints of the last synced run
+                            changed = SheetSync(sheet_url, worksheet_name).changed_rows(sheet_data)
+                            st.info(f"{len(changed)} of {len(sheet_data)} rows are new or changed since the last sync.")
                     else:
                         st.error(f"Could not find worksheet named '{worksheet_name}'")
                 else:
@@ -337,7 +557,65 @@ def render_sheets_analysis_form():
             print(f"Error loading Google Sheet: {str(e)}")
             import traceback
             print(traceback.format_exc())
-    
+
+    # Load several account worksheets at once for cross-account comparison
+    with st.expander("Load Multiple Accounts"):
+        targets_text = st.text_area(
+            "Worksheets to load",
+            value="Account A Data\nAccount B Data",
+            help="One worksheet per line. Use 'Sheet URL | Worksheet Name' or "
+                 "'Sheet URL | Worksheet Name | Account' for worksheets in other spreadsheets; "
+                 "a bare worksheet name uses the Google Sheet URL above."
+        )
+        if st.button("Load All Accounts"):
+            targets = []
+            for line in targets_text.splitlines():
+                parts = [part.strip() for part in line.split("|")]
+                if not parts[0]:
+                    continue
+                targets.append(tuple(parts) if len(parts) > 1 else (sheet_url, parts[0]))
+
+            progress = st.progress(0.0)
+            with st.spinner(f"Loading {len(targets)} worksheets..."):
+                combined = sheets_api.load_worksheets(
+                    targets, progress_callback=lambda done, total: progress.progress(done / total)
+                )
+            st.session_state.multi_sheet_data = combined
+            if analyzer and not combined.empty:
+                analyzer.baselines.update(combined)
+            for (_, name), error in sheets_api.last_load_errors.items():
+                st.warning(f"Could not load '{name}': {error}")
+
+        combined = st.session_state.get('multi_sheet_data')
+        if combined is not None and not combined.empty:
+            st.success(f"Loaded {len(combined)} videos from {combined['Account'].nunique()} accounts.")
+            metric_cols = [col for col in ['Views (24h)', 'Likes', 'Comments', 'Saves'] if col in combined.columns]
+            summary = combined.groupby('Account', sort=False)[metric_cols].agg(['count', 'median']) \
+                if metric_cols else combined.groupby('Account', sort=False).size().to_frame('Videos')
+            st.dataframe(summary)
+
+            # Running baselines cover every row ever loaded, not just this load
+            if analyzer:
+                baseline_rows = []
+                for account in combined['Account'].unique():
+                    stats = analyzer.baselines.summary(account)
+                    if stats:
+                        baseline_rows.append({
+                            'Account': account,
+                            'Videos': stats['Views']['videos'],
+                            'Median Views': stats['Views']['median'],
+                            'Median Like Ratio (%)': stats['Views to Like Ratio (%)']['median'],
+                            'Median Comment Ratio (%)': stats['Views to Comment Ratio (%)']['median'],
+                            'Median Save Ratio (%)': stats['Views to Save Ratio (%)']['median']
+                        })
+                if baseline_rows:
+                    st.caption("Account baselines")
+                    st.dataframe(pd.DataFrame(baseline_rows).set_index('Account').round(2))
+
+    # Queue a full-sheet analysis for the worker processes (python worker.py)
+    with st.expander("Background Analysis"):
+        render_background_jobs(sheet_url, worksheet_name)
+
     # Display data preview if available
     if st.session_state.sheet_data is not None:
         # Show a preview of the loaded data (limited columns to prevent display issues)
@@ -348,6 +626,7 @@ def render_sheets_analysis_form():
         st.dataframe(st.session_state.sheet_data[display_cols].head())
         
         # Analyze specific video button
+        regenerate = st.checkbox("Regenerate report (skip cache)", key="sheets_regenerate")
         analyze_video = st.button("Analyze Selected Video")
         
         if analyze_video:
@@ -355,26 +634,22 @@ def render_sheets_analysis_form():
             if row_number >= len(st.session_state.sheet_data):
                 st.error(f"Row number {row_number} is out of range. Maximum row number is {len(st.session_state.sheet_data)-1}.")
             else:
-                # Get the selected row data
-                row_data = st.session_state.sheet_data.iloc[row_number]
+                # Get the selected row data as a plain record
+                row_data = st.session_state.sheet_data.iloc[[row_number]].to_dict('records')[0]
                 
-                with st.spinner("Analyzing video..."):
-                    # Prepare data for analysis
-                    video_data = {}
-                    
-                    # Extract necessary columns
-                    video_data["Title"] = row_data.get("Title/Hook", "")
-                    video_data["Hook"] = row_data.get("Title/Hook", "")
-                    video_data["Caption"] = row_data.get("Caption", "")
-                    video_data["Hashtags"] = row_data.get("Hashtags", "")
-                    video_data["Views"] = row_data.get("Views (24h)", 0)
-                    video_data["Likes"] = row_data.get("Likes", 0)
-                    video_data["Comments"] = row_data.get("Comments", 0)
-                    video_data["Saves"] = row_data.get("Saves", 0)
-                    video_data["Notes"] = row_data.get("Notes (Topic/Emotion)", "")
-                    
-                    # Generate analysis
-                    report = analyzer.analyze_single_video(video_data)
+                # Prepare data for analysis
+                video_data = {}
+                
+                # Extract necessary columns
+                video_data["Title"] = row_data.get("Title/Hook", "")
+                video_data["Hook"] = row_data.get("Title/Hook", "")
+                video_data["Caption"] = row_data.get("Caption", "")
+                video_data["Hashtags"] = row_data.get("Hashtags", "")
+                video_data["Views"] = row_data.get("Views (24h)", 0)
+                video_data["Likes"] = row_data.get("Likes", 0)
+                video_data["Comments"] = row_data.get("Comments", 0)
+                video_data["Saves"] = row_data.get("Saves", 0)
+                video_data["Notes"] = row_data.get("Notes (Topic/Emotion)", "")
                 
                 # Display the video details
                 st.subheader(f"Analysis for Video (Row {row_number})")
@@ -391,10 +666,14 @@ def render_sheets_analysis_form():
                 with col4:
                     st.metric("Saves", video_data["Saves"])
                 
-                # Display the analysis report
+                # Display the analysis report as it streams in
                 st.subheader("📊 Analysis Report")
-                formatted_report = utils.format_report_for_display(report)
-                st.markdown(formatted_report)
+                analysis = render_report_stream(
+                    analyzer.analyze_single_video_stream(video_data, use_cache=not regenerate, account=worksheet_name)
+                )
+                if analysis is None:
+                    return
+                report = analysis.raw
                 
                 # Create a simple save and download section
                 st.subheader("Save or Download Report")
@@ -404,7 +683,7 @@ def render_sheets_analysis_form():
                 with col1:
                     st.download_button(
                         label="Download Report as CSV",
-                        data=pd.DataFrame([{**video_data, "Analysis Report": report}]).to_csv(index=False),
+                        data=pd.DataFrame([{**video_data, "Analysis Report": report, "Viral Potential Score": analysis.viral_score}]).to_csv(index=False),
                         file_name=f"tiktok_analysis_row{row_number}.csv",
                         mime="text/csv"
                     )
@@ -426,7 +705,8 @@ def render_sheets_analysis_form():
                                     title=title,
                                     description=description,
                                     report_content=report,
-                                    report_data=video_data
+                                    report_data=video_data,
+                                    structured_report=analysis
                                 )
                                 
                                 if report_id:
@@ -612,11 +892,11 @@ def render_saved_reports():
     # Create a DataFrame for display
     report_data = []
     for report in reports:
-        # Try to parse video data from query field
-        try:
-            video_data = json.loads(report.get('query', '{}'))
-        except:
-            video_data = {}
+        # Stored video data and score; older records are parsed once and memoized
+        video_data = video_from_record(report)
+        viral_score = report.get('viral_score')
+        if viral_score is None:
+            viral_score = report_from_record(report).viral_score
             
         created_at = report.get('created_at', 'Unknown')
         
@@ -637,10 +917,11 @@ def render_saved_reports():
             'Title': report.get('title', video_data.get('Title', 'Unknown')),
             'Views': video_data.get('Views', 0),
             'Likes': video_data.get('Likes', 0),
+            'Viral Score': viral_score,
             'Date Saved': created_at
         })
     
-    # Display report list
+    # Display report list; the numeric score column is sortable
     df = pd.DataFrame(report_data)
     st.dataframe(df)
     
@@ -670,11 +951,8 @@ def render_saved_reports():
                 # Display report details
                 st.subheader(f"📊 Report for: {report.get('title', 'Unknown')}")
                 
-                # Try to parse video data
-                try:
-                    video_data = json.loads(report.get('query', '{}'))
-                except:
-                    video_data = {}
+                video_data = video_from_record(report)
+                structured_report = report_from_record(report)
                 
                 # Display metrics in columns
                 col1, col2, col3, col4 = st.columns(4)
@@ -686,12 +964,12 @@ def render_saved_reports():
                     st.metric("Comments", video_data.get('Comments', 0))
                 with col4:
                     st.metric("Saves", video_data.get('Saves', 0))
+                if structured_report.viral_score is not None:
+                    st.metric("Viral Potential Score", f"{structured_report.viral_score:g}/10")
                 
-                # Display the report
+                # Display the pre-built report markdown
                 st.subheader("📝 Analysis")
-                report_text = report.get('metrics', 'No analysis found')
-                formatted_report = utils.format_report_for_display(report_text)
-                st.markdown(formatted_report)
+                st.markdown(structured_report.markdown or 'No analysis found')
                 
                 # Delete button
                 if st.button("Delete Report"):
@@ -836,13 +1114,18 @@ def save_report_to_local_file(video_data, report):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         report_id = f"{timestamp}_{hash(video_data.get('Title', ''))}"
         
-        # Create the report data
+        # Create the report data, with the parsed report stored next to the raw text
+        structured_report = parse_report(report)
+        query = json.dumps(video_data)
         report_data = {
             'id': report_id,
             'title': video_data.get('Title', 'Untitled'),
             'description': video_data.get('Caption', ''),
-            'query': json.dumps(video_data),
+            'query': query,
+            'video': json.loads(query),
             'metrics': report,
+            'report': structured_report.to_dict(),
+            'viral_score': structured_report.viral_score,
             'created_at': datetime.now().timestamp()
         }
         
@@ -0,0 +1,120 @@
+import time
+import argparse
+
+from dotenv import load_dotenv
+
+from batch_jobs import BatchJob, get_batch_backend, list_jobs
+from triage import TRIAGE_POLICIES
+from worker import build_analyzer
+
+# Seconds between polls while waiting for a batch job
+BATCH_POLL_SECONDS = 30
+
+
+def follow_job(analyzer, job, backend, report_store=None, wait=False, retries=0, poll_interval=BATCH_POLL_SECONDS):
+    """
+    Collect and merge a batch job's results, optionally until it has finished
+
+    Args:
+        analyzer (TikTokAnalyzer): Analyzer whose sheet and cache receive the results
+        job (BatchJob): The job to follow
+        backend (BatchBackend): Backend the job was submitted to
+        report_store (callable, optional): Report store passed to BatchJob.merge
+        wait (bool): Keep polling until no requests are outstanding
+        retries (int): Times failed requests are resubmitted once everything else has finished
+        poll_interval (float): Seconds between polls while waiting
+
+    Returns:
+        bool: True if every request completed and was merged (or, without wait, nothing went wrong yet)
+    """
+    while True:
+        success, message, summary = analyzer.collect_batch_job(job, backend, report_store=report_store)
+        print(message)
+        if not success:
+            return False
+        if summary['outstanding']:
+            if not wait:
+                return True
+            time.sleep(poll_interval)
+            continue
+        if not summary['failed'] or retries <= 0:
+            return summary['failed'] == 0
+        retries -= 1
+        backend_job_id = job.resubmit_failed(backend)
+        print(f"Resubmitted {summary['failed']} failed requests as {backend_job_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create and collect offline batch analysis jobs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    create = subparsers.add_parser("create", help="Create a job for a worksheet and submit it")
+    create.add_argument("sheet_url")
+    create.add_argument("--worksheet", default="Account A Data")
+    create.add_argument("--analysis-col", type=int, default=None, help="0-based column to write reports into")
+    create.add_argument("--rows", type=int, nargs="*", default=None, help="Row indices to analyze (0-based, excluding header)")
+    create.add_argument("--triage-policy", choices=TRIAGE_POLICIES, default=None)
+    create.add_argument("--backend", choices=("openai", "local"), default="openai")
+
+    collect = subparsers.add_parser("collect", help="Collect finished results and merge them into the sheet")
+    collect.add_argument("job_id")
+    collect.add_argument("--backend", choices=("openai", "local"), default=None,
+                         help="Defaults to the backend of the job's last submission")
+
+    for command in (create, collect):
+        command.add_argument("--wait", action="store_true", help="Poll until no requests are outstanding")
+        command.add_argument("--retries", type=int, default=0, help="Times to resubmit failed requests")
+        command.add_argument("--poll-interval", type=float, default=BATCH_POLL_SECONDS)
+        command.add_argument("--save-reports", action="store_true", help="Also save merged reports to Firestore")
+
+    subparsers.add_parser("list", help="Show the jobs on disk")
+    args = parser.parse_args()
+    load_dotenv()
+
+    if args.command == "list":
+        for job_id in list_jobs():
+            job = BatchJob.load(job_id)
+            if job is not None:
+                summary = job.summary()
+                print(f"{job_id}  {summary['status']}  {summary['completed']}/{summary['total']} completed, "
+                      f"{summary['failed']} failed, {summary['outstanding']} outstanding")
+        return
+
+    analyzer = build_analyzer()
+    report_store = None
+    if args.save_reports:
+        from direct_save import direct_save_to_firestore
+        report_store = direct_save_to_firestore
+
+    if args.command == "create":
+        backend = get_batch_backend(args.backend, analyzer.openai_api)
+        success, message, job = analyzer.create_batch_job(
+            args.sheet_url, args.worksheet,
+            analysis_col_index=args.analysis_col,
+            selected_indices=args.rows,
+            backend=backend,
+            triage_policy=args.triage_policy
+        )
+        print(message)
+        if not success:
+            raise SystemExit(1)
+        # Local jobs run inside this process, so they have to be waited for
+        wait = args.wait or args.backend == "local"
+    else:
+        job = BatchJob.load(args.job_id)
+        if job is None:
+            raise SystemExit(1)
+        submissions = job.state.get('submissions') or []
+        backend_name = args.backend or (submissions[-1]['backend'] if submissions else "openai")
+        backend = get_batch_backend(backend_name, analyzer.openai_api)
+        if not submissions:
+            print(f"Submitted batch job {job.job_id} as {job.submit(backend)}")
+        wait = args.wait or backend_name == "local"
+
+    if not follow_job(analyzer, job, backend, report_store=report_store, wait=wait,
+                      retries=args.retries, poll_interval=args.poll_interval):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
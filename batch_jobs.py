@@ -0,0 +1,521 @@
+import os
+import json
+import time
+import uuid
+import threading
+from datetime import datetime
+
+from analysis_cache import make_cache_key
+from report_model import parse_report
+from utils import write_json_atomic
+
+# Directory holding one sub-directory per batch job
+DEFAULT_JOBS_DIR = os.getenv("BATCH_JOBS_DIR", "batch_jobs")
+
+# Job states
+JOB_CREATED = "created"
+JOB_SUBMITTED = "submitted"
+JOB_COMPLETED = "completed"
+JOB_PARTIAL = "partial"
+JOB_MERGED = "merged"
+
+
+def _custom_id(row_index):
+    """Build the request id used for a sheet row inside a job file"""
+    return f"row-{row_index}"
+
+
+class BatchBackend:
+    """Interface for services that process a JSONL file of chat completion requests"""
+
+    name = "base"
+
+    def submit(self, requests_path):
+        """
+        Submit a JSONL request file
+
+        Args:
+            requests_path (str): Path to the JSONL file
+
+        Returns:
+            str: Backend job id
+        """
+        raise NotImplementedError
+
+    def status(self, backend_job_id):
+        """
+        Get the state of a submitted job
+
+        Returns:
+            dict: 'state' is one of 'in_progress', 'completed' or 'failed'; may also hold counts
+        """
+        raise NotImplementedError
+
+    def fetch_results(self, backend_job_id):
+        """
+        Get the results of a finished job
+
+        Returns:
+            list: Dicts with 'custom_id' and either 'report' or 'error'
+        """
+        raise NotImplementedError
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """Backend using the OpenAI Batch API (24 hour completion window, discounted pricing)"""
+
+    name = "openai"
+
+    def __init__(self, client, completion_window="24h"):
+        """
+        Initialize the backend
+
+        Args:
+            client (openai.OpenAI): OpenAI client
+            completion_window (str): Batch completion window
+        """
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, requests_path):
+        with open(requests_path, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def status(self, backend_job_id):
+        batch = self.client.batches.retrieve(backend_job_id)
+        if batch.status == "completed":
+            state = "completed"
+        elif batch.status in ("failed", "expired", "cancelled"):
+            state = "failed"
+        else:
+            state = "in_progress"
+        counts = getattr(batch, 'request_counts', None)
+        return {
+            'state': state,
+            'backend_status': batch.status,
+            'completed': getattr(counts, 'completed', None),
+            'failed': getattr(counts, 'failed', None),
+            'total': getattr(counts, 'total', None)
+        }
+
+    def fetch_results(self, backend_job_id):
+        batch = self.client.batches.retrieve(backend_job_id)
+        results = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = self.client.files.content(file_id).text
+            for line in content.splitlines():
+                if line.strip():
+                    results.append(_parse_openai_result_line(json.loads(line)))
+        return results
+
+
+def _parse_openai_result_line(line):
+    """Convert one line of an OpenAI batch output file into a result dict"""
+    custom_id = line.get('custom_id')
+    response = line.get('response') or {}
+    if line.get('error') or response.get('status_code') != 200:
+        error = line.get('error') or response.get('body', {}).get('error') or "Request failed"
+        return {'custom_id': custom_id, 'error': json.dumps(error) if isinstance(error, dict) else str(error)}
+    try:
+        report = response['body']['choices'][0]['message']['content']
+        return {'custom_id': custom_id, 'report': report}
+    except (KeyError, IndexError, TypeError):
+        return {'custom_id': custom_id, 'error': "Malformed response body"}
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    In-process stand-in for a batch service
+
+    Requests are completed on a background thread with `complete_fn`, which
+    receives the request body and returns the report text. Defaults to calling
+    the backend of an OpenAIAPI instance directly.
+    """
+
+    name = "local"
+
+    def __init__(self, openai_api=None, complete_fn=None, work_dir=None):
+        """
+        Initialize the backend
+
+        Args:
+            openai_api (OpenAIAPI, optional): API used when no complete_fn is given
+            complete_fn (callable, optional): Function mapping a request body to report text
+            work_dir (str, optional): Directory for output files; defaults to the jobs directory
+        """
+        if complete_fn is None:
+            if openai_api is None:
+                raise ValueError("LocalBatchBackend needs either openai_api or complete_fn")
+
+            def complete_fn(body):
+                return openai_api.backend.complete(body).text
+
+        self.complete_fn = complete_fn
+        self.work_dir = work_dir or os.path.join(DEFAULT_JOBS_DIR, "_local_backend")
+        self._threads = {}
+
+    def _output_path(self, backend_job_id):
+        return os.path.join(self.work_dir, f"{backend_job_id}.output.jsonl")
+
+    def submit(self, requests_path):
+        os.makedirs(self.work_dir, exist_ok=True)
+        backend_job_id = f"local-{uuid.uuid4().hex[:12]}"
+        thread = threading.Thread(target=self._process, args=(requests_path, backend_job_id), daemon=True)
+        self._threads[backend_job_id] = thread
+        thread.start()
+        return backend_job_id
+
+    def _process(self, requests_path, backend_job_id):
+        """Complete every request in the file and write an output file"""
+        tmp_path = self._output_path(backend_job_id) + ".tmp"
+        with open(requests_path, 'r') as source, open(tmp_path, 'w') as output:
+            for line in source:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                try:
+                    result = {'custom_id': request['custom_id'], 'report': self.complete_fn(request['body'])}
+                except Exception as e:
+                    result = {'custom_id': request['custom_id'], 'error': str(e)}
+                output.write(json.dumps(result) + "\n")
+        os.replace(tmp_path, self._output_path(backend_job_id))
+
+    def status(self, backend_job_id):
+        if os.path.exists(self._output_path(backend_job_id)):
+            return {'state': 'completed'}
+        thread = self._threads.get(backend_job_id)
+        if thread is None or not thread.is_alive():
+            # Unknown job, or the process restarted before the job finished
+            return {'state': 'failed'}
+        return {'state': 'in_progress'}
+
+    def wait(self, backend_job_id, timeout=None):
+        """Block until a local job has finished (useful in tests)"""
+        thread = self._threads.get(backend_job_id)
+        if thread is not None:
+            thread.join(timeout)
+
+    def fetch_results(self, backend_job_id):
+        results = []
+        with open(self._output_path(backend_job_id), 'r') as f:
+            for line in f:
+                if line.strip():
+                    results.append(json.loads(line))
+        return results
+
+
+def get_batch_backend(name, openai_api):
+    """
+    Create a batch backend by name
+
+    Args:
+        name (str): 'openai' or 'local'
+        openai_api (OpenAIAPI): Connected OpenAI API instance
+
+    Returns:
+        BatchBackend: The backend
+    """
+    if name == "openai":
+        if openai_api.client is None:
+            raise ValueError("The OpenAI Batch API needs the OpenAI backend")
+        return OpenAIBatchBackend(openai_api.client)
+    if name == "local":
+        return LocalBatchBackend(openai_api=openai_api)
+    raise ValueError(f"Unknown batch backend: {name}")
+
+
+class BatchJob:
+    """
+    An offline analysis job for a set of sheet rows
+
+    All state lives in `<jobs_dir>/<job_id>/job.json`, which is rewritten after
+    every change, so a job can be reloaded and continued after a restart.
+    """
+
+    def __init__(self, job_id, jobs_dir=DEFAULT_JOBS_DIR):
+        self.job_id = job_id
+        self.jobs_dir = jobs_dir
+        self.job_dir = os.path.join(jobs_dir, job_id)
+        self.state = {}
+
+    @property
+    def status(self):
+        return self.state.get('status')
+
+    @classmethod
+    def create(cls, openai_api, videos, sheet_url=None, worksheet_name=None, analysis_col_index=None,
+               triage_scores=None, jobs_dir=DEFAULT_JOBS_DIR):
+        """
+        Write a new job file for prepared videos
+
+        Args:
+            openai_api (OpenAIAPI): API used to build each request
+            videos (list): (row_index, video_data) pairs
+            sheet_url (str, optional): Sheet the rows came from, for write-back
+            worksheet_name (str, optional): Worksheet the rows came from
+            analysis_col_index (int, optional): Column to write reports into
+            triage_scores (dict, optional): Triage score by row index, kept with each item
+            jobs_dir (str): Directory holding job data
+
+        Returns:
+            BatchJob: The created job
+        """
+        job_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        job = cls(job_id, jobs_dir)
+        os.makedirs(job.job_dir, exist_ok=True)
+
+        triage_scores = triage_scores or {}
+        items = {}
+        with open(job._requests_path(0), 'w') as f:
+            for row_index, video_data in videos:
+                custom_id = _custom_id(row_index)
+                body = openai_api._build_request(video_data)
+                f.write(json.dumps({
+                    'custom_id': custom_id,
+                    'method': 'POST',
+                    'url': '/v1/chat/completions',
+                    'body': body
+                }, default=str) + "\n")
+                items[custom_id] = {
+                    'row_index': int(row_index),
+                    'title': str(video_data.get('Title', '')),
+                    'video_data': json.loads(json.dumps(video_data, default=str)),
+                    'cache_key': make_cache_key(body),
+                    'triage_score': float(triage_scores[row_index]) if row_index in triage_scores else None,
+                    'status': 'pending',
+                    'report': None,
+                    'error': None
+                }
+
+        job.state = {
+            'job_id': job_id,
+            'status': JOB_CREATED,
+            'created_at': time.time(),
+            'sheet_url': sheet_url,
+            'worksheet_name': worksheet_name,
+            'analysis_col_index': analysis_col_index,
+            'submissions': [],
+            'items': items
+        }
+        job.save()
+        return job
+
+    @classmethod
+    def load(cls, job_id, jobs_dir=DEFAULT_JOBS_DIR):
+        """Load a job from disk, or return None if it does not exist"""
+        job = cls(job_id, jobs_dir)
+        try:
+            with open(job._state_path(), 'r') as f:
+                job.state = json.load(f)
+            return job
+        except Exception as e:
+            print(f"Error loading batch job {job_id}: {str(e)}")
+            return None
+
+    def _state_path(self):
+        return os.path.join(self.job_dir, "job.json")
+
+    def _requests_path(self, attempt):
+        return os.path.join(self.job_dir, f"requests_{attempt}.jsonl")
+
+    def save(self):
+        """Persist the job state atomically"""
+        write_json_atomic(self._state_path(), self.state, indent=2, default=str)
+
+    def submit(self, backend):
+        """Submit the original request file"""
+        return self._submit_file(backend, self._requests_path(0), list(self.state['items']))
+
+    def _submit_file(self, backend, requests_path, custom_ids):
+        """Submit a request file and record the submission"""
+        backend_job_id = backend.submit(requests_path)
+        self.state['submissions'].append({
+            'backend': backend.name,
+            'backend_job_id': backend_job_id,
+            'requests_path': requests_path,
+            'custom_ids': custom_ids,
+            'submitted_at': time.time(),
+            'collected': False
+        })
+        for custom_id in custom_ids:
+            self.state['items'][custom_id]['status'] = 'submitted'
+        self.state['status'] = JOB_SUBMITTED
+        self.save()
+        return backend_job_id
+
+    def poll(self, backend, cache=None):
+        """
+        Check outstanding submissions and collect any finished results
+
+        Args:
+            backend (BatchBackend): Backend the job was submitted to
+            cache (AnalysisCache, optional): Cache to store collected reports in
+
+        Returns:
+            dict: Progress summary from summary()
+        """
+        for submission in self.state['submissions']:
+            if submission['collected']:
+                continue
+            status = backend.status(submission['backend_job_id'])
+            if status['state'] == 'completed':
+                self._collect(backend, submission, cache)
+            elif status['state'] == 'failed':
+                for custom_id in submission['custom_ids']:
+                    item = self.state['items'][custom_id]
+                    if item['status'] == 'submitted':
+                        item['status'] = 'failed'
+                        item['error'] = f"Batch {submission['backend_job_id']} failed"
+                submission['collected'] = True
+
+        if all(submission['collected'] for submission in self.state['submissions']):
+            failed = any(item['status'] == 'failed' for item in self.state['items'].values())
+            if self.state['status'] != JOB_MERGED:
+                self.state['status'] = JOB_PARTIAL if failed else JOB_COMPLETED
+        self.save()
+        return self.summary()
+
+    def _collect(self, backend, submission, cache=None):
+        """Record the results of a finished submission"""
+        seen = set()
+        for result in backend.fetch_results(submission['backend_job_id']):
+            item = self.state['items'].get(result.get('custom_id'))
+            if item is None:
+                continue
+            seen.add(result['custom_id'])
+            if result.get('report'):
+                # Parse once so the score is available without re-reading the report
+                item.update(status='completed', report=result['report'], error=None,
+                            viral_score=parse_report(result['report']).viral_score)
+                if cache is not None:
+                    cache.set(item['cache_key'], result['report'], {'batch_job': self.job_id})
+            else:
+                item.update(status='failed', error=result.get('error') or "No result returned")
+        # Requests the backend silently dropped count as failures
+        for custom_id in submission['custom_ids']:
+            if custom_id not in seen and self.state['items'][custom_id]['status'] == 'submitted':
+                self.state['items'][custom_id].update(status='failed', error="No result returned")
+        submission['collected'] = True
+
+    def wait(self, backend, poll_interval=30, timeout=None, cache=None):
+        """Poll until every submission is collected or the timeout passes"""
+        started = time.time()
+        while True:
+            summary = self.poll(backend, cache)
+            if summary['outstanding'] == 0:
+                return summary
+            if timeout is not None and time.time() - started > timeout:
+                return summary
+            time.sleep(poll_interval)
+
+    def results(self):
+        """
+        Get the reports collected so far, including from unfinished jobs
+
+        Returns:
+            dict: Report text keyed by row index
+        """
+        return {
+            item['row_index']: item['report']
+            for item in self.state['items'].values()
+            if item['status'] == 'completed'
+        }
+
+    def failed_items(self):
+        """Get the custom ids of failed requests"""
+        return [custom_id for custom_id, item in self.state['items'].items() if item['status'] == 'failed']
+
+    def resubmit_failed(self, backend):
+        """
+        Submit a new request file containing only the failed requests
+
+        Returns:
+            str: Backend job id, or None if nothing failed
+        """
+        failed = set(self.failed_items())
+        if not failed:
+            return None
+        requests_path = self._requests_path(len(self.state['submissions']))
+        with open(self._requests_path(0), 'r') as source, open(requests_path, 'w') as output:
+            for line in source:
+                if line.strip() and json.loads(line)['custom_id'] in failed:
+                    output.write(line)
+        return self._submit_file(backend, requests_path, sorted(failed))
+
+    def merge(self, sheets_api, report_store=None):
+        """
+        Write collected reports back to the sheet and optionally a report store
+
+        Args:
+            sheets_api (SheetsAPI): Sheets API used for write-back
+            report_store (callable, optional): Called as
+                report_store(title=..., description=..., report_content=..., report_data=...,
+                structured_report=...) for every completed row, e.g. direct_save.direct_save_to_firestore
+
+        Returns:
+            tuple: (success (bool), message (str))
+        """
+        completed = [item for item in self.state['items'].values()
+                     if item['status'] == 'completed' and not item.get('merged')]
+        if not completed:
+            return True, "No new results to merge"
+
+        col_index = self.state.get('analysis_col_index')
+        if col_index is not None and self.state.get('sheet_url'):
+            sheet = sheets_api.open_sheet_by_url(self.state['sheet_url'])
+            worksheet = sheets_api.get_worksheet_by_name(sheet, self.state['worksheet_name']) if sheet else None
+            if not worksheet:
+                return False, "Failed to open worksheet for write-back"
+            reports_by_row = {item['row_index']: item['report'] for item in completed}
+            if not sheets_api.update_analysis_column(worksheet, reports_by_row, col_index):
+                return False, f"Failed to write {len(completed)} reports back to the sheet"
+
+        for item in completed:
+            if report_store is not None:
+                try:
+                    report_store(
+                        title=item['title'],
+                        description=item['video_data'].get('Caption', ''),
+                        report_content=item['report'],
+                        report_data=item['video_data'],
+                        structured_report=parse_report(item['report'])
+                    )
+                except Exception as e:
+                    print(f"Error saving report for row {item['row_index']}: {str(e)}")
+            item['merged'] = True
+
+        if all(item.get('merged') for item in self.state['items'].values()):
+            self.state['status'] = JOB_MERGED
+        self.save()
+        return True, f"Merged {len(completed)} reports"
+
+    def summary(self):
+        """Count items by status"""
+        counts = {'pending': 0, 'submitted': 0, 'completed': 0, 'failed': 0}
+        for item in self.state['items'].values():
+            counts[item['status']] = counts.get(item['status'], 0) + 1
+        return {
+            'job_id': self.job_id,
+            'status': self.state.get('status'),
+            'total': len(self.state['items']),
+            'outstanding': counts['pending'] + counts['submitted'],
+            **counts
+        }
+
+
+def list_jobs(jobs_dir=DEFAULT_JOBS_DIR):
+    """List the ids of all batch jobs on disk, newest first"""
+    if not os.path.isdir(jobs_dir):
+        return []
+    return sorted(
+        (name for name in os.listdir(jobs_dir) if os.path.exists(os.path.join(jobs_dir, name, "job.json"))),
+        reverse=True
+    )
@@ -0,0 +1,133 @@
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class BatchRunner:
+    """Run a worker function over many items concurrently, keeping input order"""
+
+    def __init__(self, max_workers=4, max_in_flight=None):
+        """
+        Initialize the batch runner
+
+        Args:
+            max_workers (int): Number of worker threads
+            max_in_flight (int, optional): Maximum number of submitted but unfinished
+                items. Defaults to twice the worker count.
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.max_in_flight = max(self.max_workers, int(max_in_flight or self.max_workers * 2))
+        self.last_stats = None
+
+    def run(self, items, worker_fn, progress_callback=None, result_callback=None):
+        """
+        Apply worker_fn to every item
+
+        Args:
+            items (list): Items to process
+            worker_fn (callable): Function called with a single item
+            progress_callback (callable, optional): Called as (completed, total) after each item
+            result_callback (callable, optional): Called with each result dict as soon as its
+                item finishes, from the worker thread, e.g. to checkpoint it
+
+        Returns:
+            list: One result dict per item, in input order, with keys
+                'index', 'value', 'error' and 'latency'
+        """
+        items = list(items)
+        total = len(items)
+        results = [None] * total
+        completed = 0
+        lock = threading.Lock()
+        started = time.perf_counter()
+
+        def _run_one(index, item):
+            row_started = time.perf_counter()
+            try:
+                value, error = worker_fn(item), None
+            except Exception as e:
+                value, error = None, str(e)
+            result = {
+                'index': index,
+                'value': value,
+                'error': error,
+                'latency': time.perf_counter() - row_started
+            }
+            if result_callback:
+                try:
+                    result_callback(result)
+                except Exception as e:
+                    print(f"Error in result callback: {str(e)}")
+            return result
+
+        def _finish(result):
+            nonlocal completed
+            with lock:
+                results[result['index']] = result
+                completed += 1
+                done = completed
+            if progress_callback:
+                try:
+                    progress_callback(done, total)
+                except Exception as e:
+                    print(f"Error in progress callback: {str(e)}")
+
+        if self.max_workers == 1:
+            for index, item in enumerate(items):
+                _finish(_run_one(index, item))
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                pending = set()
+                for index, item in enumerate(items):
+                    # Keep the number of in-flight requests bounded
+                    if len(pending) >= self.max_in_flight:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            _finish(future.result())
+                    # Run in a copy of the caller's context so context variables reach the workers
+                    pending.add(executor.submit(contextvars.copy_context().run, _run_one, index, item))
+
+                for future in pending:
+                    _finish(future.result())
+
+        self.last_stats = self._build_stats(results, time.perf_counter() - started)
+        return results
+
+    def _build_stats(self, results, wall_time):
+        """Summarize throughput and per-item latency for a finished batch"""
+        latencies = sorted(r['latency'] for r in results)
+        failed = [r['index'] for r in results if r['error'] is not None]
+
+        def _percentile(q):
+            if not latencies:
+                return 0.0
+            position = min(len(latencies) - 1, int(round(q * (len(latencies) - 1))))
+            return latencies[position]
+
+        return {
+            'total': len(results),
+            'succeeded': len(results) - len(failed),
+            'failed': len(failed),
+            'failed_indices': failed,
+            'workers': self.max_workers,
+            'wall_time': wall_time,
+            'throughput': len(results) / wall_time if wall_time > 0 else 0.0,
+            'latency_mean': sum(latencies) / len(latencies) if latencies else 0.0,
+            'latency_p50': _percentile(0.50),
+            'latency_p95': _percentile(0.95),
+            'latency_max': latencies[-1] if latencies else 0.0
+        }
+
+
+def format_batch_stats(stats):
+    """Format batch statistics as a one-line summary"""
+    if not stats:
+        return "No batch statistics available"
+    return (
+        f"{stats['succeeded']}/{stats['total']} succeeded ({stats['failed']} failed) "
+        f"in {stats['wall_time']:.1f}s with {stats['workers']} workers: "
+        f"{stats['throughput']:.2f} rows/s, latency mean {stats['latency_mean']:.2f}s, "
+        f"p50 {stats['latency_p50']:.2f}s, p95 {stats['latency_p95']:.2f}s, "
+        f"max {stats['latency_max']:.2f}s"
+    )
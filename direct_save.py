@@ -6,6 +6,7 @@ import json
 import datetime
 import streamlit as st
 import os
+from report_model import parse_report
 
 # Initialize Firebase connection
 def initialize_firebase():
@@ -65,7 +66,7 @@ def initialize_firebase():
         return None
 
 # Direct save function to be called from Streamlit
-def direct_save_to_firestore(title, description, report_content, report_data):
+def direct_save_to_firestore(title, description, report_content, report_data, structured_report=None):
     """
     Save report directly to Firestore
     
@@ -74,6 +75,7 @@ def direct_save_to_firestore(title, description, report_content, report_data):
         description (str): Report description
         report_content (str): The actual report text
         report_data (dict): Additional report data
+        structured_report (AnalysisReport, optional): Parsed report; parsed from report_content if omitted
         
     Returns:
         str: Report ID if successful, None otherwise
@@ -94,20 +96,25 @@ def direct_save_to_firestore(title, description, report_content, report_data):
         # Create the document in Firestore
         report_ref = db.collection('reports').document(report_id)
         
-        # Prepare the document data
+        # Prepare the document data, with the parsed report stored next to the raw text
+        structured_report = structured_report or parse_report(report_content)
+        query = json.dumps(report_data)
         doc_data = {
             'id': report_id,
             'title': title,
             'description': description,
-            'query': json.dumps(report_data),
+            'query': query,
+            'video': json.loads(query),
             'metrics': report_content,
+            'report': structured_report.to_dict(),
+            'viral_score': structured_report.viral_score,
             'created_at': firestore.SERVER_TIMESTAMP
         }
         
         # Write log entry with document data
         with open("save_attempts.log", "a") as log:
             log.write(f"{datetime.datetime.now().isoformat()} - Document data prepared for ID: {report_id}\n")
-            log.write(f"Data sizes: title={len(title)}, description={len(description)}, query={len(json.dumps(report_data))}, metrics={len(report_content)}\n")
+            log.write(f"Data sizes: title={len(title)}, description={len(description)}, query={len(query)}, metrics={len(report_content)}\n")
         
         # Save to Firestore
         report_ref.set(doc_data)
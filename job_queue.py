@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+# SQLite file shared by the app and every worker process on the host
+DEFAULT_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "job_queue.db")
+
+# Seconds without a heartbeat after which a running job is treated as abandoned
+STALE_JOB_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))
+
+# Attempts before an abandoned job is failed instead of queued again
+MAX_JOB_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress_done INTEGER NOT NULL DEFAULT 0,
+    progress_total INTEGER NOT NULL DEFAULT 0,
+    message TEXT,
+    result TEXT,
+    run_id TEXT,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobQueue:
+    """
+    Durable job queue in a local SQLite database
+
+    The Streamlit app enqueues jobs and polls them; worker processes claim
+    them one at a time. Claims run in an immediate transaction, so any
+    number of workers on the host can drain the queue without taking the
+    same job twice.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str, optional): Database file; defaults to JOB_QUEUE_PATH
+        """
+        self.path = path or DEFAULT_QUEUE_PATH
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call keeps the queue safe across threads and processes
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA busy_timeout=30000")
+            yield connection
+        finally:
+            connection.close()
+
+    def _row_to_job(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def enqueue(self, kind, params):
+        """
+        Add a job to the queue
+
+        Args:
+            kind (str): Job type understood by the worker, e.g. 'analyze_sheet'
+            params (dict): JSON-serializable job parameters
+
+        Returns:
+            str: Job id
+        """
+        job_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(params, default=str), JOB_QUEUED, time.time())
+            )
+        return job_id
+
+    def claim(self, worker):
+        """
+        Take the oldest queued job
+
+        Args:
+            worker (str): Id of the claiming worker
+
+        Returns:
+            dict or None: The claimed job, now running, or None if the queue is empty
+        """
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (JOB_QUEUED,)
+                ).fetchone()
+                if row is None:
+                    connection.execute("COMMIT")
+                    return None
+                now = time.time()
+                connection.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, started_at = ?, "
+                    "heartbeat_at = ?, message = NULL WHERE id = ?",
+                    (JOB_RUNNING, worker, now, now, row['id'])
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            return self._row_to_job(connection.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone())
+
+    def heartbeat(self, job_id):
+        """Mark a running job as alive"""
+        with self._connect() as connection:
+            connection.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def update_progress(self, job_id, done, total, message=None, run_id=None):
+        """Record the progress of a running job (also a heartbeat)"""
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET progress_done = ?, progress_total = ?, message = COALESCE(?, message), "
+                "run_id = COALESCE(?, run_id), heartbeat_at = ? WHERE id = ?",
+                (int(done), int(total), message, run_id, time.time(), job_id)
+            )
+
+    def complete(self, job_id, result=None, message=None, run_id=None):
+        """Mark a job as finished successfully"""
+        self._finish(job_id, JOB_COMPLETED, result, message, run_id)
+
+    def fail(self, job_id, message, result=None, run_id=None):
+        """Mark a job as failed"""
+        self._finish(job_id, JOB_FAILED, result, message, run_id)
+
+    def _finish(self, job_id, status, result, message, run_id):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, message = ?, run_id = COALESCE(?, run_id), "
+                "finished_at = ? WHERE id = ?",
+                (status, json.dumps(result, default=str) if result is not None else None, message, run_id,
+                 time.time(), job_id)
+            )
+
+    def release(self, job_id, message=None):
+        """Put a running job back in the queue, e.g. when its worker shuts down"""
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, message = ? WHERE id = ? AND status = ?",
+                (JOB_QUEUED, message, job_id, JOB_RUNNING)
+            )
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued job
+
+        Returns:
+            bool: True if the job was still queued and is now cancelled
+        """
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (JOB_CANCELLED, time.time(), job_id, JOB_QUEUED)
+            )
+            return cursor.rowcount == 1
+
+    def requeue_stale(self, stale_seconds=STALE_JOB_SECONDS, max_attempts=MAX_JOB_ATTEMPTS):
+        """
+        Recover running jobs whose worker stopped sending heartbeats
+
+        Jobs with attempts left go back to the queue (and resume their journaled
+        run); the others are failed.
+
+        Returns:
+            int: Number of jobs recovered or failed
+        """
+        cutoff = time.time() - stale_seconds
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                failed = connection.execute(
+                    "UPDATE jobs SET status = ?, message = ?, finished_at = ? "
+                    "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+                    (JOB_FAILED, "Worker stopped responding", time.time(), JOB_RUNNING, cutoff, max_attempts)
+                ).rowcount
+                requeued = connection.execute(
+                    "UPDATE jobs SET status = ?, worker = NULL, message = ? WHERE status = ? AND heartbeat_at < ?",
+                    (JOB_QUEUED, "Requeued after the worker stopped responding", JOB_RUNNING, cutoff)
+                ).rowcount
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return failed + requeued
+
+    def get(self, job_id):
+        """Get a job by id, or None"""
+        with self._connect() as connection:
+            return self._row_to_job(connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list_jobs(self, limit=20, statuses=None):
+        """
+        Get the most recent jobs
+
+        Args:
+            limit (int): Maximum number of jobs
+            statuses (iterable, optional): Only return jobs in these states
+
+        Returns:
+            list: Job dicts, newest first
+        """
+        query = "SELECT * FROM jobs"
+        args = []
+        if statuses:
+            statuses = list(statuses)
+            query += f" WHERE status IN ({', '.join('?' * len(statuses))})"
+            args.extend(statuses)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        args.append(int(limit))
+        with self._connect() as connection:
+            return [self._row_to_job(row) for row in connection.execute(query, args).fetchall()]
+
+    def counts(self):
+        """Number of jobs in each state"""
+        with self._connect() as connection:
+            return {row['status']: row['n'] for row in
+                    connection.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()}
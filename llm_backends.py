@@ -0,0 +1,377 @@
+import os
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from types import SimpleNamespace
+
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limiter import count_tokens
+
+# Keep-alive connections held open by the HTTP backends, shared by all worker threads
+LLM_HTTP_POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", "32"))
+
+
+class LLMBackendError(Exception):
+    """Error returned by an LLM backend, carrying the HTTP status when known"""
+
+    def __init__(self, message, status_code=None, response=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = response
+
+
+class LLMResponse:
+    """Backend-neutral result of a chat completion"""
+
+    def __init__(self, text, usage=None, model=None):
+        """
+        Args:
+            text (str): Completion text
+            usage (object, optional): Token usage with prompt_tokens, completion_tokens and total_tokens
+            model (str, optional): Model that produced the completion
+        """
+        self.text = text
+        self.usage = usage
+        self.model = model
+
+
+def _usage_from_dict(usage):
+    """Convert a usage mapping from a JSON response into an attribute object"""
+    if not usage:
+        return None
+    details = usage.get('prompt_tokens_details') or {}
+    return SimpleNamespace(
+        prompt_tokens=usage.get('prompt_tokens', 0),
+        completion_tokens=usage.get('completion_tokens', 0),
+        total_tokens=usage.get('total_tokens', 0),
+        prompt_tokens_details=SimpleNamespace(cached_tokens=details.get('cached_tokens', 0))
+    )
+
+
+class LLMBackend:
+    """Interface for chat completion providers used by OpenAIAPI"""
+
+    name = "base"
+
+    def complete(self, request):
+        """
+        Run a chat completion
+
+        Args:
+            request (dict): Chat completion parameters (model, messages, max_tokens, temperature)
+
+        Returns:
+            LLMResponse: The completion
+        """
+        raise NotImplementedError
+
+    def stream(self, request):
+        """
+        Open a streaming chat completion
+
+        Args:
+            request (dict): Chat completion parameters
+
+        Returns:
+            iterator: Yields completion text chunks as they arrive
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release pooled connections"""
+        pass
+
+
+class OpenAIBackend(LLMBackend):
+    """Backend using the official OpenAI client"""
+
+    name = "openai"
+
+    def __init__(self, api_key, base_url=None):
+        """
+        Args:
+            api_key (str): OpenAI API key
+            base_url (str, optional): Alternative API base URL
+        """
+        # RateLimitScheduler owns every retry, so each attempt passes through its RPM/TPM buckets
+        self.client = openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0) if base_url \
+            else openai.OpenAI(api_key=api_key, max_retries=0)
+
+    def complete(self, request):
+        response = self.client.chat.completions.create(**request)
+        return LLMResponse(
+            response.choices[0].message.content,
+            usage=getattr(response, 'usage', None),
+            model=getattr(response, 'model', None)
+        )
+
+    def stream(self, request):
+        response = self.client.chat.completions.create(stream=True, **request)
+        return self._iter_chunks(response)
+
+    def close(self):
+        self.client.close()
+
+    def _iter_chunks(self, response):
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                yield content
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Backend speaking the OpenAI chat completions protocol over plain HTTP"""
+
+    name = "compatible"
+
+    def __init__(self, base_url, api_key=None, timeout=120):
+        """
+        Args:
+            base_url (str): API base URL, e.g. http://localhost:8000/v1
+            api_key (str, optional): Bearer token, if the server needs one
+            timeout (float): Request timeout in seconds
+        """
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_HTTP_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers['Content-Type'] = 'application/json'
+        if api_key:
+            self.session.headers['Authorization'] = f"Bearer {api_key}"
+
+    def close(self):
+        self.session.close()
+
+    def _post(self, request, stream=False):
+        """POST a chat completion request and raise LLMBackendError on HTTP errors"""
+        try:
+            response = self.session.post(
+                f"{self.base_url}/chat/completions",
+                data=json.dumps(request),
+                timeout=self.timeout,
+                stream=stream
+            )
+        except requests.RequestException as e:
+            raise LLMBackendError(f"Request to {self.base_url} failed: {str(e)}", status_code=503)
+        if response.status_code != 200:
+            raise LLMBackendError(
+                f"HTTP {response.status_code}: {response.text[:200]}",
+                status_code=response.status_code,
+                response=response
+            )
+        return response
+
+    def complete(self, request):
+        data = self._post(request).json()
+        return LLMResponse(
+            data['choices'][0]['message']['content'],
+            usage=_usage_from_dict(data.get('usage')),
+            model=data.get('model')
+        )
+
+    def stream(self, request):
+        response = self._post({**request, 'stream': True}, stream=True)
+        return self._iter_events(response)
+
+    def _iter_events(self, response):
+        # Server-sent events: "data: {...}" lines, terminated by "data: [DONE]"
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            payload = line[len('data:'):].strip()
+            if payload == '[DONE]':
+                break
+            choices = json.loads(payload).get('choices') or []
+            content = choices[0].get('delta', {}).get('content') if choices else None
+            if content:
+                yield content
+
+
+DEFAULT_MOCK_REPORT = """1. Overview Summary
+This video found an audience quickly but did not give viewers a reason to stay, comment or save. The hook earns the first second; the rest of the video coasts.
+
+2. Detailed Metric Breakdown
+Views to Like: Solid initial resonance. Viewers liked what they saw in the first seconds.
+Views to Comment: Low. Nothing in the video invites a response or takes a side.
+Views to Save: Low. There is no lasting value that makes the video worth keeping.
+Like to Comment: Surface-level resonance: people enjoyed it but did not feel compelled to talk.
+Like to Save: Weak memory creation; the payoff is not memorable.
+
+3. Strengths Identified
+- A clear, curiosity-driven hook that stops the scroll.
+
+4. Weaknesses Identified
+- Flat emotional arc after the hook, so retention drops off.
+- The caption restates the video instead of adding tension.
+
+5. Actionable Improvements
+- Open with an emotional confrontation in the first 2 seconds.
+- End on an unresolved question to drive comments.
+- Suggested hashtags: #storytime #realtalk #lifelessons
+
+6. Viral Potential Score
+Viral Potential Score: 5/10. Good base engagement, but comments and saves are missing."""
+
+
+def parse_latency_spec(spec):
+    """
+    Parse a latency distribution
+
+    Args:
+        spec (str or tuple): 'fixed:SECONDS', 'uniform:LOW,HIGH', 'normal:MEAN,STD'
+            or 'lognormal:MEDIAN,SIGMA', or the same as a (kind, *params) tuple
+
+    Returns:
+        tuple: (kind, params)
+    """
+    if isinstance(spec, (int, float)):
+        return 'fixed', (float(spec),)
+    if isinstance(spec, str):
+        kind, _, params = spec.partition(':')
+        spec = (kind, *[float(p) for p in params.split(',') if p.strip()])
+    kind, params = spec[0], tuple(float(p) for p in spec[1:])
+    expected = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2}
+    if kind not in expected or len(params) != expected[kind]:
+        raise ValueError(f"Invalid latency distribution: {spec}")
+    return kind, params
+
+
+class MockBackend(LLMBackend):
+    """
+    In-process stand-in for an LLM provider, for load tests and offline runs
+
+    Latency is drawn from a configurable distribution, a share of requests
+    fail with throttling (429) or server (500) errors, and completions are
+    taken from a list of canned reports. Batch requests get a JSON array with
+    one canned report per video, as BATCH_FORMAT_INSTRUCTIONS asks for.
+    """
+
+    name = "mock"
+
+    def __init__(self, latency="lognormal:1.0,0.4", error_rate=0.0, throttle_rate=0.0, reports=None,
+                 stream_chunks=40, seed=None):
+        """
+        Args:
+            latency (str or tuple): Latency distribution, see parse_latency_spec
+            error_rate (float): Share of requests failing with HTTP 500
+            throttle_rate (float): Share of requests failing with HTTP 429
+            reports (list, optional): Canned reports; chosen deterministically per prompt
+            stream_chunks (int): Number of chunks a streamed report is split into
+            seed (int, optional): Seed for reproducible latency and failures
+        """
+        self.latency = parse_latency_spec(latency)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.reports = list(reports) if reports else [DEFAULT_MOCK_REPORT]
+        self.stream_chunks = max(1, stream_chunks)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _sample_latency(self):
+        kind, params = self.latency
+        with self._lock:
+            if kind == 'fixed':
+                value = params[0]
+            elif kind == 'uniform':
+                value = self._random.uniform(*params)
+            elif kind == 'normal':
+                value = self._random.gauss(*params)
+            else:
+                value = self._random.lognormvariate(math.log(max(params[0], 1e-6)), params[1])
+        return max(0.0, value)
+
+    def _maybe_fail(self):
+        with self._lock:
+            self.calls += 1
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            raise LLMBackendError("Mock rate limit exceeded", status_code=429)
+        if roll < self.throttle_rate + self.error_rate:
+            raise LLMBackendError("Mock server error", status_code=500)
+
+    def _pick_report(self, request):
+        prompt = request['messages'][-1]['content']
+        if any(str(m.get('content', '')).startswith("BATCH MODE:") for m in request['messages'][:-1]):
+            # Answer batch requests in the JSON format their instructions ask for, one report per video
+            sections = re.split(r'^ROW ID: ', prompt, flags=re.MULTILINE)[1:]
+            return json.dumps([
+                {"row_id": section.split("\n", 1)[0].strip(), "report": self._canned_report(section)}
+                for section in sections
+            ])
+        return self._canned_report(prompt)
+
+    def _canned_report(self, prompt):
+        digest = int(hashlib.md5(prompt.encode('utf-8')).hexdigest(), 16)
+        return self.reports[digest % len(self.reports)]
+
+    def _usage(self, request, text):
+        prompt_tokens = sum(count_tokens(m.get('content')) for m in request.get('messages', []))
+        completion_tokens = count_tokens(text)
+        return SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=0)
+        )
+
+    def complete(self, request):
+        latency = self._sample_latency()
+        self._maybe_fail()
+        time.sleep(latency)
+        text = self._pick_report(request)
+        return LLMResponse(text, usage=self._usage(request, text), model=request.get('model'))
+
+    def stream(self, request):
+        self._maybe_fail()
+        return self._iter_chunks(request, self._sample_latency())
+
+    def _iter_chunks(self, request, latency):
+        text = self._pick_report(request)
+        size = max(1, len(text) // self.stream_chunks)
+        for start in range(0, len(text), size):
+            time.sleep(latency / self.stream_chunks)
+            yield text[start:start + size]
+
+
+def create_backend_from_env():
+    """
+    Create the backend selected by the LLM_BACKEND environment variable
+
+    LLM_BACKEND=openai (default) uses OPENAI_API_KEY; 'compatible' posts to
+    LLM_BASE_URL; 'mock' uses MOCK_LLM_LATENCY, MOCK_LLM_ERROR_RATE and
+    MOCK_LLM_THROTTLE_RATE.
+
+    Returns:
+        LLMBackend: The backend, or None if it is not configured
+    """
+    kind = os.getenv("LLM_BACKEND", "openai").lower()
+    if kind == "mock":
+        return MockBackend(
+            latency=os.getenv("MOCK_LLM_LATENCY", "lognormal:1.0,0.4"),
+            error_rate=float(os.getenv("MOCK_LLM_ERROR_RATE", "0")),
+            throttle_rate=float(os.getenv("MOCK_LLM_THROTTLE_RATE", "0"))
+        )
+    if kind == "compatible":
+        base_url = os.getenv("LLM_BASE_URL")
+        if not base_url:
+            print("Error: LLM_BASE_URL not found in environment variables")
+            return None
+        return OpenAICompatibleBackend(base_url, api_key=os.getenv("LLM_API_KEY"))
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        print("Error: OPENAI_API_KEY not found in environment variables")
+        return None
+    return OpenAIBackend(api_key)
@@ -0,0 +1,279 @@
+import json
+import time
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Latency buckets in seconds and token-count buckets for the histograms
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 1500, 2000, 4000, 8000, 16000)
+
+# Approximate USD prices per 1K tokens as (prompt, completion)
+MODEL_PRICING = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015)
+}
+
+# Labels (e.g. sheet and batch) attached to every call made inside call_context()
+_call_labels = contextvars.ContextVar("llm_call_labels", default={})
+
+
+@contextmanager
+def call_context(**labels):
+    """
+    Attach labels such as sheet or batch to the LLM calls made inside the block
+
+    Example:
+        with call_context(sheet="Account A Data", batch="20240101_1200"):
+            analyzer.analyze_videos(...)
+    """
+    token = _call_labels.set({**_call_labels.get(), **{k: str(v) for k, v in labels.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _call_labels.reset(token)
+
+
+def current_labels():
+    """Get the labels of the enclosing call_context()"""
+    return dict(_call_labels.get())
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Estimate the USD cost of a call, or 0 for unknown models"""
+    prices = MODEL_PRICING.get(model)
+    if prices is None:
+        # Match dated or suffixed variants such as gpt-4-0613
+        prices = next((p for name, p in sorted(MODEL_PRICING.items(), key=lambda i: -len(i[0]))
+                       if model and model.startswith(name)), (0.0, 0.0))
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1000.0
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating within its bucket"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, bound in enumerate(self.buckets):
+            if seen + self.counts[i] >= target:
+                fraction = (target - seen) / self.counts[i] if self.counts[i] else 0.0
+                return lower + (bound - lower) * fraction
+            seen += self.counts[i]
+            lower = bound
+        return self.buckets[-1]
+
+    def to_dict(self):
+        return {
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts)),
+            'sum': self.sum,
+            'count': self.count,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99)
+        }
+
+
+class MetricsRegistry:
+    """In-process counters and histograms for LLM calls"""
+
+    def __init__(self, recent_size=500, max_contexts=200):
+        """
+        Args:
+            recent_size (int): Number of recent call records kept for inspection
+            max_contexts (int): Number of sheet/batch groups kept in the per-context totals
+        """
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=recent_size)
+        self.max_contexts = max_contexts
+        self.reset()
+
+    def reset(self):
+        """Clear all metrics"""
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self.contexts = OrderedDict()
+            self.recent.clear()
+
+    def _inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def _observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(buckets)
+        self.histograms[key].observe(value)
+
+    def record_call(self, model, outcome, wall_time, queue_time=0.0, prompt_tokens=0, completion_tokens=0,
+                    retries=0, kind="completion", error=None):
+        """
+        Record one LLM call
+
+        Args:
+            model (str): Model name
+            outcome (str): 'success', 'error', 'cache_hit' or 'coalesced'
+            wall_time (float): Total seconds including queueing and retries
+            queue_time (float): Seconds spent waiting on the rate limiter
+            prompt_tokens (int): Prompt tokens reported by the API
+            completion_tokens (int): Completion tokens reported by the API
+            retries (int): Number of retried attempts
+            kind (str): 'completion', 'stream' or 'batch'
+            error (str, optional): Error message for failed calls
+        """
+        context = current_labels()
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+        record = {
+            'timestamp': time.time(),
+            'model': model,
+            'kind': kind,
+            'outcome': outcome,
+            'wall_time': wall_time,
+            'queue_time': queue_time,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'retries': retries,
+            'cost_usd': cost,
+            'error': error,
+            **context
+        }
+        labels = {'model': model, 'kind': kind}
+
+        with self._lock:
+            self.recent.append(record)
+            self._inc('llm_calls_total', {**labels, 'outcome': outcome})
+            if outcome in ('cache_hit', 'coalesced'):
+                # No upstream request was made
+                return
+            self._inc('llm_retries_total', labels, retries)
+            self._inc('llm_tokens_total', {**labels, 'type': 'prompt'}, prompt_tokens)
+            self._inc('llm_tokens_total', {**labels, 'type': 'completion'}, completion_tokens)
+            self._inc('llm_cost_usd_total', labels, cost)
+            self._observe('llm_call_duration_seconds', labels, wall_time, LATENCY_BUCKETS)
+            self._observe('llm_queue_seconds', labels, queue_time, LATENCY_BUCKETS)
+            if outcome == 'success':
+                self._observe('llm_prompt_tokens', labels, prompt_tokens, TOKEN_BUCKETS)
+                self._observe('llm_completion_tokens', labels, completion_tokens, TOKEN_BUCKETS)
+
+            # Totals per sheet and batch, to find cost hotspots
+            context_key = (context.get('sheet', ''), context.get('batch', ''))
+            totals = self.contexts.pop(context_key, None) or {
+                'sheet': context_key[0], 'batch': context_key[1], 'calls': 0, 'errors': 0,
+                'wall_time': 0.0, 'max_wall_time': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cost_usd': 0.0
+            }
+            totals['calls'] += 1
+            totals['errors'] += outcome == 'error'
+            totals['wall_time'] += wall_time
+            totals['max_wall_time'] = max(totals['max_wall_time'], wall_time)
+            totals['prompt_tokens'] += prompt_tokens
+            totals['completion_tokens'] += completion_tokens
+            totals['cost_usd'] += cost
+            self.contexts[context_key] = totals
+            while len(self.contexts) > self.max_contexts:
+                self.contexts.popitem(last=False)
+
+    def summary(self):
+        """Headline numbers across all models, for display"""
+        with self._lock:
+            calls = sum(v for (name, _), v in self.counters.items() if name == 'llm_calls_total')
+            errors = sum(v for (name, labels), v in self.counters.items()
+                         if name == 'llm_calls_total' and ('outcome', 'error') in labels)
+            cache_hits = sum(v for (name, labels), v in self.counters.items()
+                             if name == 'llm_calls_total' and ('outcome', 'cache_hit') in labels)
+            coalesced = sum(v for (name, labels), v in self.counters.items()
+                            if name == 'llm_calls_total' and ('outcome', 'coalesced') in labels)
+            tokens = sum(v for (name, _), v in self.counters.items() if name == 'llm_tokens_total')
+            cost = sum(v for (name, _), v in self.counters.items() if name == 'llm_cost_usd_total')
+            durations = Histogram(LATENCY_BUCKETS)
+            for (name, _), histogram in self.histograms.items():
+                if name == 'llm_call_duration_seconds':
+                    durations.counts = [a + b for a, b in zip(durations.counts, histogram.counts)]
+                    durations.count += histogram.count
+                    durations.sum += histogram.sum
+            return {
+                'calls': calls,
+                'errors': errors,
+                'cache_hits': cache_hits,
+                'coalesced': coalesced,
+                'tokens': tokens,
+                'cost_usd': cost,
+                'latency_p50': durations.quantile(0.5),
+                'latency_p95': durations.quantile(0.95),
+                'latency_mean': durations.sum / durations.count if durations.count else 0.0
+            }
+
+    def slowest(self, count=10):
+        """The slowest recent calls"""
+        with self._lock:
+            return sorted(self.recent, key=lambda r: r['wall_time'], reverse=True)[:count]
+
+    def to_json(self):
+        """Export all metrics as a JSON string"""
+        with self._lock:
+            return json.dumps({
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                'histograms': [{'name': name, 'labels': dict(labels), **histogram.to_dict()}
+                               for (name, labels), histogram in sorted(self.histograms.items(), key=lambda i: i[0])],
+                'contexts': list(self.contexts.values()),
+                'recent': list(self.recent)
+            }, indent=2, default=str)
+
+    def to_prometheus(self):
+        """Export all metrics in the Prometheus text exposition format"""
+
+        def _labels(pairs, extra=None):
+            items = list(pairs) + list((extra or {}).items())
+            if not items:
+                return ''
+            escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+            return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (histogram_name, labels), histogram in sorted(self.histograms.items(), key=lambda i: i[0]):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels, {'le': bound})} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by every OpenAIAPI instance
+metrics = MetricsRegistry()
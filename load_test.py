@@ -0,0 +1,137 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+
+import pandas as pd
+
+from account_baselines import AccountBaselines
+from analysis_cache import AnalysisCache
+from analyzer import TikTokAnalyzer
+from llm_backends import MockBackend, OpenAICompatibleBackend
+from mock_llm_server import start_mock_server
+from openai_api import OpenAIAPI
+from rate_limiter import RateLimitScheduler
+from triage import TRIAGE_POLICIES
+
+
+def make_sheet(count, seed=0):
+    """Generate a synthetic worksheet frame with the columns of the sheet template"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        views = rng.randint(100, 500000)
+        likes = int(views * rng.uniform(0.005, 0.15))
+        rows.append({
+            "Title/Hook": f"Synthetic video {i}",
+            "Caption": "A caption that could be better",
+            "Hashtags": "#fyp #storytime",
+            "Notes (Topic/Emotion)": "",
+            "Views (24h)": views,
+            "Likes": likes,
+            "Comments": int(likes * rng.uniform(0.01, 0.2)),
+            "Saves": int(likes * rng.uniform(0.01, 0.3))
+        })
+    return pd.DataFrame(rows)
+
+
+class FakeSheetsAPI:
+    """In-memory stand-in for SheetsAPI serving one synthetic worksheet"""
+
+    def __init__(self, df, latency=0.0):
+        """
+        Args:
+            df (pandas.DataFrame): Worksheet rows
+            latency (float): Seconds added to every read and write, like a Sheets API round trip
+        """
+        self.df = df
+        self.latency = latency
+        self.writes = 0
+        self.written_rows = 0
+
+    def open_sheet_by_url(self, sheet_url):
+        time.sleep(self.latency)
+        return sheet_url
+
+    def get_worksheet_by_name(self, sheet, worksheet_name):
+        return worksheet_name
+
+    def get_typed_dataframe(self, worksheet, schema, arrow=None):
+        time.sleep(self.latency)
+        return self.df.reindex(columns=[column for column in schema if column in self.df.columns])
+
+    def update_analysis_column(self, worksheet, analysis_data, analysis_col_index):
+        time.sleep(self.latency)
+        self.writes += 1
+        self.written_rows += len(analysis_data)
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark analyze_videos against a mock LLM backend and an in-memory sheet")
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--videos-per-request", type=int, default=1)
+    parser.add_argument("--latency", default="lognormal:0.5,0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=100000)
+    parser.add_argument("--tpm", type=int, default=100000000)
+    parser.add_argument("--sheet-latency", type=float, default=0.0, help="Seconds per simulated Sheets API call")
+    parser.add_argument("--triage-policy", choices=TRIAGE_POLICIES, default="all")
+    parser.add_argument("--write-every", type=int, default=None, help="Rows per incremental sheet write")
+    parser.add_argument("--no-checkpoint", action="store_true", help="Don't journal finished rows")
+    parser.add_argument("--http", action="store_true", help="Go through the OpenAI-compatible HTTP backend and a local mock server")
+    args = parser.parse_args()
+
+    mock = MockBackend(latency=args.latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate, seed=1)
+    server = None
+    backend = mock
+    if args.http:
+        server, base_url = start_mock_server(mock)
+        backend = OpenAICompatibleBackend(base_url)
+
+    openai_api = OpenAIAPI(
+        cache=AnalysisCache(enabled=False),
+        scheduler=RateLimitScheduler(rpm_limit=args.rpm, tpm_limit=args.tpm, base_delay=0.1, max_delay=2.0),
+        backend=backend
+    )
+    sheets_api = FakeSheetsAPI(make_sheet(args.rows), latency=args.sheet_latency)
+
+    # Run journals, sync state and baselines go to a scratch directory, away from real runs
+    with tempfile.TemporaryDirectory() as scratch:
+        cwd = os.getcwd()
+        os.chdir(scratch)
+        try:
+            analyzer = TikTokAnalyzer(sheets_api, openai_api,
+                                      baselines=AccountBaselines(os.path.join(scratch, "account_baselines.json")))
+            started = time.perf_counter()
+            success, message, reports = analyzer.analyze_videos(
+                "load-test", "Synthetic Data",
+                analysis_col_index=13,
+                max_workers=args.workers,
+                use_cache=False,
+                videos_per_request=args.videos_per_request,
+                triage_policy=args.triage_policy,
+                checkpoint=not args.no_checkpoint,
+                write_every=args.write_every
+            )
+            elapsed = time.perf_counter() - started
+        finally:
+            os.chdir(cwd)
+
+    print(message)
+    stats = analyzer.last_batch_stats
+    if success and stats:
+        print(f"Rows: {stats['rows']}, failed rows: {stats['failed_rows']}, "
+              f"backend calls: {mock.calls}, throttled retries: {openai_api.scheduler.throttled}")
+    print(f"End to end: {elapsed:.2f}s for {args.rows} sheet rows ({len(reports)} analyzed), "
+          f"{sheets_api.writes} sheet writes covering {sheets_api.written_rows} rows")
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
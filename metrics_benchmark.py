@@ -0,0 +1,93 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from video_metrics import compute_metrics, compute_video_metrics
+
+
+def make_frame(rows, seed=0, raw=False):
+    """
+    Generate a synthetic worksheet frame
+
+    Args:
+        rows (int): Number of rows
+        seed (int): Random seed
+        raw (bool): Mimic formatted sheet values (numbers as text, blank cells) instead of typed columns
+    """
+    rng = np.random.default_rng(seed)
+    views = rng.integers(0, 500000, rows)
+    likes = (views * rng.uniform(0.005, 0.15, rows)).astype(int)
+    df = pd.DataFrame({
+        'Title/Hook': [f"Synthetic video {i}" for i in range(rows)],
+        'Caption': "A caption that could be better",
+        'Hashtags': "#fyp #storytime",
+        'Notes (Topic/Emotion)': "",
+        'Views (24h)': views,
+        'Likes': likes,
+        'Comments': (likes * rng.uniform(0.01, 0.2, rows)).astype(int),
+        'Saves': (likes * rng.uniform(0.01, 0.3, rows)).astype(int)
+    })
+    if raw:
+        for column in ['Views (24h)', 'Likes', 'Comments', 'Saves']:
+            values = df[column].astype(str).astype(object)
+            values[rng.random(rows) < 0.01] = ""
+            df[column] = values
+        df.loc[rng.random(rows) < 0.05, 'Caption'] = None
+    return df
+
+
+def legacy_metrics(df):
+    """The previous _preprocess_data + _calculate_missing_ratios pipeline, for comparison"""
+    df = df.copy()
+    for col in ['Views (24h)', 'Likes', 'Comments', 'Saves']:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    for col in ['Title/Hook', 'Caption', 'Hashtags', 'Notes (Topic/Emotion)']:
+        if col in df.columns:
+            df[col] = df[col].fillna('')
+
+    for col in ['Views (24h)', 'Likes', 'Comments', 'Saves']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    df['Views to Like Ratio (%)'] = (df['Likes'] / df['Views (24h)'] * 100).round(2)
+    df['Views to Comment Ratio (%)'] = (df['Comments'] / df['Views (24h)'] * 100).round(2)
+    df['Views to Save Ratio (%)'] = (df['Saves'] / df['Views (24h)'] * 100).round(2)
+    df['Like to Comment Ratio (%)'] = (df['Comments'] / df['Likes'] * 100).round(2).replace([float('inf'), float('nan')], 0)
+    df['Like to Save Ratio (%)'] = (df['Saves'] / df['Likes'] * 100).round(2).replace([float('inf'), float('nan')], 0)
+    return df
+
+
+def best_of(fn, repeat):
+    """Fastest of several timed runs, in seconds"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the video metric pipeline")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for label, raw in (("typed columns", False), ("raw sheet values", True)):
+        df = make_frame(args.rows, raw=raw)
+        legacy = best_of(lambda: legacy_metrics(df), args.repeat)
+        kernel = best_of(lambda: compute_metrics(df), args.repeat)
+        print(f"{label:>17}: legacy {legacy * 1000:8.1f} ms | compute_metrics {kernel * 1000:8.1f} ms "
+              f"| {legacy / kernel:5.1f}x")
+
+    video = {"Title": "Synthetic video", "Views": 1200, "Likes": 90, "Comments": 4, "Saves": 7}
+    count = 2000
+    frame_path = best_of(lambda: [compute_metrics(pd.DataFrame([video])).iloc[0].to_dict() for _ in range(count)], 1)
+    dict_path = best_of(lambda: [compute_video_metrics(video) for _ in range(count)], 1)
+    print(f"{'single video':>17}: one-row frame {frame_path / count * 1e6:8.1f} us | "
+          f"compute_video_metrics {dict_path / count * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import json
+import time
+import threading
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_backends import MockBackend, LLMBackendError
+
+
+def _make_handler(backend):
+    """Build a request handler class serving completions from a MockBackend"""
+
+    class MockCompletionsHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            # Keep load tests quiet
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self._send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            stream = request.pop('stream', False)
+
+            try:
+                if stream:
+                    self._stream(request)
+                else:
+                    response = backend.complete(request)
+                    usage = response.usage
+                    self._send_json(200, {
+                        'id': f"mock-{time.time_ns()}",
+                        'object': 'chat.completion',
+                        'model': response.model,
+                        'choices': [{'index': 0, 'finish_reason': 'stop',
+                                     'message': {'role': 'assistant', 'content': response.text}}],
+                        'usage': {'prompt_tokens': usage.prompt_tokens,
+                                  'completion_tokens': usage.completion_tokens,
+                                  'total_tokens': usage.total_tokens}
+                    })
+            except LLMBackendError as e:
+                headers = {'Retry-After': '1'} if e.status_code == 429 else None
+                self._send_json(e.status_code or 500, {'error': {'message': str(e)}}, headers)
+
+        def _stream(self, request):
+            chunks = backend.stream(request)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for content in chunks:
+                event = {'choices': [{'index': 0, 'delta': {'content': content}}]}
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+    return MockCompletionsHandler
+
+
+def start_mock_server(backend=None, host="127.0.0.1", port=0):
+    """
+    Start an OpenAI-compatible mock server on a background thread
+
+    Args:
+        backend (MockBackend, optional): Backend producing the completions
+        host (str): Interface to bind
+        port (int): Port to bind; 0 picks a free port
+
+    Returns:
+        tuple: (server, base_url); call server.shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), _make_handler(backend or MockBackend()))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve mock chat completions for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="lognormal:1.0,0.4", help="e.g. fixed:0.5, uniform:0.2,2, lognormal:1.0,0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    backend = MockBackend(latency=args.latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate)
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(backend))
+    print(f"Mock LLM server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
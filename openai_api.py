@@ -1,206 +1,681 @@
-import openai
 import os
+import time
+import textwrap
+import threading
+import json
+import re
+import jsonschema
 from dotenv import load_dotenv
+from analysis_cache import AnalysisCache, make_cache_key
+from rate_limiter import count_tokens, estimate_tokens, get_default_scheduler
+from llm_backends import create_backend_from_env
+from llm_metrics import metrics
+from single_flight import analysis_flights
+from account_baselines import PERCENTILE_COLUMNS
 
 # Load environment variables
 load_dotenv()
 
-class OpenAIAPI:
-    def __init__(self):
-        """Initialize the OpenAI API connection"""
-        try:
-            # Get API key from environment variable
-            api_key = os.getenv("OPENAI_API_KEY")
-            
-            if not api_key:
-                print("Error: OPENAI_API_KEY not found in environment variables")
-                self.connected = False
-                return
-                
-            # Initialize OpenAI client using the newer client version
-            self.client = openai.OpenAI(api_key=api_key)
-            self.connected = True
-            print("OpenAI API successfully connected")
-        except Exception as e:
-            print(f"Error initializing OpenAI API: {str(e)}")
-            self.connected = False
-            
-    def is_connected(self):
-        """Check if API connection is established"""
-        return self.connected
-    
-    def generate_analysis(self, video_data):
-        """
-        Generate a detailed analysis report for a TikTok video
-        
-        Args:
-            video_data (dict): Dictionary containing video metrics and details
-            
-        Returns:
-            str: The generated analysis report
-        """
-        try:
-            # Prepare the prompt with video data
-            prompt = self._create_prompt(video_data)
-            
-            # Call OpenAI API using the newer client version
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert TikTok content strategist, data analyst, and viral growth consultant."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1500,
-                temperature=0.7
-            )
-            
-            # Extract and return the response text using the new response format
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"Error generating analysis: {str(e)}")
-            return f"Error generating analysis: {str(e)}"
-            
-    def _create_prompt(self, video_data):
-        """Create a detailed prompt for the OpenAI API"""
-        # Use the sheet's actual column names
-        views_to_like = video_data.get('Views to Like Ratio (%)', video_data.get('Like-to-View Ratio (%)', 'N/A'))
-        views_to_comment = video_data.get('Views to Comment Ratio (%)', video_data.get('Comment-to-View Ratio (%)', 'N/A'))
-        views_to_save = video_data.get('Views to Save Ratio (%)', video_data.get('Save-to-View Ratio (%)', 'N/A'))
-        like_to_comment = video_data.get('Like to Comment Ratio (%)', video_data.get('Comment-to-Like Ratio (%)', 'N/A'))
-        like_to_save = video_data.get('Like to Save Ratio (%)', video_data.get('Save-to-Like Ratio (%)', 'N/A'))
-        
-        prompt = f"""
-        SYSTEM ROLE:
-        You are an expert TikTok content strategist, data analyst, and viral growth consultant.
-        Your job is to deeply analyze the performance of each TikTok video based on provided performance data and storytelling structure.
-        Your analysis must be specific, reflective, and actionable — focused on improving future content to maximize virality.
+# Static analyst instructions, shared verbatim by every request so the provider
+# can reuse its cached prefix across a batch
+SYSTEM_PROMPT = textwrap.dedent("""
+    SYSTEM ROLE:
+    You are an expert TikTok content strategist, data analyst, and viral growth consultant.
+    Your job is to deeply analyze the performance of each TikTok video based on provided performance data and storytelling structure.
+    Your analysis must be specific, reflective, and actionable — focused on improving future content to maximize virality.
 
-        DATA PROVIDED:
+    The user message contains the DATA PROVIDED for one video: title, hook, caption, hashtags, views, likes, comments, saves and the five engagement ratios. If no separate Hook is given, the Title is also the hook.
 
-        Title: {video_data.get('Title', 'N/A')}
+    TASK:
 
-        Hook: {video_data.get('Hook', 'N/A')}
+    Carefully review each metric individually and explain:
 
-        Caption: {video_data.get('Caption', 'N/A')}
+    What the metric reveals about the video
 
-        Hashtags: {video_data.get('Hashtags', 'N/A')}
+    Why it performed well or poorly
 
-        Views: {video_data.get('Views', 'N/A')}
+    Emotional or psychological causes if relevant
 
-        Likes: {video_data.get('Likes', 'N/A')}
+    Storytelling structure or hook/caption influence if relevant
 
-        Comments: {video_data.get('Comments', 'N/A')}
+    Analyze metrics collectively:
 
-        Saves: {video_data.get('Saves', 'N/A')}
+    Cross-reference patterns between metrics
 
-        Views to Like Ratio (%): {views_to_like}
+    Identify contradictions (e.g., good likes but poor saves = surface-level content)
 
-        Views to Comment Ratio (%): {views_to_comment}
+    Detect whether audience resonance was emotional, intellectual, practical, or missing
 
-        Views to Save Ratio (%): {views_to_save}
+    FINAL REPORT STRUCTURE:
 
-        Like to Comment Ratio (%): {like_to_comment}
+    1. Overview Summary
+    Write a human-like paragraph summarizing how the video performed overall — strengths, weaknesses, general vibe.
 
-        Like to Save Ratio (%): {like_to_save}
+    2. Detailed Metric Breakdown
+    For each metric (Views to Like, Views to Comment, Views to Save, Like to Comment, Like to Save):
 
-        TASK:
+    What does the metric reveal?
 
-        Carefully review each metric individually and explain:
+    Why is it good or bad based on TikTok audience psychology?
 
-        What the metric reveals about the video
+    How does it affect virality potential?
 
-        Why it performed well or poorly
+    3. Strengths Identified
+    List what worked well (hook type, emotional tension, storytelling, topic choice, thumbnail if applicable)
 
-        Emotional or psychological causes if relevant
+    Link each strength back to its impact on engagement or retention
 
-        Storytelling structure or hook/caption influence if relevant
+    4. Weaknesses Identified
+    List where the video fell short (hook weakness, caption issues, emotional flatness, bad pacing, etc.)
 
-        Analyze metrics collectively:
+    Explain WHY these weaknesses likely caused performance issues
 
-        Cross-reference patterns between metrics
+    5. Actionable Improvements
+    Specific, tactical advice for the next videos
 
-        Identify contradictions (e.g., good likes but poor saves = surface-level content)
+    Focus especially on improving hook emotionality, storytelling structure, pacing, and memorability
 
-        Detect whether audience resonance was emotional, intellectual, practical, or missing
+    6. Viral Potential Score (Optional)
+    Score the video 0–10 based on current performance indicators and storytelling power.
 
-        FINAL REPORT STRUCTURE:
+    Briefly explain your score.
 
-        1. Overview Summary
-        Write a human-like paragraph summarizing how the video performed overall — strengths, weaknesses, general vibe.
+    RULES YOU MUST FOLLOW:
 
-        2. Detailed Metric Breakdown
-        For each metric (Views to Like, Views to Comment, Views to Save, Like to Comment, Like to Save):
+    Be brutally honest if the video is weak. No fake positivity.
 
-        What does the metric reveal?
+    Always back up claims with logical explanation.
 
-        Why is it good or bad based on TikTok audience psychology?
+    Do not offer vague advice ("make it better"); be specific ("add an emotional confrontation in first 2 seconds").
 
-        How does it affect virality potential?
+    Always connect analysis back to goal: helping the creator achieve virality through emotional connection, higher retention, saves, and shares.
 
-        3. Strengths Identified
-        List what worked well (hook type, emotional tension, storytelling, topic choice, thumbnail if applicable)
+    Keep language human, friendly but expert — no robotic summaries.
 
-        Link each strength back to its impact on engagement or retention
+    ADDITIONAL ANALYSIS RULES TO FOLLOW:
 
-        4. Weaknesses Identified
-        List where the video fell short (hook weakness, caption issues, emotional flatness, bad pacing, etc.)
+    If Views to Like Ratio > 6%, recognize strong initial resonance.
 
-        Explain WHY these weaknesses likely caused performance issues
+    When account percentiles are provided, judge each metric against the creator's own history as well as the fixed thresholds: a percentile of 80 means the video beat 80% of that account's videos on that metric.
 
-        5. Actionable Improvements
-        Specific, tactical advice for the next videos
+    If Likes are high but Comments/Saves are low, describe the video as "surface-level resonance" — visually pleasing but not deeply emotional.
 
-        Focus especially on improving hook emotionality, storytelling structure, pacing, and memorability
+    If the topic is emotionally powerful (e.g., prayer, suffering, love, loss), critique execution, not topic choice, if performance is weak.
 
-        6. Viral Potential Score (Optional)
-        Score the video 0–10 based on current performance indicators and storytelling power.
+    Always recommend specific, tactical improvements (not vague advice) — suggest exact hook types, emotional techniques, or ending strategies.
 
-        Briefly explain your score.
+    Score each video dynamically:
+    - Strong Likes = Good base
+    - Strong Comments = Emotional success
+    - Strong Saves = Long-term memory creation
+    - Lack of all three = Very low viral score
 
-        RULES YOU MUST FOLLOW:
+    Always tie all analysis back to the goal: Maximizing virality through emotional connection, high retention, and rewatch value.
 
-        Be brutally honest if the video is weak. No fake positivity.
+    ADDITIONAL CONTENT IMPROVEMENT RULES:
 
-        Always back up claims with logical explanation.
+    Carefully evaluate the caption:
+    - If the caption is weak, generic, or lacks emotional pull, explain why it's weak.
+    - Then suggest a stronger alternative caption that would emotionally resonate more or increase curiosity.
 
-        Do not offer vague advice ("make it better"); be specific ("add an emotional confrontation in first 2 seconds").
+    Carefully evaluate the hashtags:
+    - If the hashtags are too broad, irrelevant, or weak for virality, explain why.
+    - Then suggest a better set of 3–5 hashtags that would:
+      - Target the right audience
+      - Increase discoverability
+      - Stay niche enough to reach emotionally connected viewers.
 
-        Always connect analysis back to goal: helping the creator achieve virality through emotional connection, higher retention, saves, and shares.
+    All caption and hashtag suggestions must be tailored to the topic and emotional tone of the video — no random or unrelated recommendations.
+""").strip()
 
-        Keep language human, friendly but expert — no robotic summaries.
-        
-        ADDITIONAL ANALYSIS RULES TO FOLLOW:
 
-        If Views to Like Ratio > 6%, recognize strong initial resonance.
+# Output format for multi-video requests, sent as a second system message so the
+# SYSTEM_PROMPT prefix stays identical to single-video requests
+BATCH_FORMAT_INSTRUCTIONS = textwrap.dedent("""
+    BATCH MODE:
+    The user message contains several videos, each introduced by a "ROW ID:" line followed by its DATA PROVIDED.
+    Write a complete, independent report for every video, following the FINAL REPORT STRUCTURE and all rules above.
+    Respond ONLY with a JSON array, one object per video, in this exact form:
+    [{"row_id": "<the ROW ID>", "report": "<the full report as plain text>"}]
+    Do not wrap the JSON in markdown fences and do not add any text outside the array.
+""").strip()
 
-        If Likes are high but Comments/Saves are low, describe the video as "surface-level resonance" — visually pleasing but not deeply emotional.
+# Schema every element of a batch response must satisfy
+BATCH_RESPONSE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "required": ["row_id", "report"],
+        "properties": {
+            "row_id": {"type": ["string", "integer"]},
+            "report": {"type": "string", "pattern": "\\S"}
+        }
+    }
+}
 
-        If the topic is emotionally powerful (e.g., prayer, suffering, love, loss), critique execution, not topic choice, if performance is weak.
+# Checks one element at a time, so a single malformed report doesn't discard the whole batch
+_batch_item_validator = jsonschema.Draft7Validator(BATCH_RESPONSE_SCHEMA["items"])
 
-        Always recommend specific, tactical improvements (not vague advice) — suggest exact hook types, emotional techniques, or ending strategies.
+# Default number of videos packed into one request
+DEFAULT_VIDEOS_PER_REQUEST = int(os.getenv("ANALYSIS_VIDEOS_PER_REQUEST", "1"))
 
-        Score each video dynamically:
-        - Strong Likes = Good base
-        - Strong Comments = Emotional success
-        - Strong Saves = Long-term memory creation
-        - Lack of all three = Very low viral score
+# (context window, completion limit) in tokens by model name prefix; the longest matching
+# prefix wins, and OPENAI_CONTEXT_TOKENS / OPENAI_MAX_OUTPUT_TOKENS override both
+MODEL_TOKEN_LIMITS = {
+    "gpt-4": (8192, 8192),
+    "gpt-4-32k": (32768, 32768),
+    "gpt-4-turbo": (128000, 4096),
+    "gpt-4-1106": (128000, 4096),
+    "gpt-4-0125": (128000, 4096),
+    "gpt-4o": (128000, 4096),
+    "gpt-4.1": (1047576, 32768),
+    "gpt-3.5-turbo": (16385, 4096)
+}
+DEFAULT_MODEL_TOKEN_LIMITS = (8192, 4096)
 
-        Always tie all analysis back to the goal: Maximizing virality through emotional connection, high retention, and rewatch value.
-        
-        ADDITIONAL CONTENT IMPROVEMENT RULES:
 
-        Carefully evaluate the caption:
-        - If the caption is weak, generic, or lacks emotional pull, explain why it's weak.
-        - Then suggest a stronger alternative caption that would emotionally resonate more or increase curiosity.
+def model_token_limits(model):
+    """
+    Look up the context window and completion limit of a model
 
-        Carefully evaluate the hashtags:
-        - If the hashtags are too broad, irrelevant, or weak for virality, explain why.
-        - Then suggest a better set of 3–5 hashtags that would:
-          - Target the right audience
-          - Increase discoverability
-          - Stay niche enough to reach emotionally connected viewers.
+    Returns:
+        tuple: (context tokens, maximum completion tokens)
+    """
+    prefixes = [prefix for prefix in MODEL_TOKEN_LIMITS if model.startswith(prefix)]
+    context, output = MODEL_TOKEN_LIMITS[max(prefixes, key=len)] if prefixes else DEFAULT_MODEL_TOKEN_LIMITS
+    context = int(os.getenv("OPENAI_CONTEXT_TOKENS", context))
+    output = int(os.getenv("OPENAI_MAX_OUTPUT_TOKENS", output))
+    return context, min(output, context)
+
+def _format_value(value):
+    """Render a video data value compactly for the user message"""
+    # Unwrap numpy scalars so they print like plain Python numbers
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float):
+        if value != value:
+            return 'N/A'
+
+        if value.is_integer():
+            return str(int(value))
+        return f"{value:.2f}"
+    text = str(value).strip()
+    return text if text else 'N/A'
+
+
+class StreamFailure(str):
+    """
+    Final chunk of a report stream that failed
+
+    Replaces whatever was streamed before it: partial text is not a report
+    and must not be joined with the error message.
+    """
 
-        All caption and hashtag suggestions must be tailored to the topic and emotional tone of the video — no random or unrelated recommendations.
+
+class OpenAIAPI:
+    def __init__(self, cache=None, scheduler=None, backend=None, model=None, flights=None):
         """
+        Initialize the OpenAI API connection
+        
+        Args:
+            cache (AnalysisCache, optional): Cache for generated reports
+            scheduler (RateLimitScheduler, optional): Rate limiter for API calls; defaults to
+                the process-wide scheduler
+            backend (LLMBackend, optional): Completion provider; defaults to the one selected
+                by the LLM_BACKEND environment variable
+            model (str, optional): Model name; defaults to OPENAI_MODEL or "gpt-4"
+            flights (SingleFlight, optional): Coalesces identical concurrent analyses; defaults
+                to the process-wide group so separate sessions share in-flight calls
+        """
+        self.model = model or os.getenv("OPENAI_MODEL", "gpt-4")
+        self.flights = flights if flights is not None else analysis_flights
+        self.max_tokens = 1500
+        self.context_tokens, self.max_output_tokens = model_token_limits(self.model)
+        self.temperature = 0.7
+        self.cache = cache if cache is not None else AnalysisCache()
+        self.scheduler = scheduler if scheduler is not None else get_default_scheduler()
+        self.last_usage = None
+        self.usage_totals = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_prompt_tokens": 0}
+        self._usage_lock = threading.Lock()
+        self.connect(backend)
+        
+    def connect(self, backend=None):
+        """
+        Set up the completion backend
+        
+        Args:
+            backend (LLMBackend, optional): Backend to use; defaults to the one selected
+                by the LLM_BACKEND environment variable
+            
+        Returns:
+            bool: True if a backend is available
+        """
+        self.client = None
+        try:
+            self.backend = backend if backend is not None else create_backend_from_env()
+            if self.backend is None:
+                self.connected = False
+                return False
+            
+            # The raw OpenAI client, when there is one (used by the Batch API backend)
+            self.client = getattr(self.backend, 'client', None)
+            self.connected = True
+            print(f"OpenAI API successfully connected ({self.backend.name} backend)")
+        except Exception as e:
+            print(f"Error initializing OpenAI API: {str(e)}")
+            self.backend = None
+            self.connected = False
+        return self.connected
+            
+    def is_connected(self):
+        """Check if API connection is established"""
+        return self.connected
+        
+    def check_health(self):
+        """Check that a backend is configured; failed calls surface through the metrics"""
+        return self.connected and self.backend is not None
+        
+    def refresh(self):
+        """Rebuild the backend from the environment, e.g. after the API key changed"""
+        old_backend = getattr(self, 'backend', None)
+        connected = self.connect()
+        # The old backend is unreachable now, even if reconnecting failed, so release its connections
+        if old_backend is not None and old_backend is not self.backend:
+            old_backend.close()
+        return connected
+    
+    def _build_request(self, video_data):
+        """Build the chat completion request parameters for a video"""
+        # Prepare the prompt with video data
+        prompt = self._create_prompt(video_data)
+        
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature
+        }
+    
+    def _record_usage(self, usage):
+        """Store the token usage reported for a completed request"""
+        if usage is None:
+            return
+        details = getattr(usage, 'prompt_tokens_details', None)
+        record = {
+            "prompt_tokens": getattr(usage, 'prompt_tokens', 0) or 0,
+            "completion_tokens": getattr(usage, 'completion_tokens', 0) or 0,
+            "total_tokens": getattr(usage, 'total_tokens', 0) or 0,
+            # Prompt tokens served from the provider's prefix cache
+            "cached_prompt_tokens": getattr(details, 'cached_tokens', 0) or 0
+        }
+        with self._usage_lock:
+            self.last_usage = record
+            self.usage_totals["requests"] += 1
+            for key in ("prompt_tokens", "completion_tokens", "cached_prompt_tokens"):
+                self.usage_totals[key] += record[key]
+    
+    def _complete(self, request, kind="completion"):
+        """
+        Run a completion through the rate limiter and record its metrics
+        
+        Args:
+            request (dict): Chat completion parameters
+            kind (str): Call kind for the metrics ('completion' or 'batch')
+            
+        Returns:
+            LLMResponse: The backend's response
+        """
+        started = time.perf_counter()
+        estimated = estimate_tokens(request)
+        call_info = {}
+        try:
+            response = self.scheduler.execute(lambda: self.backend.complete(request), estimated, call_info)
+        except Exception as e:
+            metrics.record_call(
+                self.model, 'error', time.perf_counter() - started,
+                queue_time=call_info.get('queue_time', 0.0),
+                retries=call_info.get('retries', 0),
+                kind=kind,
+                error=str(e)
+            )
+            raise
+        
+        self.scheduler.record_usage(estimated, getattr(response.usage, 'total_tokens', None))
+        self._record_usage(response.usage)
+        metrics.record_call(
+            self.model, 'success', time.perf_counter() - started,
+            queue_time=call_info.get('queue_time', 0.0),
+            prompt_tokens=getattr(response.usage, 'prompt_tokens', 0) or 0,
+            completion_tokens=getattr(response.usage, 'completion_tokens', 0) or 0,
+            retries=call_info.get('retries', 0),
+            kind=kind
+        )
+        return response
+    
+    def generate_analysis(self, video_data, raise_errors=False, use_cache=True):
+        """
+        Generate a detailed analysis report for a TikTok video
+        
+        Args:
+            video_data (dict): Dictionary containing video metrics and details
+            raise_errors (bool): Re-raise API errors instead of returning an error string
+            use_cache (bool): Serve and store the report through the analysis cache
+            
+        Returns:
+            str: The generated analysis report
+        """
+        try:
+            request = self._build_request(video_data)
+            cache_key = make_cache_key(request)
+            
+            # Return a previously generated report for an identical prompt
+            if use_cache:
+                cached_report = self.cache.get(cache_key)
+                if cached_report is not None:
+                    metrics.record_call(self.model, 'cache_hit', 0.0)
+                    return cached_report
+            
+            # Identical concurrent requests (other sessions or batch workers) share one call
+            started = time.time()
+            report, shared = self.flights.do(cache_key, lambda: self._generate_uncached(request, cache_key))
+            if shared:
+                metrics.record_call(self.model, 'coalesced', time.time() - started)
+            return report
+        except Exception as e:
+            print(f"Error generating analysis: {str(e)}")
+            if raise_errors:
+                raise
+            return f"Error generating analysis: {str(e)}"
+            
+    def _generate_uncached(self, request, cache_key):
+        """Call the backend through the rate limiter, retrying throttled requests, and cache the report"""
+        started = time.time()
+        report = self._complete(request).text
+        self.cache.set(cache_key, report, {"model": self.model, "duration": time.time() - started})
+        return report
+        
+    def _batch_section(self, row_id, video_data):
+        """User message section for one video of a batch"""
+        return f"ROW ID: {row_id}\n{self._create_prompt(video_data)}"
+    
+    def _build_batch_request(self, videos):
+        """Build a chat completion request covering several videos"""
+        request = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "system", "content": BATCH_FORMAT_INSTRUCTIONS},
+                {"role": "user", "content": "\n\n".join(self._batch_section(row_id, video_data)
+                                                         for row_id, video_data in videos)}
+            ],
+            "max_tokens": 0,
+            "temperature": self.temperature
+        }
+        # The completion budget must fit in the context next to the prompt
+        prompt_tokens = estimate_tokens(request)
+        request["max_tokens"] = max(0, min(self.max_tokens * len(videos), self.max_output_tokens,
+                                           self.context_tokens - prompt_tokens))
+        return request
+    
+    def _fit_batches(self, videos):
+        """
+        Split videos into groups whose packed request fits the model
+        
+        Every video needs its prompt section plus a full report's worth of
+        completion tokens, so a group is closed once the next video would
+        overflow the context window or the completion limit.
+        
+        Args:
+            videos (list): (row_id, video_data) pairs
+            
+        Returns:
+            list: Lists of (row_id, video_data); single-video groups are not worth packing
+        """
+        shared = estimate_tokens({"messages": [
+            {"content": SYSTEM_PROMPT}, {"content": BATCH_FORMAT_INSTRUCTIONS}, {"content": ""}
+        ]})
+        groups, group, used = [], [], shared
+        for row_id, video_data in videos:
+            needed = count_tokens(self._batch_section(row_id, video_data)) + 2 + self.max_tokens
+            completion = self.max_tokens * (len(group) + 1)
+            if group and (used + needed > self.context_tokens or completion > self.max_output_tokens):
+                groups.append(group)
+                group, used = [], shared
+            group.append((row_id, video_data))
+            used += needed
+        if group:
+            groups.append(group)
+        
+        if len(groups) > 1:
+            largest = max(len(group) for group in groups)
+            print(f"Batch of {len(videos)} videos exceeds the token limits of {self.model} "
+                  f"({self.context_tokens} context, {self.max_output_tokens} completion); "
+                  f"sending {len(groups)} requests of up to {largest} videos")
+        return groups
+    
+    def _parse_batch_response(self, text, expected_ids):
+        """
+        Parse and validate a batch response against BATCH_RESPONSE_SCHEMA
+        
+        Args:
+            text (str): Raw completion text
+            expected_ids (list): Row ids that were sent, as strings
+            
+        Returns:
+            dict: Report text per row id for every valid element; invalid or
+                unexpected elements are dropped
+        """
+        # Tolerate a markdown code fence around the JSON
+        text = re.sub(r'^\s*```(?:json)?\s*|\s*```\s*$', '', text or '')
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            print(f"Error parsing batch response as JSON: {str(e)}")
+            return {}
+        
+        if isinstance(data, dict):
+            # Some models wrap the array in an object
+            data = next((value for value in data.values() if isinstance(value, list)), [])
+        if not isinstance(data, list):
+            return {}
+        
+        reports = {}
+        for item in data:
+            if not _batch_item_validator.is_valid(item):
+                continue
+            row_id = str(item["row_id"])
+            if row_id in expected_ids:
+                reports[row_id] = item["report"].strip()
+        return reports
+    
+    def generate_batch_analysis(self, videos, use_cache=True):
+        """
+        Generate reports for several videos with a single API request
+        
+        Videos are split over several requests when one request could not hold
+        a full report for each of them within the model's token limits. Rows
+        missing or invalid in the JSON response, and rows that fit no batch,
+        are analyzed one at a time with generate_analysis.
+        
+        Args:
+            videos (list): (row_id, video_data) pairs
+            use_cache (bool): Serve and store per-video reports through the analysis cache
+            
+        Returns:
+            dict: Report text keyed by str(row_id); rows whose retry also failed
+                hold an "Error generating analysis: ..." message
+        """
+        videos = [(str(row_id), video_data) for row_id, video_data in videos]
+        reports = {}
+        
+        # Reports already cached for the single-video prompt need no request
+        cache_keys = {row_id: make_cache_key(self._build_request(video_data)) for row_id, video_data in videos}
+        pending = []
+        for row_id, video_data in videos:
+            cached_report = self.cache.get(cache_keys[row_id]) if use_cache else None
+            if cached_report is not None:
+                metrics.record_call(self.model, 'cache_hit', 0.0, kind="batch")
+                reports[row_id] = cached_report
+            else:
+                pending.append((row_id, video_data))
+        
+        # Pack only as many videos per request as the model can answer in full
+        for group in self._fit_batches(pending) if len(pending) > 1 else []:
+            if len(group) < 2:
+                continue
+            try:
+                response = self._complete(self._build_batch_request(group), kind="batch")
+                
+                parsed = self._parse_batch_response(
+                    response.text,
+                    [row_id for row_id, _ in group]
+                )
+                for row_id, report in parsed.items():
+                    reports[row_id] = report
+                    self.cache.set(cache_keys[row_id], report, {"model": self.model, "batched": True})
+            except Exception as e:
+                print(f"Error generating batch analysis: {str(e)}")
+        
+        # Fall back to individual requests for anything the batch didn't cover
+        for row_id, video_data in pending:
+            if row_id not in reports:
+                reports[row_id] = self.generate_analysis(video_data, use_cache=use_cache)
+        
+        return reports
+    
+    def generate_analysis_stream(self, video_data, raise_errors=False, use_cache=True):
+        """
+        Generate an analysis report, yielding text as it arrives from the API
+        
+        Args:
+            video_data (dict): Dictionary containing video metrics and details
+            raise_errors (bool): Re-raise API errors instead of yielding an error string
+            use_cache (bool): Serve and store the report through the analysis cache
+            
+        Yields:
+            str: Successive chunks of the report; joined they form the full report. If
+                the call fails and raise_errors is False, the last chunk is a StreamFailure
+                carrying the error, and any text yielded before it is an incomplete report.
+        """
+        try:
+            request = self._build_request(video_data)
+            cache_key = make_cache_key(request)
+            
+            # A cached report is available immediately, so yield it whole
+            if use_cache:
+                cached_report = self.cache.get(cache_key)
+                if cached_report is not None:
+                    metrics.record_call(self.model, 'cache_hit', 0.0, kind="stream")
+                    yield cached_report
+                    return
+            
+            # Someone is already generating this report, so wait for it and yield it whole
+            started = time.time()
+            call, leader = self.flights.begin(cache_key)
+            if not leader:
+                report = self.flights.wait(call)
+                metrics.record_call(self.model, 'coalesced', time.time() - started, kind="stream")
+                yield report
+                return
+            
+            # Open the stream through the rate limiter; retries cover the initial request
+            call_info = {}
+            estimated = estimate_tokens(request)
+            try:
+                stream = self.scheduler.execute(lambda: self.backend.stream(request), estimated, call_info)
+            except Exception as e:
+                self.flights.finish(cache_key, call, error=e)
+                metrics.record_call(
+                    self.model, 'error', time.time() - started,
+                    queue_time=call_info.get('queue_time', 0.0),
+                    retries=call_info.get('retries', 0),
+                    kind="stream",
+                    error=str(e)
+                )
+                raise
+            
+            chunks = []
+            error = None
+            try:
+                for content in stream:
+                    chunks.append(content)
+                    yield content
+            except BaseException as e:
+                # Also covers the consumer abandoning the stream
+                error = e
+                raise
+            finally:
+                text = "".join(chunks)
+                try:
+                    # Streams report no usage, so count the tokens locally and refund the unused reservation
+                    prompt_tokens = sum(count_tokens(m['content']) for m in request['messages'])
+                    completion_tokens = count_tokens(text)
+                    self.scheduler.record_usage(estimated, prompt_tokens + completion_tokens)
+                    metrics.record_call(
+                        self.model, 'error' if error is not None or not text else 'success', time.time() - started,
+                        queue_time=call_info.get('queue_time', 0.0),
+                        prompt_tokens=prompt_tokens,
+                        completion_tokens=completion_tokens,
+                        retries=call_info.get('retries', 0),
+                        kind="stream",
+                        error=str(error) if error is not None else None
+                    )
+                    if error is None:
+                        # Cache before releasing the key so later callers find the report
+                        self.cache.set(cache_key, text, {"model": self.model, "duration": time.time() - started})
+                finally:
+                    # Release the key whatever happened above; waiters must not hang
+                    if error is None:
+                        self.flights.finish(cache_key, call, result=text)
+                    else:
+                        self.flights.finish(cache_key, call,
+                                            error=RuntimeError(f"Report stream was interrupted: {error!r}"))
+        except Exception as e:
+            print(f"Error generating analysis: {str(e)}")
+            if raise_errors:
+                raise
+            yield StreamFailure(f"Error generating analysis: {str(e)}")
+            
+    def _create_prompt(self, video_data):
+        """
+        Create the per-video user message for the OpenAI API
+        
+        Only the video's own data goes here; the analyst instructions live in
+        SYSTEM_PROMPT so every request shares the same prefix.
+        """
+        # Use the sheet's actual column names
+        fields = [
+            ("Title", video_data.get('Title', 'N/A')),
+            ("Hook", video_data.get('Hook', 'N/A')),
+            ("Caption", video_data.get('Caption', 'N/A')),
+            ("Hashtags", video_data.get('Hashtags', 'N/A')),
+            ("Views", video_data.get('Views', 'N/A')),
+            ("Likes", video_data.get('Likes', 'N/A')),
+            ("Comments", video_data.get('Comments', 'N/A')),
+            ("Saves", video_data.get('Saves', 'N/A')),
+            ("Views to Like Ratio (%)", video_data.get('Views to Like Ratio (%)', video_data.get('Like-to-View Ratio (%)', 'N/A'))),
+            ("Views to Comment Ratio (%)", video_data.get('Views to Comment Ratio (%)', video_data.get('Comment-to-View Ratio (%)', 'N/A'))),
+            ("Views to Save Ratio (%)", video_data.get('Views to Save Ratio (%)', video_data.get('Save-to-View Ratio (%)', 'N/A'))),
+            ("Like to Comment Ratio (%)", video_data.get('Like to Comment Ratio (%)', video_data.get('Comment-to-Like Ratio (%)', 'N/A'))),
+            ("Like to Save Ratio (%)", video_data.get('Like to Save Ratio (%)', video_data.get('Save-to-Like Ratio (%)', 'N/A')))
+        ]
+        
+        # The hook is usually the same text as the title, so don't send it twice
+        if fields[1][1] == fields[0][1]:
+            fields.pop(1)
+        
+        # Where this video sits in its account's history, when baselines are available
+        for metric, column in PERCENTILE_COLUMNS.items():
+            if video_data.get(column) is not None:
+                fields.append((f"{metric} account percentile", video_data[column]))
+        
+        notes = video_data.get('Notes')
+        if notes:
+            fields.append(("Notes (Topic/Emotion)", notes))
         
-        return prompt 
\ No newline at end of file
+        lines = ["DATA PROVIDED:"]
+        lines.extend(f"{name}: {_format_value(value)}" for name, value in fields)
+        return "\n".join(lines)
@@ -0,0 +1,243 @@
+import os
+import time
+import random
+import threading
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+# Default account limits (overridable through environment variables)
+DEFAULT_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+DEFAULT_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "40000"))
+DEFAULT_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+
+# HTTP status codes worth retrying with backoff
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+RETRYABLE_ERROR_NAMES = ("RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError", "Timeout")
+
+
+def count_tokens(text):
+    """
+    Count the tokens in a piece of text
+
+    Uses tiktoken when it is installed and falls back to the common
+    ~4 characters per token approximation otherwise.
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Number of tokens
+    """
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return len(text) // 4 + 1
+
+
+def estimate_tokens(request):
+    """
+    Estimate the token cost of a chat completion request
+
+    Counts the prompt tokens plus the full completion budget, which is what
+    the API reserves against the tokens-per-minute limit.
+
+    Args:
+        request (dict): Chat completion parameters with 'messages' and 'max_tokens'
+
+    Returns:
+        int: Estimated prompt plus completion tokens
+    """
+    messages = request.get('messages', [])
+    # Each message carries a few tokens of role/formatting overhead
+    prompt_tokens = sum(count_tokens(message.get('content')) for message in messages) + 4 * len(messages)
+    return prompt_tokens + int(request.get('max_tokens') or 0)
+
+
+def get_status_code(error):
+    """Extract an HTTP status code from an API exception, if there is one"""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+
+def is_retryable_error(error):
+    """Check whether an API exception is a throttling or transient failure"""
+    # Quota exhaustion is reported as a 429 but will not clear by waiting
+    if 'insufficient_quota' in str(error):
+        return False
+    if get_status_code(error) in RETRYABLE_STATUS_CODES:
+        return True
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def _retry_after_seconds(error):
+    """Read the server's Retry-After hint from an API exception"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Token bucket refilled continuously up to a per-minute capacity"""
+
+    def __init__(self, per_minute):
+        """
+        Initialize the bucket
+
+        Args:
+            per_minute (int): Capacity and refill amount per minute
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        """Add the tokens earned since the last update"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` tokens are available"""
+        self._refill()
+        # Never wait for more than a full bucket, so oversized requests still run
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        """Take tokens out of the bucket (may go negative for oversized requests)"""
+        self._refill()
+        self.tokens -= amount
+
+    def refund(self, amount):
+        """Return tokens to the bucket"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimitScheduler:
+    """Queue API calls to stay under request- and token-per-minute limits"""
+
+    def __init__(self, rpm_limit=DEFAULT_RPM_LIMIT, tpm_limit=DEFAULT_TPM_LIMIT, max_retries=DEFAULT_MAX_RETRIES,
+                 base_delay=1.0, max_delay=60.0):
+        """
+        Initialize the scheduler
+
+        Args:
+            rpm_limit (int): Requests allowed per minute
+            tpm_limit (int): Tokens allowed per minute
+            max_retries (int): Retries for throttled or transient failures
+            base_delay (float): First backoff delay in seconds
+            max_delay (float): Upper bound for a single backoff delay
+        """
+        self.requests = TokenBucket(rpm_limit)
+        self.tokens = TokenBucket(tpm_limit)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.throttled = 0
+        # The queue lock orders waiting callers; the bucket lock guards the buckets
+        self._queue_lock = threading.Lock()
+        self._bucket_lock = threading.Lock()
+
+    def acquire(self, estimated_tokens):
+        """
+        Block until one request and the estimated tokens fit under the limits
+
+        Callers are served one at a time, so waiting requests form a queue.
+
+        Args:
+            estimated_tokens (int): Estimated token cost of the request
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        started = time.monotonic()
+        with self._queue_lock:
+            while True:
+                with self._bucket_lock:
+                    delay = max(self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+                    if delay <= 0:
+                        self.requests.consume(1)
+                        self.tokens.consume(estimated_tokens)
+                        break
+                time.sleep(delay)
+        return time.monotonic() - started
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """Correct the token bucket once the real usage of a request is known"""
+        if actual_tokens is None:
+            return
+        with self._bucket_lock:
+            difference = estimated_tokens - actual_tokens
+            if difference > 0:
+                self.tokens.refund(difference)
+            elif difference < 0:
+                self.tokens.consume(-difference)
+
+    def _backoff_delay(self, attempt, error):
+        """Full-jitter exponential backoff, honouring Retry-After when given"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def execute(self, request_fn, estimated_tokens, call_info=None):
+        """
+        Run an API call under the rate limits, retrying throttled attempts
+
+        Args:
+            request_fn (callable): Function performing the API call
+            estimated_tokens (int): Estimated token cost of the call
+            call_info (dict, optional): Filled with 'queue_time' and 'retries'
+
+        Returns:
+            The return value of request_fn
+        """
+        if call_info is None:
+            call_info = {}
+        call_info.setdefault('queue_time', 0.0)
+        call_info.setdefault('retries', 0)
+
+        attempt = 0
+        while True:
+            call_info['queue_time'] += self.acquire(estimated_tokens)
+            try:
+                return request_fn()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                if get_status_code(e) == 429 or type(e).__name__ == "RateLimitError":
+                    self.throttled += 1
+                delay = self._backoff_delay(attempt, e)
+                print(f"API call throttled or failed ({str(e)}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                call_info['retries'] = attempt
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler():
+    """Get the process-wide scheduler shared by all OpenAIAPI instances"""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RateLimitScheduler()
+        return _default_scheduler
@@ -0,0 +1,176 @@
+import re
+import json
+from functools import lru_cache
+
+# Report sections in the order the system prompt asks for them
+REPORT_SECTIONS = [
+    "Overview Summary",
+    "Detailed Metric Breakdown",
+    "Strengths Identified",
+    "Weaknesses Identified",
+    "Actionable Improvements",
+    "Viral Potential Score"
+]
+
+# Engagement ratios, keyed by display name, with the spellings the model uses for them
+REPORT_METRICS = {
+    "Like-to-View": ["Like-to-View", "Views to Like", "View-to-Like", "Like to View"],
+    "Comment-to-View": ["Comment-to-View", "Views to Comment", "View-to-Comment", "Comment to View"],
+    "Save-to-View": ["Save-to-View", "Views to Save", "View-to-Save", "Save to View"],
+    "Comment-to-Like": ["Comment-to-Like", "Like to Comment", "Like-to-Comment", "Comment to Like"],
+    "Save-to-Like": ["Save-to-Like", "Like to Save", "Like-to-Save", "Save to Like"]
+}
+
+# Bumped when the stored structure changes so old records are re-parsed
+REPORT_MODEL_VERSION = 1
+
+_SECTION_PATTERN = re.compile(
+    r'^[\s#*_]*(?:\d+[.)]\s*)?[*_]*\s*(' + '|'.join(map(re.escape, REPORT_SECTIONS)) + r')'
+    r'(?:\s*\(optional\))?[*_]*\s*(?::[*_]*\s*(.*))?$',
+    re.IGNORECASE
+)
+_METRIC_PATTERN = re.compile(
+    r'^[\s\-*#]*(' + '|'.join(re.escape(alias) for aliases in REPORT_METRICS.values() for alias in aliases) + r')'
+    r'(?:\s+ratio)?[*_]*\s*(?:\([^)]*\))?[*_]*\s*:[*_]*\s*(.*)$',
+    re.IGNORECASE
+)
+_SCORE_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(?:/|out of)\s*10\b', re.IGNORECASE)
+_METRIC_NAMES = {alias.lower(): name for name, aliases in REPORT_METRICS.items() for alias in aliases}
+
+
+class AnalysisReport:
+    """An analysis report split into its sections, metric notes and score"""
+
+    def __init__(self, raw, sections=None, metric_notes=None, viral_score=None, preamble="", markdown=None):
+        """
+        Args:
+            raw (str): Report text as generated
+            sections (dict, optional): Section name to section text, in report order
+            metric_notes (dict, optional): Metric display name to its note from the metric breakdown
+            viral_score (float, optional): Viral Potential Score out of 10
+            preamble (str): Text before the first recognised section
+            markdown (str, optional): Previously rendered markdown; built from the sections if omitted
+        """
+        self.raw = raw or ""
+        self.sections = sections or {}
+        self.metric_notes = metric_notes or {}
+        self.viral_score = viral_score
+        self.preamble = preamble
+        self.markdown = markdown if markdown is not None else self._build_markdown()
+
+    def _build_markdown(self):
+        """Render the report as Streamlit markdown"""
+        if not self.sections:
+            return self.raw
+
+        parts = [self.preamble] if self.preamble else []
+        for name, text in self.sections.items():
+            if name == "Detailed Metric Breakdown" and self.metric_notes:
+                lines = []
+                for line in text.splitlines():
+                    match = _METRIC_PATTERN.match(line)
+                    if match:
+                        bullet = "- " if line.lstrip().startswith("-") else ""
+                        line = f"{bullet}**{_METRIC_NAMES[match.group(1).lower()]}:** {match.group(2)}"
+                    lines.append(line)
+                text = "\n".join(lines)
+            parts.append(f"## {name}\n{text}")
+        return "\n\n".join(parts)
+
+    def to_dict(self):
+        """Serializable form stored alongside the raw report text"""
+        return {
+            'version': REPORT_MODEL_VERSION,
+            'sections': self.sections,
+            'metric_notes': self.metric_notes,
+            'viral_score': self.viral_score,
+            'preamble': self.preamble,
+            'markdown': self.markdown
+        }
+
+    @classmethod
+    def from_dict(cls, data, raw):
+        """Rebuild a report from to_dict() output and its raw text"""
+        # Document stores such as Firestore do not keep map key order
+        sections = data.get('sections') or {}
+        return cls(
+            raw,
+            sections={name: sections[name] for name in REPORT_SECTIONS if name in sections},
+            metric_notes=data.get('metric_notes'),
+            viral_score=data.get('viral_score'),
+            preamble=data.get('preamble', ""),
+            markdown=data.get('markdown')
+        )
+
+
+@lru_cache(maxsize=1024)
+def parse_report(text):
+    """
+    Parse a generated report into an AnalysisReport
+
+    Reports are immutable text, so parses are memoized and displaying the same
+    report again costs nothing.
+
+    Args:
+        text (str): Raw report text
+
+    Returns:
+        AnalysisReport: The parsed report; unrecognised text is kept as-is
+    """
+    text = (text or "").strip()
+    sections = {}
+    preamble = []
+    current = None
+    for line in text.splitlines():
+        match = _SECTION_PATTERN.match(line)
+        # A line repeating the current heading (e.g. "Viral Potential Score: 7/10") is content
+        if match and not (current and match.group(1).lower() == current.lower() and match.group(2)):
+            current = next(name for name in REPORT_SECTIONS if name.lower() == match.group(1).lower())
+            sections[current] = [match.group(2)] if match.group(2) else []
+        elif current:
+            sections[current].append(line)
+        else:
+            preamble.append(line)
+    sections = {name: "\n".join(lines).strip() for name, lines in sections.items()}
+
+    metric_notes = {}
+    for line in sections.get("Detailed Metric Breakdown", "").splitlines():
+        match = _METRIC_PATTERN.match(line)
+        if match:
+            metric_notes.setdefault(_METRIC_NAMES[match.group(1).lower()], match.group(2).strip())
+
+    score_match = _SCORE_PATTERN.search(sections.get("Viral Potential Score", ""))
+    viral_score = min(10.0, float(score_match.group(1))) if score_match else None
+
+    return AnalysisReport(text, sections, metric_notes, viral_score, "\n".join(preamble).strip())
+
+
+def report_from_record(record):
+    """
+    Get the structured report of a saved record
+
+    Uses the stored structure when it is current, and parses the raw text of
+    records saved before reports were stored structured.
+    """
+    raw = record.get('metrics') or ""
+    structured = record.get('report')
+    if isinstance(structured, dict) and structured.get('version') == REPORT_MODEL_VERSION:
+        return AnalysisReport.from_dict(structured, raw)
+    return parse_report(raw)
+
+
+@lru_cache(maxsize=1024)
+def _load_query(query):
+    try:
+        data = json.loads(query)
+    except (TypeError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def video_from_record(record):
+    """Get the video data of a saved record without re-parsing its query JSON"""
+    video = record.get('video')
+    if isinstance(video, dict):
+        return video
+    return dict(_load_query(record.get('query') or '{}'))
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from datetime import datetime
+
+from account_baselines import PERCENTILE_COLUMNS
+
+# Directory holding one journal file per analysis run
+DEFAULT_RUNS_DIR = os.getenv("ANALYSIS_RUNS_DIR", "analysis_runs")
+
+# Reports buffered before each incremental write-back to the sheet
+CHECKPOINT_WRITE_EVERY = int(os.getenv("CHECKPOINT_WRITE_EVERY", "25"))
+
+# Row states recorded in a journal
+ROW_COMPLETED = "completed"
+ROW_FAILED = "failed"
+
+
+def video_fingerprint(video_data):
+    """
+    Hash the sheet fields of a prepared video
+
+    Account percentile ranks are left out: they drift as the baseline grows,
+    and that alone should not invalidate a checkpointed report.
+    """
+    fields = {key: value for key, value in video_data.items() if key not in PERCENTILE_COLUMNS.values()}
+    payload = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+class RunJournal:
+    """
+    Append-only JSONL journal of a sheet analysis run
+
+    The first line describes the run; every later line records one finished row
+    (fingerprint, status, report) or a batch of rows written back to the sheet.
+    Lines are flushed and fsynced as they are written, so a crashed run loses
+    at most the rows that were still in flight, and replaying the file
+    restores its state.
+    """
+
+    def __init__(self, run_id, runs_dir=None):
+        self.run_id = run_id
+        self.runs_dir = runs_dir or DEFAULT_RUNS_DIR
+        self.path = os.path.join(self.runs_dir, f"{run_id}.jsonl")
+        self.run = {}
+        self.rows = {}
+        self.written = set()
+        # Set when the file ends in a partial line, which the next append must not extend
+        self._torn = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, sheet_url, worksheet_name, analysis_col_index=None, runs_dir=None):
+        """
+        Start the journal of a new run
+
+        Args:
+            sheet_url (str): URL of the Google Sheet
+            worksheet_name (str): Name of the worksheet
+            analysis_col_index (int, optional): Column the reports are written into
+            runs_dir (str, optional): Directory for the journals
+
+        Returns:
+            RunJournal: The new journal
+        """
+        run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        journal = cls(run_id, runs_dir)
+        os.makedirs(journal.runs_dir, exist_ok=True)
+        journal.run = {
+            'type': 'run',
+            'run_id': run_id,
+            'sheet_url': sheet_url,
+            'worksheet_name': worksheet_name,
+            'analysis_col_index': analysis_col_index,
+            'created_at': time.time()
+        }
+        journal._append(journal.run)
+        return journal
+
+    @classmethod
+    def load(cls, run_id, runs_dir=None):
+        """Replay a journal from disk, or return None if it does not exist"""
+        journal = cls(run_id, runs_dir)
+        try:
+            with open(journal.path, 'r') as f:
+                for line in f:
+                    journal._torn = not line.endswith("\n")
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash; everything before it is intact
+                        continue
+                    journal._apply(entry)
+            return journal if journal.run else None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error loading run journal {run_id}: {str(e)}")
+            return None
+
+    def _apply(self, entry):
+        if entry.get('type') == 'run':
+            self.run = entry
+        elif entry.get('type') == 'row':
+            self.rows[entry['row_index']] = entry
+            self.written.discard(entry['row_index'])
+        elif entry.get('type') == 'written':
+            self.written.update(entry['rows'])
+
+    def _append(self, entry):
+        line = json.dumps(entry, default=str) + "\n"
+        with self._lock:
+            if self._torn:
+                line = "\n" + line
+                self._torn = False
+            with open(self.path, 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(entry)
+
+    def record(self, row_index, fingerprint, report=None, error=None):
+        """Checkpoint a finished row; rows with an error are retried on resume"""
+        self._append({
+            'type': 'row',
+            'row_index': int(row_index),
+            'fingerprint': fingerprint,
+            'status': ROW_FAILED if error else ROW_COMPLETED,
+            'report': report,
+            'error': error,
+            'at': time.time()
+        })
+
+    def mark_written(self, row_indices):
+        """Record that the reports of these rows are in the sheet"""
+        rows = sorted(int(row_index) for row_index in row_indices)
+        if rows:
+            self._append({'type': 'written', 'rows': rows, 'at': time.time()})
+
+    def completed_report(self, row_index, fingerprint):
+        """Report of a completed row whose data is unchanged, or None"""
+        with self._lock:
+            entry = self.rows.get(int(row_index))
+        if entry and entry['status'] == ROW_COMPLETED and entry['fingerprint'] == fingerprint:
+            return entry['report']
+        return None
+
+    def unwritten_reports(self):
+        """Completed reports not yet written to the sheet, keyed by row index"""
+        with self._lock:
+            return {
+                row_index: entry['report'] for row_index, entry in self.rows.items()
+                if entry['status'] == ROW_COMPLETED and row_index not in self.written
+            }
+
+    def summary(self):
+        """Count rows by state"""
+        with self._lock:
+            completed = sum(1 for entry in self.rows.values() if entry['status'] == ROW_COMPLETED)
+            return {
+                'run_id': self.run_id,
+                'sheet_url': self.run.get('sheet_url'),
+                'worksheet_name': self.run.get('worksheet_name'),
+                'created_at': self.run.get('created_at'),
+                'completed': completed,
+                'failed': len(self.rows) - completed,
+                'written': len(self.written)
+            }
+
+
+class SheetCheckpointWriter:
+    """
+    Write reports back to the sheet in small batches while a run is in progress
+
+    Every flush is recorded in the journal, so a resumed run knows which
+    completed reports still have to be written.
+    """
+
+    def __init__(self, sheets_api, worksheet, analysis_col_index, journal=None, write_every=None):
+        """
+        Args:
+            sheets_api (SheetsAPI): Sheets API used for write-back
+            worksheet (gspread.Worksheet): Worksheet to update
+            analysis_col_index (int): 0-based index of the analysis column
+            journal (RunJournal, optional): Journal to record written rows in
+            write_every (int, optional): Reports buffered before a write; defaults to CHECKPOINT_WRITE_EVERY
+        """
+        self.sheets_api = sheets_api
+        self.worksheet = worksheet
+        self.analysis_col_index = analysis_col_index
+        self.journal = journal
+        self.write_every = max(1, write_every or CHECKPOINT_WRITE_EVERY)
+        self.pending = {}
+        self.failed = False
+        self._lock = threading.Lock()
+
+    def add(self, row_index, report):
+        """Buffer a report, writing the buffer once it is full"""
+        with self._lock:
+            self.pending[row_index] = report
+            full = len(self.pending) >= self.write_every
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write every buffered report; on failure they stay buffered for the next flush"""
+        with self._lock:
+            batch, self.pending = self.pending, {}
+            if not batch:
+                return True
+            if self.sheets_api.update_analysis_column(self.worksheet, batch, self.analysis_col_index):
+                if self.journal is not None:
+                    self.journal.mark_written(batch)
+                self.failed = False
+                return True
+            self.pending = {**batch, **self.pending}
+            self.failed = True
+            return False
+
+
+def list_runs(runs_dir=None):
+    """List the ids of all journaled runs, newest first"""
+    runs_dir = runs_dir or DEFAULT_RUNS_DIR
+    if not os.path.isdir(runs_dir):
+        return []
+    return sorted((name[:-len(".jsonl")] for name in os.listdir(runs_dir) if name.endswith(".jsonl")), reverse=True)
@@ -0,0 +1,114 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Memory budget and fallback lifetime for cached worksheet DataFrames
+DEFAULT_MAX_BYTES = int(float(os.getenv("SHEETS_FRAME_CACHE_MAX_MB", "256")) * 1024 * 1024)
+DEFAULT_TTL_SECONDS = int(os.getenv("SHEETS_FRAME_CACHE_TTL_SECONDS", "300"))
+
+
+class FrameCache:
+    """
+    In-memory LRU cache of parsed worksheet DataFrames
+
+    Entries are validated against the spreadsheet revision (Drive modifiedTime
+    and version) when it is known, and expire after a TTL when it is not.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl_seconds=DEFAULT_TTL_SECONDS, enabled=True):
+        """
+        Args:
+            max_bytes (int): Total DataFrame memory kept before evicting least recently used entries
+            ttl_seconds (int): Lifetime of entries whose revision could not be checked
+            enabled (bool): Set to False to bypass the cache
+        """
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled and os.getenv("SHEETS_FRAME_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, revision=None):
+        """
+        Get a cached DataFrame
+
+        Args:
+            key (tuple): (spreadsheet id, worksheet id, columns)
+            revision (tuple, optional): Current spreadsheet revision; None if unknown
+
+        Returns:
+            pandas.DataFrame or None: A copy of the cached frame, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if revision is not None and entry['revision'] is not None:
+                    fresh = entry['revision'] == revision
+                else:
+                    fresh = time.time() - entry['stored_at'] < self.ttl_seconds
+                if fresh:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry['frame'].copy()
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, key, frame, revision=None):
+        """Store a DataFrame read at the given revision"""
+        if not self.enabled:
+            return
+        size = int(frame.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {'frame': frame.copy(), 'revision': revision, 'stored_at': time.time(), 'size': size}
+            self.size += size
+            while self.size > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, spreadsheet_id, worksheet_id=None):
+        """Drop the entries of a spreadsheet, or of one of its worksheets"""
+        with self._lock:
+            for key in [k for k in self._entries
+                        if k[0] == spreadsheet_id and (worksheet_id is None or k[1] == worksheet_id)]:
+                self._remove(key)
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.size -= entry['size']
+
+    def stats(self):
+        """Get cache statistics"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+
+# Process-wide cache shared by every SheetsAPI instance and Streamlit session
+frame_cache = FrameCache()
@@ -0,0 +1,140 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Optional dependency: Arrow-backed strings cut the memory of text columns
+try:
+    import pyarrow  # noqa: F401
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+# Use Arrow-backed dtypes for text columns when pyarrow is installed
+USE_ARROW_DTYPES = os.getenv("SHEETS_ARROW_DTYPES", "").lower() in ("1", "true", "yes")
+
+# Declared types of the worksheet columns the analysis reads:
+# 'text' is filled with '', 'count' is numeric filled with 0, 'ratio' is numeric and keeps NaN
+SHEET_SCHEMA = {
+    'Title/Hook': 'text',
+    'Caption': 'text',
+    'Hashtags': 'text',
+    'Notes (Topic/Emotion)': 'text',
+    'Views (24h)': 'count',
+    'Likes': 'count',
+    'Comments': 'count',
+    'Saves': 'count',
+    'Views to Like Ratio (%)': 'ratio',
+    'Views to Comment Ratio (%)': 'ratio',
+    'Views to Save Ratio (%)': 'ratio',
+    'Like to Comment Ratio (%)': 'ratio',
+    'Like to Save Ratio (%)': 'ratio'
+}
+
+COLUMN_KINDS = ('text', 'count', 'ratio')
+
+
+def _text_dtype(arrow):
+    if arrow is None:
+        arrow = USE_ARROW_DTYPES
+    return "string[pyarrow]" if arrow and ARROW_AVAILABLE else object
+
+
+def parse_number(value):
+    """Parse one non-numeric cell, e.g. '', '1,234' or '5.2%'; NaN if it is not a number"""
+    if value is None or value == '' or isinstance(value, bool):
+        return float('nan')
+    try:
+        return float(str(value).replace(',', '').rstrip('%').strip())
+    except ValueError:
+        return float('nan')
+
+
+def _convert(values, kind, arrow=None):
+    """Convert one column of raw values to its declared type in a single pass"""
+    if kind == 'text':
+        # None and NaN become '', other non-text cells (e.g. a numeric title) become text
+        text = [v if isinstance(v, str) else ('' if v is None or v != v else str(v)) for v in values]
+        return pd.Series(text, dtype=_text_dtype(arrow))
+
+    # Unformatted reads return numbers as numbers, so the odd text cell is parsed only when present
+    try:
+        numbers = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        numbers = None
+    if numbers is None:
+        # Blank cells are the usual culprit; numeric strings convert as they are
+        try:
+            numbers = np.array([np.nan if v is None or v == '' else v for v in values], dtype=np.float64)
+        except (TypeError, ValueError):
+            numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+        # Retry only the cells plain parsing missed, e.g. '1,234' or '5.2%'
+        retry = np.flatnonzero(np.isnan(numbers))
+        if retry.size:
+            numbers[retry] = [parse_number(values[i]) for i in retry]
+    if kind == 'count':
+        numbers[np.isnan(numbers)] = 0
+        if np.array_equal(numbers, np.floor(numbers)) and np.abs(numbers).max(initial=0) < 2 ** 53:
+            return pd.Series(numbers.astype(np.int64))
+    return pd.Series(numbers)
+
+
+def build_typed_frame(columns, schema=None, arrow=None):
+    """
+    Build a typed DataFrame straight from raw column values
+
+    Args:
+        columns (dict): Column name to its list of raw cell values (data rows only);
+            shorter columns are padded with blanks
+        schema (dict, optional): Column name to kind; defaults to SHEET_SCHEMA.
+            Columns without a declared kind keep their raw values.
+        arrow (bool, optional): Use Arrow-backed text columns; defaults to SHEETS_ARROW_DTYPES
+
+    Returns:
+        pandas.DataFrame: One typed column per entry of columns, indexed 0..n-1
+    """
+    schema = schema or SHEET_SCHEMA
+    length = max((len(values) for values in columns.values()), default=0)
+    data = {}
+    for name, values in columns.items():
+        values = list(values) + [''] * (length - len(values))
+        kind = schema.get(name)
+        data[name] = _convert(values, kind, arrow) if kind in COLUMN_KINDS else pd.Series(values, dtype=object)
+    return pd.DataFrame(data, index=pd.RangeIndex(length))
+
+
+def apply_schema(df, schema=None, arrow=None):
+    """
+    Bring an existing DataFrame to the declared column types
+
+    Columns that already have the right type are left alone and the frame is
+    only shallow-copied, so typed frames from build_typed_frame pass through
+    at almost no cost.
+
+    Args:
+        df (pandas.DataFrame): Frame to convert
+        schema (dict, optional): Column name to kind; defaults to SHEET_SCHEMA
+        arrow (bool, optional): Use Arrow-backed text columns for converted columns
+
+    Returns:
+        pandas.DataFrame: A frame with the declared columns typed
+    """
+    schema = schema or SHEET_SCHEMA
+    result = df.copy(deep=False)
+    for name, kind in schema.items():
+        if name not in df.columns:
+            continue
+        column = df[name]
+        if kind == 'text' and isinstance(column.dtype, pd.StringDtype):
+            conforms = not column.isna().any()
+        elif kind == 'text':
+            conforms = column.dtype == object \
+                and pd.api.types.infer_dtype(column, skipna=False) in ('string', 'empty')
+        else:
+            conforms = pd.api.types.is_numeric_dtype(column.dtype) \
+                and (kind == 'ratio' or not column.isna().any())
+        if conforms:
+            continue
+        converted = _convert(column.to_numpy(dtype=object), kind, arrow)
+        converted.index = df.index
+        result[name] = converted
+    return result
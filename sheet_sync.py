@@ -0,0 +1,163 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+from utils import spreadsheet_id_from_url, file_lock, write_json_atomic
+
+# Directory holding one fingerprint file per worksheet
+DEFAULT_SYNC_DIR = os.getenv("SHEET_SYNC_DIR", "sheet_sync")
+
+# Columns whose values feed the analysis prompt; a change in any of them makes a row stale
+FINGERPRINT_COLUMNS = [
+    'Title/Hook', 'Caption', 'Hashtags', 'Notes (Topic/Emotion)',
+    'Views (24h)', 'Likes', 'Comments', 'Saves'
+]
+
+
+def fingerprint_rows(df, columns=None):
+    """
+    Hash the analysis-relevant fields of every row
+
+    Args:
+        df (pandas.DataFrame): Rows as read from the sheet
+        columns (list, optional): Columns to hash; defaults to FINGERPRINT_COLUMNS
+
+    Returns:
+        pandas.Series: uint64 fingerprint per row, indexed like df
+    """
+    columns = columns or FINGERPRINT_COLUMNS
+    # Compare values as text so 1200 and "1200" from different reads hash the same
+    values = df.reindex(columns=columns).fillna('').astype(str)
+    return pd.util.hash_pandas_object(values, index=False)
+
+
+class SheetSync:
+    """Remember which worksheet rows have been analyzed, by fingerprint, and their triage scores"""
+
+    def __init__(self, sheet_url, worksheet_name, sync_dir=None):
+        """
+        Args:
+            sheet_url (str): URL of the Google Sheet
+            worksheet_name (str): Name of the worksheet
+            sync_dir (str, optional): Directory for the fingerprint files
+        """
+        self.sheet_url = sheet_url
+        self.worksheet_name = worksheet_name
+        self.sync_dir = sync_dir or DEFAULT_SYNC_DIR
+        self.synced = {}
+        self.pending = {}
+        self.scores = {}
+        self.load()
+
+    @property
+    def path(self):
+        sheet_key = spreadsheet_id_from_url(self.sheet_url) or self.sheet_url
+        key = hashlib.sha256(f"{sheet_key}\n{self.worksheet_name}".encode('utf-8')).hexdigest()[:24]
+        return os.path.join(self.sync_dir, f"{key}.json")
+
+    def load(self):
+        """Load the stored fingerprints and scores, starting empty if there are none"""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.synced = {int(row): int(fingerprint) for row, fingerprint in data.get('rows', {}).items()}
+            self.scores = {int(row): float(score) for row, score in data.get('scores', {}).items()}
+        except FileNotFoundError:
+            self.synced = {}
+            self.scores = {}
+        except Exception as e:
+            print(f"Error loading sync state, starting a full sync: {str(e)}")
+            self.synced = {}
+            self.scores = {}
+
+    def save(self):
+        """Persist the fingerprints and scores atomically"""
+        with file_lock(self.path):
+            self._write()
+
+    def _write(self):
+        os.makedirs(self.sync_dir, exist_ok=True)
+        write_json_atomic(self.path, {
+            'sheet_url': self.sheet_url,
+            'worksheet_name': self.worksheet_name,
+            'rows': {str(row): fingerprint for row, fingerprint in self.synced.items()},
+            'scores': {str(row): score for row, score in self.scores.items()}
+        })
+
+    def changed_rows(self, df):
+        """
+        Find rows that are new or whose analysis-relevant fields changed
+
+        The fingerprints of the returned rows are kept as pending until
+        mark_synced() confirms they were analyzed.
+
+        Args:
+            df (pandas.DataFrame): Rows as read from the sheet, indexed by data row
+
+        Returns:
+            pandas.Index: Index labels of the rows needing analysis
+        """
+        fingerprints = fingerprint_rows(df)
+        stored = pd.Series(self.synced, dtype='uint64').reindex(df.index, fill_value=0)
+        changed = fingerprints.to_numpy() != stored.to_numpy(dtype=np.uint64)
+        self.pending = dict(zip(df.index[changed].tolist(), fingerprints[changed].tolist()))
+        return df.index[changed]
+
+    def mark_synced(self, row_indices, total_rows=None):
+        """
+        Record rows as analyzed and save
+
+        Args:
+            row_indices (iterable): Rows whose reports were generated (and written back)
+            total_rows (int, optional): Current number of data rows; fingerprints of
+                rows beyond it (deleted from the sheet) are dropped
+        """
+        row_indices = list(row_indices)
+
+        def _apply():
+            for row_index in row_indices:
+                if row_index in self.pending:
+                    self.synced[int(row_index)] = int(self.pending.pop(row_index))
+            if total_rows is not None:
+                self.synced = {row: fingerprint for row, fingerprint in self.synced.items() if row < total_rows}
+                self.scores = {row: score for row, score in self.scores.items() if row < total_rows}
+
+        self._update_file(_apply)
+
+    def triage_scores(self):
+        """Triage scores of the rows as of their last analysis, by row index"""
+        return dict(self.scores)
+
+    def record_scores(self, scores):
+        """
+        Remember the triage scores of analyzed rows and save
+
+        The 'changed' triage policies compare against these on the next run.
+
+        Args:
+            scores (dict or pandas.Series): Triage score by row index
+        """
+        scores = {int(row): float(score) for row, score in dict(scores).items()}
+        self._update_file(lambda: self.scores.update(scores))
+
+    def _update_file(self, apply):
+        """
+        Apply a change on top of the latest stored state and save it
+
+        Workers and the app may sync the same worksheet, so the file is
+        re-read under a lock first; rows recorded by others are kept.
+        """
+        with file_lock(self.path):
+            self.load()
+            apply()
+            self._write()
+
+    def reset(self):
+        """Forget every fingerprint so the next sync analyzes all rows"""
+        self.synced = {}
+        self.pending = {}
+        self.scores = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
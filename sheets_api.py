@@ -1,39 +1,147 @@
 import gspread
+from gspread.urls import DRIVE_FILES_API_V3_URL
+from gspread.utils import rowcol_to_a1, numericise_all
 from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import Request
+from requests.adapters import HTTPAdapter
 import pandas as pd
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from rate_limiter import TokenBucket
+from sheet_cache import frame_cache as default_frame_cache
+from sheet_schema import SHEET_SCHEMA, build_typed_frame
+from utils import spreadsheet_id_from_url
 
 SCOPES = [
     'https://www.googleapis.com/auth/spreadsheets',
     'https://www.googleapis.com/auth/drive'
 ]
 
+# Limits for a single values batch update; bigger writes are split into several requests
+SHEETS_WRITE_MAX_CELLS = int(os.getenv("SHEETS_WRITE_MAX_CELLS", "5000"))
+SHEETS_WRITE_MAX_BYTES = int(os.getenv("SHEETS_WRITE_MAX_BYTES", str(2 * 1024 * 1024)))
+
+# Keep-alive connections held open to the Google APIs, shared by all threads using the client
+SHEETS_HTTP_POOL_SIZE = int(os.getenv("SHEETS_HTTP_POOL_SIZE", "16"))
+
+# Read requests per minute allowed to this client (the Sheets API default is 60 per user)
+SHEETS_READ_RPM = int(os.getenv("SHEETS_READ_RPM", "60"))
+
+# Worksheets fetched at once by load_worksheets()
+SHEETS_LOAD_WORKERS = int(os.getenv("SHEETS_LOAD_WORKERS", "4"))
+
+# Columns added by load_worksheets() to tell the source of every row
+SOURCE_COLUMNS = ['Account', 'Source Sheet', 'Source Worksheet', 'Source Row']
+
 class SheetsAPI:
-    def __init__(self, credentials_path="credentials.json"):
-        """Initialize the Google Sheets API connection"""
+    def __init__(self, credentials_path="credentials.json", frame_cache=None):
+        """
+        Initialize the Google Sheets API connection
+        
+        Args:
+            credentials_path (str): Service account credentials file
+            frame_cache (FrameCache, optional): Cache of worksheet DataFrames; defaults to the
+                process-wide cache
+        """
+        self.credentials_path = credentials_path
+        self.frame_cache = frame_cache if frame_cache is not None else default_frame_cache
+        # Opened spreadsheets by id, and their worksheets by title, to skip metadata requests
+        self._sheets = {}
+        self._worksheets = {}
+        self._handles_lock = threading.Lock()
+        # Shared by every thread so concurrent loads stay within the read quota
+        self._read_bucket = TokenBucket(SHEETS_READ_RPM)
+        self._read_lock = threading.Lock()
+        self.last_load_errors = {}
+        self.client = None
+        self.connected = False
+        self.connect()
+            
+    def connect(self):
+        """Load the credentials and build a client backed by a keep-alive connection pool"""
         try:
             self.credentials = Credentials.from_service_account_file(
-                credentials_path, scopes=SCOPES
+                self.credentials_path, scopes=SCOPES
             )
             self.client = gspread.authorize(self.credentials)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=SHEETS_HTTP_POOL_SIZE)
+            self.client.session.mount("https://", adapter)
             self.connected = True
         except Exception as e:
             print(f"Error connecting to Google Sheets API: {str(e)}")
             self.connected = False
+        return self.connected
             
     def is_connected(self):
         """Check if API connection is established"""
         return self.connected
+        
+    def check_health(self):
+        """
+        Make sure the client can authenticate, refreshing an expired access token
+        
+        Returns:
+            bool: True if the client is usable
+        """
+        if not self.connected:
+            return False
+        try:
+            if not self.credentials.valid:
+                self.credentials.refresh(Request())
+            return True
+        except Exception as e:
+            print(f"Google Sheets health check failed: {str(e)}")
+            return False
+            
+    def refresh(self):
+        """Rebuild the client from the credentials file and drop cached spreadsheet handles"""
+        with self._handles_lock:
+            self._sheets.clear()
+            self._worksheets.clear()
+        if self.client is not None:
+            try:
+                self.client.session.close()
+            except Exception:
+                pass
+        return self.connect()
+            
+    def _throttle_read(self, requests=1):
+        """Block until the read quota allows another request"""
+        while True:
+            with self._read_lock:
+                delay = self._read_bucket.wait_time(requests)
+                if delay <= 0:
+                    self._read_bucket.consume(requests)
+                    return
+            time.sleep(delay)
             
     def open_sheet_by_url(self, sheet_url):
-        """Open a Google Sheet by its URL"""
+        """Open a Google Sheet by its URL, reusing the handle from earlier calls"""
+        key = spreadsheet_id_from_url(sheet_url) or sheet_url
+        with self._handles_lock:
+            sheet = self._sheets.get(key)
+        if sheet is not None:
+            return sheet
         try:
+            self._throttle_read()
             sheet = self.client.open_by_url(sheet_url)
+            with self._handles_lock:
+                self._sheets[key] = sheet
             return sheet
         except Exception as e:
             print(f"Error opening sheet: {str(e)}")
             return None
             
+    def forget_sheet(self, sheet_url):
+        """Drop the cached handle and worksheet map of a spreadsheet, e.g. after it was restructured"""
+        key = spreadsheet_id_from_url(sheet_url) or sheet_url
+        with self._handles_lock:
+            sheet = self._sheets.pop(key, None)
+            if sheet is not None:
+                self._worksheets.pop(sheet.id, None)
+            
     def get_worksheet(self, sheet, worksheet_index=0):
         """Get a specific worksheet from a Google Sheet by index"""
         try:
@@ -42,19 +150,34 @@ class SheetsAPI:
             print(f"Error getting worksheet: {str(e)}")
             return None
             
+    def _refresh_worksheets(self, sheet):
+        """Fetch the worksheet list and rebuild the title map of a spreadsheet"""
+        self._throttle_read()
+        worksheets = {worksheet.title: worksheet for worksheet in sheet.worksheets()}
+        with self._handles_lock:
+            self._worksheets[sheet.id] = worksheets
+        return worksheets
+            
     def get_worksheet_by_name(self, sheet, worksheet_name):
-        """Get a specific worksheet from a Google Sheet by name"""
+        """
+        Get a specific worksheet from a Google Sheet by name
+        
+        The title map is cached per spreadsheet and refreshed once when a name
+        is not found, so renamed or newly added worksheets are picked up.
+        """
         try:
-            # Get all worksheets
-            worksheets = sheet.worksheets()
-            
-            # Find worksheet by name
-            for worksheet in worksheets:
-                if worksheet.title == worksheet_name:
-                    return worksheet
+            with self._handles_lock:
+                worksheets = self._worksheets.get(sheet.id)
+            if worksheets is not None and worksheet_name in worksheets:
+                return worksheets[worksheet_name]
+                
+            # Unknown spreadsheet or a miss: the cached map may be stale
+            worksheets = self._refresh_worksheets(sheet)
+            if worksheet_name in worksheets:
+                return worksheets[worksheet_name]
                     
             # If not found, return None
-            print(f"Worksheet '{worksheet_name}' not found. Available worksheets: {[ws.title for ws in worksheets]}")
+            print(f"Worksheet '{worksheet_name}' not found. Available worksheets: {list(worksheets)}")
             return None
         except Exception as e:
             print(f"Error getting worksheet by name: {str(e)}")
@@ -68,19 +191,247 @@ class SheetsAPI:
             print(f"Error getting records: {str(e)}")
             return []
             
+    def get_revision(self, sheet):
+        """
+        Get the spreadsheet's current revision from Drive file metadata
+        
+        Returns:
+            tuple or None: (modifiedTime, version), or None if it could not be read
+        """
+        try:
+            response = self.client.request(
+                'get',
+                f"{DRIVE_FILES_API_V3_URL}/{sheet.id}",
+                params={'fields': 'modifiedTime,version', 'supportsAllDrives': True}
+            )
+            metadata = response.json()
+            return metadata.get('modifiedTime'), metadata.get('version')
+        except Exception as e:
+            print(f"Error getting spreadsheet revision: {str(e)}")
+            return None
+            
+    def _cached_frame(self, worksheet, columns, load, variant=None):
+        """Serve a worksheet DataFrame from the frame cache while its revision is unchanged"""
+        if not self.frame_cache.enabled:
+            return load()
+        key = (worksheet.spreadsheet.id, worksheet.id, tuple(columns) if columns is not None else None, variant)
+        revision = self.get_revision(worksheet.spreadsheet)
+        df = self.frame_cache.get(key, revision)
+        if df is None:
+            df = load()
+            if not df.empty:
+                self.frame_cache.set(key, df, revision)
+        return df
+            
     def get_data_as_dataframe(self, worksheet):
         """Get worksheet data as a pandas DataFrame"""
         try:
-            records = worksheet.get_all_records()
-            return pd.DataFrame(records)
+            return self._cached_frame(worksheet, None, lambda: pd.DataFrame(worksheet.get_all_records()))
         except Exception as e:
             print(f"Error converting to DataFrame: {str(e)}")
             return pd.DataFrame()
             
+    def get_header(self, worksheet, raise_errors=False):
+        """
+        Get only the header row of a worksheet
+        
+        Args:
+            worksheet (gspread.Worksheet): Worksheet to read
+            raise_errors (bool): Re-raise read errors instead of returning an empty header
+        """
+        try:
+            self._throttle_read()
+            return worksheet.row_values(1)
+        except Exception as e:
+            print(f"Error getting header row: {str(e)}")
+            if raise_errors:
+                raise
+            return []
+            
+    def get_range_values(self, worksheet, range_name):
+        """
+        Get the values of an A1 range, e.g. 'A1:F1', 'B2:B500' or 'C:C'
+        
+        Returns:
+            list: Rows of cell values, padded to a rectangle
+        """
+        try:
+            self._throttle_read()
+            return worksheet.get_values(range_name)
+        except Exception as e:
+            print(f"Error getting range {range_name}: {str(e)}")
+            return []
+            
+    def get_columns_as_dataframe(self, worksheet, columns, header=None):
+        """
+        Get only the named columns of a worksheet as a pandas DataFrame
+        
+        Reads the header row, then fetches every requested column in a single
+        batch request. Values are converted like get_all_records() does, and the
+        index matches get_data_as_dataframe() (0 is the first row after the header).
+        Results are cached until the spreadsheet revision changes.
+        
+        Args:
+            worksheet (gspread.Worksheet): Worksheet to read
+            columns (list): Header names to read; names missing from the sheet are skipped
+            header (list, optional): Header row if it has already been read
+            
+        Returns:
+            pandas.DataFrame: The requested columns that exist, in the requested order
+        """
+        try:
+            return self._cached_frame(worksheet, columns, lambda: self._read_columns(worksheet, columns, header))
+        except Exception as e:
+            print(f"Error reading columns: {str(e)}")
+            return pd.DataFrame()
+            
+    def get_typed_dataframe(self, worksheet, schema, arrow=None):
+        """
+        Get the columns of a declared schema as a typed pandas DataFrame
+        
+        Unformatted cell values are read column by column and converted straight
+        to their declared types (numeric coercion and blank filling included),
+        without building per-row records first.
+        
+        Args:
+            worksheet (gspread.Worksheet): Worksheet to read
+            schema (dict): Column name to kind, see sheet_schema.SHEET_SCHEMA
+            arrow (bool, optional): Use Arrow-backed text columns when pyarrow is installed
+            
+        Returns:
+            pandas.DataFrame: The schema columns present in the sheet, typed
+        """
+        try:
+            return self._cached_frame(
+                worksheet, list(schema),
+                lambda: build_typed_frame(
+                    self._read_column_values(worksheet, list(schema), value_render_option='UNFORMATTED_VALUE'),
+                    schema, arrow
+                ),
+                variant=('typed', arrow)
+            )
+        except Exception as e:
+            print(f"Error reading typed columns: {str(e)}")
+            return pd.DataFrame()
+            
+    def _read_column_values(self, worksheet, columns, header=None, value_render_option=None):
+        """
+        Download the named columns in a single batch request
+        
+        Returns:
+            dict: Raw cell values per column present in the sheet, in the requested order;
+                trailing blank cells are omitted
+        """
+        header = header if header is not None else self.get_header(worksheet)
+        positions = {}
+        for position, name in enumerate(header):
+            positions.setdefault(name, position)
+        present = [name for name in columns if name in positions]
+        if not present:
+            return {}
+            
+        # Column letter from the A1 address of its header cell, e.g. 'AB1' -> 'AB'
+        letters = [rowcol_to_a1(1, positions[name] + 1)[:-1] for name in present]
+        options = {'major_dimension': 'COLUMNS'}
+        if value_render_option:
+            options['value_render_option'] = value_render_option
+        self._throttle_read()
+        value_ranges = worksheet.batch_get([f"{letter}2:{letter}" for letter in letters], **options)
+        return {
+            name: list(value_range[0]) if value_range else []
+            for name, value_range in zip(present, value_ranges)
+        }
+            
+    def _read_columns(self, worksheet, columns, header=None):
+        """Download the named columns; see get_columns_as_dataframe"""
+        values = self._read_column_values(worksheet, columns, header)
+        if not values:
+            return pd.DataFrame()
+            
+        # Trailing blank cells are omitted by the API, so pad every column to the same length
+        length = max(len(column) for column in values.values())
+        return pd.DataFrame({
+            name: numericise_all(column + [""] * (length - len(column)))
+            for name, column in values.items()
+        })
+            
+    def load_worksheets(self, targets, schema=None, max_workers=None, progress_callback=None):
+        """
+        Load several worksheets, possibly from several spreadsheets, concurrently
+        
+        Every worksheet is read through get_typed_dataframe(), so cached frames
+        are reused and all reads share the client's read quota.
+        
+        Args:
+            targets (list): (sheet_url, worksheet_name) or (sheet_url, worksheet_name, account)
+                tuples, or dicts with 'sheet_url', 'worksheet_name' and optional 'account';
+                the account defaults to the worksheet name
+            schema (dict, optional): Column name to kind; defaults to SHEET_SCHEMA
+            max_workers (int, optional): Worksheets fetched at once; defaults to SHEETS_LOAD_WORKERS
+            progress_callback (callable, optional): Called as (completed, total) after each worksheet
+            
+        Returns:
+            pandas.DataFrame: The rows of every worksheet in target order, with SOURCE_COLUMNS
+                added ('Source Row' is the 0-based data row within its worksheet). Targets that
+                failed or had no data are listed in last_load_errors.
+        """
+        schema = schema or SHEET_SCHEMA
+        targets = [self._normalize_target(target) for target in targets]
+        frames = [None] * len(targets)
+        errors = {}
+        
+        def _load(target):
+            sheet = self.open_sheet_by_url(target['sheet_url'])
+            if sheet is None:
+                raise ValueError("could not open the spreadsheet")
+            worksheet = self.get_worksheet_by_name(sheet, target['worksheet_name'])
+            if worksheet is None:
+                raise ValueError("worksheet not found")
+            return self.get_typed_dataframe(worksheet, schema)
+            
+        workers = max(1, min(int(max_workers or SHEETS_LOAD_WORKERS), len(targets) or 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_load, target): index for index, target in enumerate(targets)}
+            for completed, future in enumerate(as_completed(futures), 1):
+                index = futures[future]
+                target = targets[index]
+                try:
+                    df = future.result()
+                    if df.empty:
+                        raise ValueError("no data found")
+                    frames[index] = df.assign(**{
+                        'Account': target['account'],
+                        'Source Sheet': target['sheet_url'],
+                        'Source Worksheet': target['worksheet_name'],
+                        'Source Row': df.index
+                    })
+                except Exception as e:
+                    print(f"Error loading worksheet '{target['worksheet_name']}': {str(e)}")
+                    errors[(target['sheet_url'], target['worksheet_name'])] = str(e)
+                if progress_callback:
+                    progress_callback(completed, len(targets))
+                    
+        self.last_load_errors = errors
+        frames = [df for df in frames if df is not None]
+        if not frames:
+            return pd.DataFrame(columns=SOURCE_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+        
+    def _normalize_target(self, target):
+        """Turn a load_worksheets() target into a dict"""
+        if isinstance(target, dict):
+            sheet_url, worksheet_name = target['sheet_url'], target['worksheet_name']
+            account = target.get('account')
+        else:
+            sheet_url, worksheet_name, *rest = target
+            account = rest[0] if rest else None
+        return {'sheet_url': sheet_url, 'worksheet_name': worksheet_name, 'account': account or worksheet_name}
+            
     def update_cell(self, worksheet, row, col, value):
         """Update a specific cell in the worksheet"""
         try:
             worksheet.update_cell(row, col, value)
+            self.frame_cache.invalidate(worksheet.spreadsheet.id, worksheet.id)
             return True
         except Exception as e:
             print(f"Error updating cell: {str(e)}")
@@ -90,33 +441,127 @@ class SheetsAPI:
         """Append a row to the worksheet"""
         try:
             worksheet.append_row(row_data)
+            self.frame_cache.invalidate(worksheet.spreadsheet.id, worksheet.id)
             return True
         except Exception as e:
             print(f"Error appending row: {str(e)}")
             return False
             
-    def update_analysis_column(self, worksheet, analysis_data, analysis_col_index):
-        """Update the analysis column with generated reports"""
-        try:
-            # Get the current values in the worksheet
-            all_values = worksheet.get_all_values()
-            header_row = all_values[0]
-            
-            # Ensure the analysis column exists
-            if len(header_row) <= analysis_col_index:
-                # Add a new column if needed
-                for i, row in enumerate(all_values):
-                    if i == 0:
-                        worksheet.update_cell(1, analysis_col_index + 1, "Analysis Report")
-                    row.append("")
-                    
-            # Update the analysis column with the new reports
-            for i, analysis in enumerate(analysis_data):
-                # Skip the header row
-                row_index = i + 2  # +2 because spreadsheet is 1-indexed and we skip header
-                worksheet.update_cell(row_index, analysis_col_index + 1, analysis)
-                
+    def _column_write_requests(self, col, values_by_row, header=None):
+        """
+        Group column writes into ranged batch_update payloads
+
+        Contiguous rows share one range; a payload is closed once it reaches
+        SHEETS_WRITE_MAX_CELLS cells or SHEETS_WRITE_MAX_BYTES of text.
+
+        Returns:
+            list: One list of {'range', 'values'} dicts per request
+        """
+        requests, ranges = [], []
+        cells = size = 0
+        if header is not None:
+            ranges.append({'range': rowcol_to_a1(1, col), 'values': [[header]]})
+            cells, size = 1, len(str(header).encode('utf-8'))
+
+        previous = None
+        for row_index in sorted(values_by_row):
+            value = values_by_row[row_index]
+            value = "" if value is None else value
+            value_size = len(str(value).encode('utf-8'))
+            if ranges and (cells + 1 > SHEETS_WRITE_MAX_CELLS or size + value_size > SHEETS_WRITE_MAX_BYTES):
+                requests.append(ranges)
+                ranges, cells, size, previous = [], 0, 0, None
+
+            # +2 because: +1 for 1-indexed spreadsheet, +1 for header row
+            sheet_row = row_index + 2
+            if previous is not None and sheet_row == previous + 1:
+                current = ranges[-1]
+                current['values'].append([value])
+                current['range'] = f"{current['range'].split(':')[0]}:{rowcol_to_a1(sheet_row, col)}"
+            else:
+                ranges.append({'range': rowcol_to_a1(sheet_row, col), 'values': [[value]]})
+            previous = sheet_row
+            cells += 1
+            size += value_size
+
+        if ranges:
+            requests.append(ranges)
+        return requests
+
+    def _ensure_grid(self, worksheet, rows, cols):
+        """
+        Grow a worksheet's grid to at least rows x cols, never shrinking it
+
+        Cached handles keep the grid size they were opened with, and resize()
+        sets an absolute size, so the current size is re-read before growing.
+        """
+        grid = worksheet._properties['gridProperties']
+        if grid['rowCount'] >= rows and grid['columnCount'] >= cols:
+            return
+        self._throttle_read()
+        metadata = worksheet.spreadsheet.fetch_sheet_metadata({'fields': 'sheets.properties'})
+        for sheet in metadata.get('sheets', []):
+            if sheet['properties']['sheetId'] == worksheet.id:
+                grid.update(sheet['properties']['gridProperties'])
+                break
+        new_rows, new_cols = max(grid['rowCount'], rows), max(grid['columnCount'], cols)
+        if (new_rows, new_cols) != (grid['rowCount'], grid['columnCount']):
+            worksheet.resize(rows=new_rows, cols=new_cols)
+            grid['rowCount'], grid['columnCount'] = new_rows, new_cols
+
+    def update_column_values(self, worksheet, col_index, values_by_row, header=None):
+        """
+        Write values into one column using as few requests as possible
+
+        Args:
+            worksheet (gspread.Worksheet): Worksheet to update
+            col_index (int): 0-based column index
+            values_by_row (dict): Value per 0-based data row (row 0 is the first row after the header)
+            header (str, optional): Text to write into the column's header cell
+
+        Returns:
+            bool: True if every request succeeded
+        """
+        try:
+            col = col_index + 1
+            last_row = max(values_by_row) + 2 if values_by_row else 1
+            # Writing outside the grid fails, so grow it first
+            self._ensure_grid(worksheet, last_row, col)
+
+            for ranges in self._column_write_requests(col, values_by_row, header):
+                worksheet.batch_update(ranges, value_input_option='RAW')
             return True
+        except Exception as e:
+            print(f"Error updating column values: {str(e)}")
+            return False
+        finally:
+            # Don't serve pre-write data while the revision check is unavailable
+            self.frame_cache.invalidate(worksheet.spreadsheet.id, worksheet.id)
+
+    def update_analysis_column(self, worksheet, analysis_data, analysis_col_index):
+        """
+        Update the analysis column with generated reports
+
+        Args:
+            worksheet (gspread.Worksheet): Worksheet to update
+            analysis_data (list or dict): Reports for data rows 0..n-1, or reports keyed
+                by 0-based data row for non-contiguous selections
+            analysis_col_index (int): 0-based index of the analysis column
+
+        Returns:
+            bool: True if the write succeeded
+        """
+        try:
+            # Only the header row is needed to know whether the column exists; a failed
+            # read must not be mistaken for a missing header and overwrite it
+            header_row = self.get_header(worksheet, raise_errors=True)
+            
+            # Ensure the analysis column has a header
+            header = "Analysis Report" if len(header_row) <= analysis_col_index else None
+            
+            if not isinstance(analysis_data, dict):
+                analysis_data = dict(enumerate(analysis_data))
+            return self.update_column_values(worksheet, analysis_col_index, analysis_data, header=header)
         except Exception as e:
             print(f"Error updating analysis column: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
@@ -0,0 +1,94 @@
+import threading
+
+
+class _Call:
+    """An in-flight call that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running wait and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.shared = 0
+
+    def begin(self, key):
+        """
+        Join or start the execution for a key
+
+        Returns:
+            tuple: (call, leader); the leader must call finish(), other callers wait()
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self.executions += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        """Publish the leader's result (or exception) to waiting callers"""
+        call.result = result
+        call.error = error
+        # Later callers start a fresh execution (and will usually hit the cache)
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.done.set()
+
+    def wait(self, call):
+        """Wait for another caller's execution and return its result"""
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key, fn):
+        """
+        Run fn once per key among concurrent callers
+
+        Args:
+            key (str): Identity of the work, e.g. an analysis cache key
+            fn (callable): Function performing the work
+
+        Returns:
+            tuple: (result, shared) where shared is True if another caller's
+                execution was reused
+        """
+        call, leader = self.begin(key)
+        if not leader:
+            return self.wait(call), True
+
+        try:
+            result = fn()
+        except Exception as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result, False
+
+    def in_flight(self):
+        """Number of keys currently executing"""
+        with self._lock:
+            return len(self._calls)
+
+
+# Process-wide group shared by every OpenAIAPI instance and Streamlit session
+analysis_flights = SingleFlight()
@@ -0,0 +1,74 @@
+import os
+import json
+
+from analysis_cache import AnalysisCache, make_cache_key
+
+
+def _age(cache, key, mtime):
+    os.utime(cache._path(key), (mtime, mtime))
+
+
+def test_keys_ignore_dict_order():
+    assert make_cache_key({'a': 1, 'b': [1, 2]}) == make_cache_key({'b': [1, 2], 'a': 1})
+    assert make_cache_key({'a': 1}) != make_cache_key({'a': 2})
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = AnalysisCache(str(tmp_path), max_entries=3)
+    for n, key in enumerate("abc"):
+        cache.set(key, f"report {key}")
+        _age(cache, key, 1000 + n)
+    # Reading 'a' makes 'b' the least recently used entry
+    assert cache.get("a") == "report a"
+    cache.set("d", "report d")
+
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["report a", "report c", "report d"]
+    stats = cache.stats()
+    assert stats['entries'] == 3
+    assert stats['evictions'] == 1
+
+
+def test_limit_covers_entries_from_other_instances(tmp_path):
+    first = AnalysisCache(str(tmp_path), max_entries=3)
+    second = AnalysisCache(str(tmp_path), max_entries=3)
+    first.set("a", "report a")
+    first.set("b", "report b")
+    _age(first, "a", 1000)
+    _age(first, "b", 1001)
+    second.set("c", "report c")
+    second.set("d", "report d")
+
+    assert len(os.listdir(tmp_path)) == 3
+    assert second.get("a") is None
+    # Entries written by the other instance are served
+    assert second.get("b") == "report b"
+    assert first.get("d") == "report d"
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = AnalysisCache(str(tmp_path), max_age_seconds=60)
+    cache.set("a", "report a")
+    with open(cache._path("a")) as f:
+        entry = json.load(f)
+    entry['created_at'] -= 120
+    with open(cache._path("a"), 'w') as f:
+        json.dump(entry, f)
+
+    assert cache.get("a") is None
+    assert not os.path.exists(cache._path("a"))
+
+
+def test_disabled_and_clear(tmp_path):
+    disabled = AnalysisCache(str(tmp_path), enabled=False)
+    disabled.set("a", "report a")
+    assert disabled.get("a") is None
+    assert os.listdir(tmp_path) == []
+
+    cache = AnalysisCache(str(tmp_path))
+    cache.set("a", "report a")
+    cache.set("b", "")
+    assert cache.stats()['entries'] == 1
+    cache.clear()
+    assert cache.get("a") is None
+    assert cache.stats()['hit_rate'] == 0.0
@@ -0,0 +1,102 @@
+import pytest
+
+from account_baselines import AccountBaselines
+from analysis_cache import AnalysisCache
+from analyzer import TikTokAnalyzer
+from batch_cli import follow_job
+from batch_jobs import BatchJob, LocalBatchBackend, JOB_MERGED, JOB_PARTIAL
+from llm_backends import MockBackend
+from load_test import make_sheet, FakeSheetsAPI
+from openai_api import OpenAIAPI
+from report_model import AnalysisReport
+from sheet_sync import SheetSync
+
+
+class FlakyCompletion:
+    """Completes batch requests with the mock backend, failing the calls whose numbers are given"""
+
+    def __init__(self, failing_calls):
+        self.mock = MockBackend(latency="fixed:0", seed=1)
+        self.failing_calls = set(failing_calls)
+        self.calls = 0
+
+    def __call__(self, body):
+        self.calls += 1
+        if self.calls in self.failing_calls:
+            raise RuntimeError("Simulated request failure")
+        return self.mock.complete(body).text
+
+
+@pytest.fixture
+def analyzer(tmp_path, monkeypatch):
+    # Jobs, sync state and baselines use paths relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    openai_api = OpenAIAPI(cache=AnalysisCache(str(tmp_path / "cache")), backend=MockBackend(latency="fixed:0"))
+    return TikTokAnalyzer(FakeSheetsAPI(make_sheet(4)), openai_api,
+                          baselines=AccountBaselines(str(tmp_path / "baselines.json")))
+
+
+def _wait_for_last_submission(job, backend):
+    backend.wait(job.state['submissions'][-1]['backend_job_id'], timeout=10)
+
+
+def test_create_collect_resubmit_merge(analyzer, tmp_path):
+    backend = LocalBatchBackend(complete_fn=FlakyCompletion([2]), work_dir=str(tmp_path / "backend"))
+    stored = []
+
+    def report_store(**kwargs):
+        stored.append(kwargs)
+
+    success, message, job = analyzer.create_batch_job("sheet", "Account A Data", analysis_col_index=13, backend=backend)
+    assert success, message
+    assert job.summary()['submitted'] == 4
+    # Nothing counts as analyzed before results come back
+    assert SheetSync("sheet", "Account A Data").triage_scores() == {}
+
+    _wait_for_last_submission(job, backend)
+    success, message, summary = analyzer.collect_batch_job(job, backend, report_store=report_store)
+    assert success, message
+    assert (summary['completed'], summary['failed'], summary['outstanding']) == (3, 1, 0)
+    assert summary['status'] == JOB_PARTIAL
+    assert analyzer.sheets_api.written_rows == 3
+    assert len(stored) == 3
+    assert all(isinstance(kwargs['structured_report'], AnalysisReport) for kwargs in stored)
+    failed_row = job.state['items'][job.failed_items()[0]]['row_index']
+    scores = SheetSync("sheet", "Account A Data").triage_scores()
+    assert sorted(scores) == sorted({0, 1, 2, 3} - {failed_row})
+
+    assert job.resubmit_failed(backend) is not None
+    assert len(job.state['submissions']) == 2
+    _wait_for_last_submission(job, backend)
+    success, message, summary = analyzer.collect_batch_job(job, backend, report_store=report_store)
+    assert success, message
+    assert (summary['completed'], summary['failed']) == (4, 0)
+    assert summary['status'] == JOB_MERGED
+    # Only the resubmitted row is written and stored again
+    assert analyzer.sheets_api.written_rows == 4
+    assert len(stored) == 4
+    assert sorted(SheetSync("sheet", "Account A Data").triage_scores()) == [0, 1, 2, 3]
+
+    reloaded = BatchJob.load(job.job_id)
+    assert reloaded.status == JOB_MERGED
+    assert reloaded.results() == job.results()
+    assert job.resubmit_failed(backend) is None
+
+
+def test_follow_job_retries_failed_requests(analyzer, tmp_path):
+    backend = LocalBatchBackend(complete_fn=FlakyCompletion([1, 3]), work_dir=str(tmp_path / "backend"))
+    success, message, job = analyzer.create_batch_job("sheet", "Account A Data", analysis_col_index=13, backend=backend)
+    assert success, message
+
+    assert follow_job(analyzer, job, backend, wait=True, retries=1, poll_interval=0.01)
+    assert job.status == JOB_MERGED
+    assert len(job.state['submissions']) == 2
+
+
+def test_follow_job_reports_failures_without_retries(analyzer, tmp_path):
+    backend = LocalBatchBackend(complete_fn=FlakyCompletion([1]), work_dir=str(tmp_path / "backend"))
+    success, message, job = analyzer.create_batch_job("sheet", "Account A Data", analysis_col_index=13, backend=backend)
+    assert success, message
+
+    assert not follow_job(analyzer, job, backend, wait=True, poll_interval=0.01)
+    assert job.summary()['failed'] == 1
@@ -0,0 +1,103 @@
+import time
+import threading
+
+import pytest
+
+from job_queue import JobQueue, JOB_QUEUED, JOB_RUNNING, JOB_FAILED, JOB_CANCELLED, JOB_COMPLETED
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"))
+
+
+def _age_heartbeat(queue, job_id, seconds):
+    with queue._connect() as connection:
+        connection.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time() - seconds, job_id))
+
+
+def test_claims_oldest_first(queue):
+    first = queue.enqueue("analyze_sheet", {'sheet_url': "a"})
+    second = queue.enqueue("analyze_sheet", {'sheet_url': "b"})
+
+    job = queue.claim("worker-1")
+    assert job['id'] == first
+    assert job['status'] == JOB_RUNNING
+    assert job['worker'] == "worker-1"
+    assert job['attempts'] == 1
+    assert job['params'] == {'sheet_url': "a"}
+    assert queue.claim("worker-2")['id'] == second
+    assert queue.claim("worker-3") is None
+
+
+def test_concurrent_claims_never_share_a_job(queue):
+    job_ids = {queue.enqueue("analyze_sheet", {'n': n}) for n in range(30)}
+    claimed = []
+    lock = threading.Lock()
+
+    def drain(worker):
+        while True:
+            job = queue.claim(worker)
+            if job is None:
+                return
+            with lock:
+                claimed.append(job['id'])
+
+    threads = [threading.Thread(target=drain, args=(f"worker-{n}",)) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(job_ids)
+
+
+def test_stale_job_is_requeued_then_failed(queue):
+    job_id = queue.enqueue("analyze_sheet", {})
+    queue.claim("worker-1")
+    _age_heartbeat(queue, job_id, 600)
+
+    assert queue.requeue_stale(stale_seconds=300, max_attempts=2) == 1
+    job = queue.get(job_id)
+    assert job['status'] == JOB_QUEUED
+    assert job['worker'] is None
+
+    assert queue.claim("worker-2")['attempts'] == 2
+    _age_heartbeat(queue, job_id, 600)
+    assert queue.requeue_stale(stale_seconds=300, max_attempts=2) == 1
+    assert queue.get(job_id)['status'] == JOB_FAILED
+
+
+def test_live_job_is_left_alone(queue):
+    job_id = queue.enqueue("analyze_sheet", {})
+    queue.claim("worker-1")
+    _age_heartbeat(queue, job_id, 600)
+    queue.update_progress(job_id, 5, 10, run_id="run-1")
+
+    assert queue.requeue_stale(stale_seconds=300) == 0
+    job = queue.get(job_id)
+    assert job['status'] == JOB_RUNNING
+    assert (job['progress_done'], job['progress_total'], job['run_id']) == (5, 10, "run-1")
+
+
+def test_release_and_cancel(queue):
+    job_id = queue.enqueue("analyze_sheet", {})
+    queue.claim("worker-1")
+    # Running jobs can't be cancelled, only released back to the queue
+    assert not queue.cancel(job_id)
+    queue.release(job_id, "Shutting down")
+    assert queue.get(job_id)['status'] == JOB_QUEUED
+    assert queue.cancel(job_id)
+    assert queue.get(job_id)['status'] == JOB_CANCELLED
+    assert queue.claim("worker-1") is None
+
+
+def test_complete_keeps_the_run_id(queue):
+    job_id = queue.enqueue("analyze_sheet", {})
+    queue.claim("worker-1")
+    queue.update_progress(job_id, 1, 2, run_id="run-1")
+    queue.complete(job_id, {'reports': 2}, "Done")
+    job = queue.get(job_id)
+    assert job['status'] == JOB_COMPLETED
+    assert job['result'] == {'reports': 2}
+    assert job['run_id'] == "run-1"
+    assert queue.counts() == {JOB_COMPLETED: 1}
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from analysis_cache import AnalysisCache
+from llm_backends import MockBackend
+from openai_api import OpenAIAPI, StreamFailure
+from rate_limiter import RateLimitScheduler
+from single_flight import SingleFlight
+
+VIDEO = {
+    'Title/Hook': "Three mistakes new runners make",
+    'Caption': "Number two surprised me",
+    'Views (24h)': 12000,
+    'Likes': 900,
+    'Comments': 40,
+    'Saves': 75
+}
+
+
+class BrokenCache(AnalysisCache):
+    """Cache whose writes fail"""
+
+    def set(self, key, report, metadata=None):
+        raise OSError("Disk full")
+
+
+def _make_api(cache):
+    return OpenAIAPI(cache=cache, scheduler=RateLimitScheduler(), flights=SingleFlight(),
+                     backend=MockBackend(latency="fixed:0"))
+
+
+def _join_in_thread(api):
+    """Start a coalesced stream consumer and return (thread, result list)"""
+    result = []
+    thread = threading.Thread(target=lambda: result.append("".join(api.generate_analysis_stream(VIDEO))), daemon=True)
+    thread.start()
+    return thread, result
+
+
+def test_stream_releases_waiters_when_cache_write_fails(tmp_path):
+    api = _make_api(BrokenCache(str(tmp_path)))
+    leader = api.generate_analysis_stream(VIDEO)
+    chunks = [next(leader)]
+    thread, result = _join_in_thread(api)
+    while api.flights.shared == 0:
+        thread.join(0.01)
+
+    chunks.extend(leader)
+    thread.join(5)
+    assert not thread.is_alive()
+    assert isinstance(chunks[-1], StreamFailure)
+    assert result == ["".join(chunks[:-1])]
+
+
+def test_abandoned_stream_fails_waiters(tmp_path):
+    api = _make_api(AnalysisCache(str(tmp_path)))
+    leader = api.generate_analysis_stream(VIDEO)
+    next(leader)
+    thread, result = _join_in_thread(api)
+    while api.flights.shared == 0:
+        thread.join(0.01)
+
+    leader.close()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert len(result) == 1 and result[0].startswith("Error generating analysis")
+
+
+def test_stream_caches_the_finished_report(tmp_path):
+    api = _make_api(AnalysisCache(str(tmp_path)))
+    report = "".join(api.generate_analysis_stream(VIDEO))
+    assert report and not isinstance(report, StreamFailure)
+    assert list(api.generate_analysis_stream(VIDEO)) == [report]
+    assert api.cache.hits == 1
+
+
+def test_stream_raises_when_asked(tmp_path):
+    api = _make_api(BrokenCache(str(tmp_path)))
+    with pytest.raises(OSError):
+        "".join(api.generate_analysis_stream(VIDEO, raise_errors=True))
+
+
+def test_refresh_closes_the_old_backend(tmp_path, monkeypatch):
+    closed = []
+
+    class ClosingBackend(MockBackend):
+        def close(self):
+            closed.append(self)
+
+    old_backend = ClosingBackend(latency="fixed:0")
+    api = OpenAIAPI(cache=AnalysisCache(str(tmp_path)), scheduler=RateLimitScheduler(), backend=old_backend)
+    monkeypatch.setenv("LLM_BACKEND", "mock")
+    assert api.refresh()
+    assert closed == [old_backend]
+    assert api.backend is not old_backend
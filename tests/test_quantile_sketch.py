@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from account_baselines import QuantileSketch
+
+QUANTILES = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+@pytest.fixture(scope="module")
+def values():
+    return np.random.default_rng(0).lognormal(mean=8.0, sigma=2.0, size=100000)
+
+
+def _relative_errors(sketch, values):
+    exact = np.quantile(values, QUANTILES, method='lower')
+    estimated = np.array([sketch.quantile(q) for q in QUANTILES])
+    return np.abs(estimated - exact) / exact
+
+
+def test_quantiles_within_relative_accuracy(values):
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    sketch.add(values)
+    assert sketch.count == len(values)
+    assert sketch.mean == pytest.approx(values.mean())
+    assert _relative_errors(sketch, values).max() <= 0.01 + 1e-9
+
+
+def test_chunked_adds_match_a_single_add(values):
+    whole, chunked = QuantileSketch(), QuantileSketch()
+    whole.add(values)
+    for chunk in np.array_split(values, 37):
+        chunked.add(chunk)
+    assert chunked.buckets == whole.buckets
+    assert [chunked.quantile(q) for q in QUANTILES] == [whole.quantile(q) for q in QUANTILES]
+
+
+def test_bucket_budget_only_collapses_the_low_tail(values):
+    sketch = QuantileSketch(relative_accuracy=0.01, max_buckets=200)
+    sketch.add(values)
+    assert len(sketch.buckets) <= 200
+    assert sum(sketch.buckets.values()) == len(values)
+    # Quantiles above the merged lowest bucket keep the accuracy guarantee
+    floor = sketch.gamma ** min(sketch.buckets)
+    checked = [q for q in QUANTILES if np.quantile(values, q, method='lower') > floor]
+    assert 0.99 in checked
+    exact = np.quantile(values, checked, method='lower')
+    estimated = np.array([sketch.quantile(q) for q in checked])
+    assert (np.abs(estimated - exact) / exact).max() <= 0.01 + 1e-9
+
+
+def test_percentile_rank(values):
+    sketch = QuantileSketch()
+    sketch.add(values)
+    probes = np.quantile(values, [0.1, 0.5, 0.9])
+    assert sketch.percentile_rank(probes) == pytest.approx([10, 50, 90], abs=1.0)
+    ranks = sketch.percentile_rank([np.nan, -5.0, values.max() * 10])
+    assert np.isnan(ranks[0])
+    assert ranks[1] == 0.0
+    assert ranks[2] == 100.0
+
+
+def test_zeros_and_invalid_values():
+    sketch = QuantileSketch()
+    sketch.add([0, 0, 0, 5, 10, np.nan, np.inf])
+    assert sketch.count == 5
+    assert sketch.zero_count == 3
+    assert sketch.quantile(0.25) == 0.0
+    assert sketch.quantile(1.0) == 10.0
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_round_trip(values):
+    sketch = QuantileSketch()
+    sketch.add(values[:1000])
+    restored = QuantileSketch.from_dict(sketch.to_dict())
+    assert [restored.quantile(q) for q in QUANTILES] == [sketch.quantile(q) for q in QUANTILES]
+    assert restored.count == sketch.count
@@ -0,0 +1,60 @@
+from run_journal import RunJournal
+
+
+def _journal(tmp_path):
+    journal = RunJournal.create("sheet", "Account A Data", analysis_col_index=13, runs_dir=str(tmp_path))
+    journal.record(0, "fp0", report="Report 0")
+    journal.record(1, "fp1", error="Timed out")
+    journal.record(2, "fp2", report="Report 2")
+    journal.mark_written([0])
+    return journal
+
+
+def test_replay_restores_state(tmp_path):
+    journal = _journal(tmp_path)
+    loaded = RunJournal.load(journal.run_id, runs_dir=str(tmp_path))
+    assert loaded.run['worksheet_name'] == "Account A Data"
+    assert loaded.completed_report(0, "fp0") == "Report 0"
+    # Failed rows and rows whose data changed are analyzed again
+    assert loaded.completed_report(1, "fp1") is None
+    assert loaded.completed_report(2, "changed") is None
+    assert loaded.unwritten_reports() == {2: "Report 2"}
+    assert loaded.summary()['completed'] == 2
+    assert loaded.summary()['failed'] == 1
+
+
+def test_torn_last_line_is_skipped_and_not_extended(tmp_path):
+    journal = _journal(tmp_path)
+    with open(journal.path, 'a') as f:
+        f.write('{"type": "row", "row_index": 3, "fingerp')
+
+    loaded = RunJournal.load(journal.run_id, runs_dir=str(tmp_path))
+    assert sorted(loaded.rows) == [0, 1, 2]
+
+    # The next entry starts on its own line instead of continuing the torn one
+    loaded.record(3, "fp3", report="Report 3")
+    reloaded = RunJournal.load(journal.run_id, runs_dir=str(tmp_path))
+    assert reloaded.completed_report(3, "fp3") == "Report 3"
+    assert sorted(reloaded.rows) == [0, 1, 2, 3]
+    assert not reloaded._torn
+
+
+def test_torn_line_in_the_middle(tmp_path):
+    journal = _journal(tmp_path)
+    with open(journal.path, 'a') as f:
+        f.write('{"type": "written", "rows": [2\n')
+    journal.record(4, "fp4", report="Report 4")
+
+    loaded = RunJournal.load(journal.run_id, runs_dir=str(tmp_path))
+    assert loaded.unwritten_reports() == {2: "Report 2", 4: "Report 4"}
+
+
+def test_rerecorded_row_needs_writing_again(tmp_path):
+    journal = _journal(tmp_path)
+    journal.record(0, "fp0-new", report="New report 0")
+    loaded = RunJournal.load(journal.run_id, runs_dir=str(tmp_path))
+    assert loaded.unwritten_reports() == {0: "New report 0", 2: "Report 2"}
+
+
+def test_missing_journal(tmp_path):
+    assert RunJournal.load("does-not-exist", runs_dir=str(tmp_path)) is None
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from triage import triage_dataframe, select_rows_for_llm
+
+# 0: strong on every ratio, 1: likes without comments or saves, 2: no engagement,
+# 3: strong but a lower score than last time, 4: more likes than views
+ROWS = pd.DataFrame({
+    'Views (24h)': [1000, 1000, 1000, 1000, 100],
+    'Likes': [100, 100, 1, 80, 200],
+    'Comments': [10, 0, 0, 8, 1],
+    'Saves': [10, 0, 0, 6, 1]
+})
+PREVIOUS_SCORES = {0: 10.0, 1: 4.0, 2: 0.0, 3: 6.0}
+
+
+@pytest.fixture
+def triaged():
+    return triage_dataframe(ROWS)
+
+
+def test_scores_and_flags(triaged):
+    assert triaged['Triage Score'].tolist()[:4] == [10.0, 4.0, 0.0, 7.4]
+    assert triaged['flag_surface_level'].tolist() == [False, True, False, False, False]
+    assert triaged['flag_no_engagement'].tolist() == [False, False, True, False, False]
+    assert triaged['flag_anomaly'].tolist() == [False, False, False, False, True]
+
+
+@pytest.mark.parametrize("policy, expected", [
+    ('all', [0, 1, 2, 3, 4]),
+    ('flagged', [1, 2, 4]),
+    ('changed', [3, 4]),
+    ('changed_or_flagged', [1, 2, 3, 4])
+])
+def test_policies(triaged, policy, expected):
+    assert select_rows_for_llm(triaged, policy, PREVIOUS_SCORES).tolist() == expected
+
+
+def test_score_delta(triaged):
+    assert select_rows_for_llm(triaged, 'changed', PREVIOUS_SCORES, score_delta=2.0).tolist() == [4]
+
+
+def test_changed_without_previous_scores_selects_everything(triaged):
+    assert select_rows_for_llm(triaged, 'changed').tolist() == [0, 1, 2, 3, 4]
+    assert select_rows_for_llm(triaged, 'changed', pd.Series(PREVIOUS_SCORES)).tolist() == [3, 4]
+
+
+def test_keeps_the_frame_index():
+    triaged = triage_dataframe(ROWS.set_index(pd.Index([10, 11, 12, 13, 14])))
+    assert select_rows_for_llm(triaged, 'flagged').tolist() == [11, 12, 14]
+
+
+def test_unknown_policy(triaged):
+    with pytest.raises(ValueError):
+        select_rows_for_llm(triaged, 'sometimes')
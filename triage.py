@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+
+# Thresholds for the deterministic rules in the analysis prompt; ratios are percentages
+TRIAGE_THRESHOLDS = {
+    # "If Views to Like Ratio > 6%, recognize strong initial resonance"
+    'strong_like_ratio': 6.0,
+    'strong_comment_ratio': 0.5,
+    'strong_save_ratio': 0.5,
+    'weak_comment_ratio': 0.1,
+    'weak_save_ratio': 0.1,
+    # Ratio values at which a metric contributes its full weight to the score
+    'like_ratio_full_score': 10.0,
+    'comment_ratio_full_score': 1.0,
+    'save_ratio_full_score': 1.0
+}
+
+# Score weights: likes are the base, comments the emotional signal, saves the memory signal
+SCORE_WEIGHTS = {'like': 0.4, 'comment': 0.3, 'save': 0.3}
+
+# Flags that always warrant a full LLM analysis under the "flagged" policies
+ATTENTION_FLAGS = ['flag_anomaly', 'flag_surface_level', 'flag_no_engagement']
+
+TRIAGE_POLICIES = ('all', 'flagged', 'changed', 'changed_or_flagged')
+
+
+def _numeric(df, column):
+    """Get a column as a float array, treating missing or invalid values as 0"""
+    if column not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[column], errors='coerce').fillna(0).to_numpy(dtype=float)
+
+
+def _ratio(numerator, denominator):
+    """Element-wise percentage with 0 where the denominator is 0"""
+    out = np.zeros_like(numerator, dtype=float)
+    np.divide(numerator * 100.0, denominator, out=out, where=denominator > 0)
+    return out
+
+
+def triage_dataframe(df, thresholds=None):
+    """
+    Evaluate the prompt's deterministic rules over every row at once
+
+    Expects the frame produced by video_metrics.compute_metrics;
+    ratios missing from the frame are computed from the raw counts.
+
+    Args:
+        df (pandas.DataFrame): Processed video data
+        thresholds (dict, optional): Overrides for TRIAGE_THRESHOLDS
+
+    Returns:
+        pandas.DataFrame: Frame indexed like df with boolean flag_* columns,
+            a 'Triage Score' (0-10) and a 'Triage Flags' summary string
+    """
+    limits = {**TRIAGE_THRESHOLDS, **(thresholds or {})}
+
+    views = _numeric(df, 'Views (24h)' if 'Views (24h)' in df.columns else 'Views')
+    likes = _numeric(df, 'Likes')
+    comments = _numeric(df, 'Comments')
+    saves = _numeric(df, 'Saves')
+
+    like_ratio = _numeric(df, 'Views to Like Ratio (%)') if 'Views to Like Ratio (%)' in df.columns else _ratio(likes, views)
+    comment_ratio = _numeric(df, 'Views to Comment Ratio (%)') if 'Views to Comment Ratio (%)' in df.columns else _ratio(comments, views)
+    save_ratio = _numeric(df, 'Views to Save Ratio (%)') if 'Views to Save Ratio (%)' in df.columns else _ratio(saves, views)
+    # Guard against inf/NaN left over from divisions by zero views
+    like_ratio, comment_ratio, save_ratio = (
+        np.nan_to_num(r, nan=0.0, posinf=0.0, neginf=0.0) for r in (like_ratio, comment_ratio, save_ratio)
+    )
+
+    strong_likes = like_ratio > limits['strong_like_ratio']
+    strong_comments = comment_ratio >= limits['strong_comment_ratio']
+    strong_saves = save_ratio >= limits['strong_save_ratio']
+
+    flags = pd.DataFrame({
+        'flag_strong_resonance': strong_likes,
+        # High likes with low comments/saves = "surface-level resonance"
+        'flag_surface_level': strong_likes & ((comment_ratio < limits['weak_comment_ratio']) |
+                                              (save_ratio < limits['weak_save_ratio'])),
+        'flag_emotional_success': strong_comments,
+        'flag_memorable': strong_saves,
+        # "Lack of all three = Very low viral score"
+        'flag_no_engagement': ~(strong_likes | strong_comments | strong_saves),
+        # Data that can't be right: engagement above views, negative counts, engagement without views
+        'flag_anomaly': ((likes > views) | (comments > views) | (saves > views) |
+                         (np.minimum.reduce([views, likes, comments, saves]) < 0) |
+                         ((views == 0) & (likes + comments + saves > 0)))
+    }, index=df.index)
+
+    score = 10.0 * (
+        SCORE_WEIGHTS['like'] * np.clip(like_ratio / limits['like_ratio_full_score'], 0, 1) +
+        SCORE_WEIGHTS['comment'] * np.clip(comment_ratio / limits['comment_ratio_full_score'], 0, 1) +
+        SCORE_WEIGHTS['save'] * np.clip(save_ratio / limits['save_ratio_full_score'], 0, 1)
+    )
+    flags['Triage Score'] = np.round(score, 1)
+
+    # Human-readable summary: encode the flags as a bitmask and label each distinct mask once
+    flag_columns = [c for c in flags.columns if c.startswith('flag_')]
+    masks = np.zeros(len(flags), dtype=np.int64)
+    for bit, column in enumerate(flag_columns):
+        masks |= flags[column].to_numpy().astype(np.int64) << bit
+    labels = {
+        int(mask): ', '.join(column[len('flag_'):] for bit, column in enumerate(flag_columns) if mask >> bit & 1)
+        for mask in np.unique(masks)
+    }
+    summary = pd.Series(masks, index=df.index).map(labels)
+    flags['Triage Flags'] = summary
+    return flags
+
+
+def select_rows_for_llm(triaged, policy='all', previous_scores=None, score_delta=1.0):
+    """
+    Choose which rows still need a full LLM analysis
+
+    Args:
+        triaged (pandas.DataFrame): Output of triage_dataframe
+        policy (str): 'all', 'flagged' (attention flags only), 'changed'
+            (new rows or score moved by at least score_delta) or 'changed_or_flagged'
+        previous_scores (dict or pandas.Series, optional): Triage scores from the last run, by row index
+        score_delta (float): Minimum score change that counts as changed
+
+    Returns:
+        pandas.Index: Index labels of the rows to send to the LLM
+    """
+    if policy not in TRIAGE_POLICIES:
+        raise ValueError(f"Unknown triage policy '{policy}'. Expected one of {TRIAGE_POLICIES}")
+    if policy == 'all':
+        return triaged.index
+
+    flagged = triaged[ATTENTION_FLAGS].any(axis=1)
+
+    previous = pd.Series(previous_scores if previous_scores is not None else {}, dtype=float)
+    previous = previous.reindex(triaged.index)
+    changed = previous.isna() | ((triaged['Triage Score'] - previous).abs() >= score_delta)
+
+    if policy == 'flagged':
+        mask = flagged
+    elif policy == 'changed':
+        mask = changed
+    else:
+        mask = flagged | changed
+    return triaged.index[mask.to_numpy()]
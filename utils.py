@@ -1,8 +1,16 @@
 import os
 import re
-import pandas as pd
+import json
+import tempfile
+from contextlib import contextmanager
 from datetime import datetime
 
+# Optional on Windows, where state files are only shared within one process
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 def validate_google_sheet_url(url):
     """
     Validate that a URL is a valid Google Sheet URL
@@ -17,53 +25,83 @@ def validate_google_sheet_url(url):
     pattern = r'https://docs\.google\.com/spreadsheets/d/([a-zA-Z0-9-_]+)(/edit|/view)'
     return bool(re.match(pattern, url))
     
-def validate_column_names(df, required_columns):
+def spreadsheet_id_from_url(url):
     """
-    Validate that a DataFrame contains all required columns
+    Extract the spreadsheet id from a Google Sheet URL
     
     Args:
-        df (pandas.DataFrame): DataFrame to validate
-        required_columns (list): List of required column names
+        url (str): Google Sheet URL
         
     Returns:
-        tuple: (is_valid (bool), missing_columns (list))
+        str: The spreadsheet id, or None if the URL has none
     """
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    is_valid = len(missing_columns) == 0
-    return is_valid, missing_columns
+    match = re.search(r'/spreadsheets/d/([a-zA-Z0-9-_]+)', url or "")
+    return match.group(1) if match else None
     
-def format_report_for_display(report):
+def write_json_atomic(path, data, **dump_kwargs):
     """
-    Format an analysis report for display in Streamlit
+    Write JSON to a file atomically
+    
+    The data goes to a uniquely named temp file in the same directory, which then
+    replaces the target, so readers never see a partial file and concurrent
+    writers in other threads or processes never share a temp file.
     
     Args:
-        report (str): Raw report text
-        
-    Returns:
-        str: Formatted report with HTML/Markdown styling
+        path (str): File to write
+        data: JSON-serializable data
+        **dump_kwargs: Extra arguments for json.dump
     """
-    # Replace section headers with styled headers
-    sections = {
-        "Overview Summary": "## Overview Summary",
-        "Detailed Metric Breakdown": "## Detailed Metric Breakdown",
-        "Strengths Identified": "## Strengths Identified",
-        "Weaknesses Identified": "## Weaknesses Identified",
-        "Actionable Improvements": "## Actionable Improvements",
-        "Viral Potential Score": "## Viral Potential Score"
-    }
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or ".", prefix=f"{name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, **dump_kwargs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+@contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive lock on a state file across processes
     
-    formatted_report = report
-    for section, markdown in sections.items():
-        # Match the section name at the beginning of a line or after newlines
-        pattern = fr'(?:\n|^)({section}|{section}:)'
-        formatted_report = re.sub(pattern, f'\n{markdown}', formatted_report)
+    The lock is taken on a companion "<path>.lock" file, so it survives the
+    atomic replace of the file itself. Without fcntl it is a no-op.
     
-    # Format metric names in bold
-    metrics = ["Like-to-View", "Comment-to-View", "Comment-to-Like", "Save-to-View", "Save-to-Like"]
-    for metric in metrics:
-        formatted_report = formatted_report.replace(f"{metric}:", f"**{metric}:**")
+    Args:
+        path (str): State file to lock
+    """
+    if fcntl is None:
+        yield
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f"{path}.lock", 'a') as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+def validate_column_names(df, required_columns):
+    """
+    Validate that a DataFrame contains all required columns
     
-    return formatted_report
+    Args:
+        df (pandas.DataFrame): DataFrame to validate
+        required_columns (list): List of required column names
+        
+    Returns:
+        tuple: (is_valid (bool), missing_columns (list))
+    """
+    missing_columns = [col for col in required_columns if col not in df.columns]
+    is_valid = len(missing_columns) == 0
+    return is_valid, missing_columns
     
 def export_to_csv(reports, video_data, output_path=None):
     """
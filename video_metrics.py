@@ -0,0 +1,108 @@
+import math
+import numpy as np
+
+from sheet_schema import SHEET_SCHEMA, apply_schema, parse_number
+
+# Schema used for metric computation: the sheet columns plus the 'Views' key of manual input
+METRIC_SCHEMA = {**SHEET_SCHEMA, 'Views': 'count'}
+
+# Ratio column to its (numerator, denominator) counts, as percentages;
+# 'Views' stands for whichever view count column the data has
+RATIO_DEFINITIONS = {
+    'Views to Like Ratio (%)': ('Likes', 'Views'),
+    'Views to Comment Ratio (%)': ('Comments', 'Views'),
+    'Views to Save Ratio (%)': ('Saves', 'Views'),
+    'Like to Comment Ratio (%)': ('Comments', 'Likes'),
+    'Like to Save Ratio (%)': ('Saves', 'Likes')
+}
+
+
+def view_column(columns):
+    """Name of the view count column: 'Views (24h)' in sheet data, 'Views' in manual input"""
+    return 'Views (24h)' if 'Views (24h)' in columns else 'Views'
+
+
+def safe_percent(numerator, denominator):
+    """Element-wise percentage rounded to 2 decimals, 0 where the denominator is not positive"""
+    out = np.zeros(np.shape(numerator), dtype=float)
+    np.divide(numerator * 100.0, denominator, out=out, where=denominator > 0)
+    return np.round(out, 2, out=out)
+
+
+def compute_metrics(df, schema=None):
+    """
+    Type the video columns and compute every engagement ratio in one pass
+
+    Text columns are filled with '', counts are coerced to numbers with blanks
+    as 0, and the five ratios are derived from the counts with safe division
+    (0 instead of inf/NaN when views or likes are 0). Columns that are already
+    typed are not converted again, and only a shallow copy of df is made.
+
+    Args:
+        df (pandas.DataFrame): Video rows, as read from the sheet or built from input
+        schema (dict, optional): Column name to kind; defaults to METRIC_SCHEMA
+
+    Returns:
+        pandas.DataFrame: Frame indexed like df with typed columns and the ratio columns;
+            ratios are left as-is when a count column is missing
+    """
+    result = apply_schema(df, schema or METRIC_SCHEMA)
+    views = view_column(result.columns)
+    if any(column not in result.columns for column in (views, 'Likes', 'Comments', 'Saves')):
+        return result
+
+    counts = {name: result[column].to_numpy(dtype=float)
+              for name, column in (('Views', views), ('Likes', 'Likes'), ('Comments', 'Comments'), ('Saves', 'Saves'))}
+    for ratio, (numerator, denominator) in RATIO_DEFINITIONS.items():
+        result[ratio] = safe_percent(counts[numerator], counts[denominator])
+    return result
+
+
+def _count_value(value):
+    """Coerce one count to a plain int or float, treating blanks and invalid values as 0"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, np.number)):
+        value = parse_number(value)
+    if isinstance(value, np.number):
+        value = value.item()
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return 0
+        return int(value) if value.is_integer() else value
+    return value
+
+
+def _scalar_percent(numerator, denominator):
+    """safe_percent() for one pair of counts, with the same rounding"""
+    if denominator <= 0:
+        return 0.0
+    # round() of the scaled value is half-to-even like np.round, so both paths agree
+    return round(numerator * 100.0 / denominator * 100) / 100
+
+
+def compute_video_metrics(video_data):
+    """
+    compute_metrics() for a single video dict, without building a DataFrame
+
+    Args:
+        video_data (dict): Video fields using sheet or manual-input keys
+
+    Returns:
+        dict: A copy of video_data with its counts as plain numbers and the ratio keys set;
+            ratios are left as-is when a count is missing
+    """
+    result = dict(video_data)
+    views = view_column(result)
+    if any(key not in result for key in (views, 'Likes', 'Comments', 'Saves')):
+        return result
+
+    counts = {
+        'Views': _count_value(result[views]),
+        'Likes': _count_value(result['Likes']),
+        'Comments': _count_value(result['Comments']),
+        'Saves': _count_value(result['Saves'])
+    }
+    result.update({views: counts['Views'], 'Likes': counts['Likes'],
+                   'Comments': counts['Comments'], 'Saves': counts['Saves']})
+    for ratio, (numerator, denominator) in RATIO_DEFINITIONS.items():
+        result[ratio] = _scalar_percent(counts[numerator], counts[denominator])
+    return result
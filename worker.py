@@ -0,0 +1,158 @@
+import os
+import time
+import socket
+import argparse
+import threading
+import multiprocessing
+
+from dotenv import load_dotenv
+
+from job_queue import JobQueue, STALE_JOB_SECONDS
+
+# Seconds an idle worker waits before checking the queue again
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "2"))
+
+# Seconds between heartbeats of a running job
+WORKER_HEARTBEAT_SECONDS = float(os.getenv("WORKER_HEARTBEAT_SECONDS", "30"))
+
+# Job kinds a worker can run
+JOB_ANALYZE_SHEET = "analyze_sheet"
+
+
+def build_analyzer():
+    """Create the API clients and analyzer a worker reuses for all its jobs"""
+    from sheets_api import SheetsAPI
+    from openai_api import OpenAIAPI
+    from analyzer import TikTokAnalyzer
+
+    sheets_api = SheetsAPI()
+    openai_api = OpenAIAPI()
+    if not sheets_api.is_connected() or not openai_api.is_connected():
+        raise RuntimeError("Google Sheets and OpenAI must both be connected to run analysis jobs")
+    return TikTokAnalyzer(sheets_api, openai_api)
+
+
+def run_job(analyzer, queue, job):
+    """
+    Execute one claimed job and record its outcome
+
+    Progress and the id of the journaled run are stored in the queue as rows
+    finish. A job that was requeued after its worker died passes that run id
+    back to the analyzer, which then only analyzes the rows the run had not
+    completed.
+    """
+    if job['kind'] != JOB_ANALYZE_SHEET:
+        queue.fail(job['id'], f"Unknown job kind: {job['kind']}")
+        return
+
+    params = dict(job['params'])
+    if job['run_id']:
+        params['run_id'] = job['run_id']
+    analyzer.last_run_id = None
+
+    def _progress(completed, total):
+        queue.update_progress(job['id'], completed, total, run_id=analyzer.last_run_id)
+
+    # Keep the job alive while long LLM calls produce no progress
+    stop = threading.Event()
+
+    def _heartbeat():
+        while not stop.wait(WORKER_HEARTBEAT_SECONDS):
+            queue.heartbeat(job['id'])
+
+    heartbeat = threading.Thread(target=_heartbeat, daemon=True)
+    heartbeat.start()
+    try:
+        success, message, reports = analyzer.analyze_videos(progress_callback=_progress, **params)
+    finally:
+        stop.set()
+        heartbeat.join()
+
+    stats = analyzer.last_batch_stats or {}
+    result = {
+        'reports': len(reports),
+        'failed_rows': stats.get('failed_rows', 0),
+        'resumed_rows': stats.get('resumed_rows', 0)
+    }
+    if success:
+        queue.complete(job['id'], result, message, run_id=analyzer.last_run_id)
+    else:
+        queue.fail(job['id'], message, result, run_id=analyzer.last_run_id)
+
+
+def work(worker_id, queue_path=None, poll_interval=None, stale_seconds=None, once=False):
+    """
+    Claim and run jobs until interrupted
+
+    Args:
+        worker_id (str): Name recorded on the jobs this worker claims
+        queue_path (str, optional): Queue database; defaults to JOB_QUEUE_PATH
+        poll_interval (float, optional): Idle wait between queue checks
+        stale_seconds (int, optional): Heartbeat age after which another worker's job is requeued
+        once (bool): Exit when the queue is empty instead of waiting for new jobs
+    """
+    load_dotenv()
+    queue = JobQueue(queue_path)
+    poll_interval = poll_interval or WORKER_POLL_SECONDS
+    stale_seconds = stale_seconds or STALE_JOB_SECONDS
+    analyzer = build_analyzer()
+    print(f"Worker {worker_id} waiting for jobs in {queue.path}")
+
+    job = None
+    try:
+        while True:
+            recovered = queue.requeue_stale(stale_seconds)
+            if recovered:
+                print(f"Worker {worker_id} recovered {recovered} abandoned jobs")
+
+            job = queue.claim(worker_id)
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            print(f"Worker {worker_id} running job {job['id']} (attempt {job['attempts']})")
+            try:
+                run_job(analyzer, queue, job)
+            except Exception as e:
+                queue.fail(job['id'], f"Error running job: {str(e)}", run_id=analyzer.last_run_id)
+            print(f"Worker {worker_id} finished job {job['id']}")
+            job = None
+    except KeyboardInterrupt:
+        # Hand the job back; its journaled run resumes on the next worker
+        if job is not None:
+            queue.release(job['id'], f"Released by worker {worker_id} on shutdown")
+            print(f"Worker {worker_id} released job {job['id']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queued sheet analysis jobs")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--queue", default=None, help="Queue database (default: JOB_QUEUE_PATH)")
+    parser.add_argument("--poll-interval", type=float, default=None)
+    parser.add_argument("--stale-seconds", type=int, default=None)
+    parser.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    args = parser.parse_args()
+
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    options = (args.queue, args.poll_interval, args.stale_seconds, args.once)
+    if args.workers <= 1:
+        work(prefix, *options)
+        return
+
+    processes = [multiprocessing.Process(target=work, args=(f"{prefix}-{n}", *options))
+                 for n in range(args.workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Each child gets the interrupt too and releases its own job
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()